@@ -0,0 +1,308 @@
+"""
+orionlab.py
+
+Línea de comandos unificada de OrionLab Research.
+
+Subcomandos:
+    build    Regenera los estudios en paralelo (ver `orionlab_build.py`).
+    bench    Benchmarks de generación, I/O y gráficos (ver `orionlab_bench.py`).
+    analyze  Ejecuta los scripts de análisis `pXX_*/code/*analyze*.py`.
+    reduce   Pipeline de reducción P10 sobre subs FITS/NumPy (`orionlab_reduction.py`).
+    calib    Biblioteca de masters bias/dark/flat (`orionlab_calib.py`).
+    stack    Apilado por tiles y comparación de algoritmos P14 (`orionlab_stack.py`).
+    register Registro de subs por estrellas / correlación de fase (`orionlab_register.py`).
+    dither   Simulador Monte Carlo de dithering y ruido de patrón fijo P15 (`orionlab_dither.py`).
+    debayer  Debayer OSC superpixel / bilineal / VNG (`orionlab_debayer.py`).
+    trails   Detección de trazas satelitales y tabla P16 (`orionlab_trails.py`).
+    photometry Fotometría de apertura de cúmulos abiertos P08 (`orionlab_photometry.py`).
+    psf      Fotometría por ajuste de PSF en campos densos (`orionlab_psf.py`).
+    xmatch   Cruce con catálogo de referencia y residuos de color P13 (`orionlab_xmatch.py`).
+    ephem    Efemérides y visibilidad anual Messier/NGC, tabla P18 (`orionlab_ephem.py`).
+    visibility Cubo de visibilidad anual y consultas de planificación (`orionlab_visibility.py`).
+    wavelets Realce de detalle con wavelets à-trous y tabla P19 (`orionlab_wavelets.py`).
+    gradient Modelado y resta del gradiente de fondo, perfil P11 (`orionlab_gradient.py`).
+    plan     SNR esperado y subs recomendados para una configuración de terreno.
+    rename   Normaliza nombres de carpetas y papers (`fix_orionlab_names.py`).
+
+Este módulo sólo importa la biblioteca estándar: pandas, NumPy y matplotlib
+se cargan dentro del subcomando que los necesita, así las tareas de
+mantenimiento (cron) no pagan su costo de importación.
+
+Uso:
+    python orionlab.py build -j 4 p05 p08
+    python orionlab.py bench --compare bench_baseline.json
+    python orionlab.py analyze p05
+    python orionlab.py reduce lights/*.fits --bias bias/*.fits --darks darks/*.fits --flats flats/*.fits
+    python orionlab.py plan --camera "ZWO ASI533MC Pro" --exposure 180 --bortle 5 \\
+        --filter "Optolong L-Quad Enhance" --sensor-temp -10 --target-snr 100
+    python orionlab.py rename
+    python orionlab.py --import-profile plan --exposure 120
+"""
+
+import argparse
+import runpy
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+
+# ----------------------------------------------------------
+# SUBCOMANDOS
+# ----------------------------------------------------------
+def cmd_build(argv):
+    import orionlab_build
+
+    return orionlab_build.main(argv)
+
+
+def cmd_bench(argv):
+    import orionlab_bench
+
+    return orionlab_bench.main(argv)
+
+
+def analysis_scripts():
+    """Scripts de análisis por estudio: {"p05": Path(...), ...}."""
+    scripts = {}
+    for path in sorted(ROOT.glob("p[0-9][0-9]_*/code/*analyze*.py")):
+        scripts.setdefault(path.parts[-3][:3], []).append(path)
+    return scripts
+
+
+def cmd_analyze(argv):
+    parser = argparse.ArgumentParser(prog="orionlab analyze",
+                                     description="Ejecuta los scripts de análisis de los estudios.")
+    parser.add_argument("studies", nargs="*", help="Estudios (p. ej. p05); por defecto todos.")
+    args = parser.parse_args(argv)
+
+    scripts = analysis_scripts()
+    studies = args.studies or list(scripts)
+    unknown = [s for s in studies if s not in scripts]
+    if unknown:
+        parser.error(f"sin script de análisis para {unknown} (disponibles: {list(scripts)})")
+
+    for study in studies:
+        for path in scripts[study]:
+            print(f"▶ {path.relative_to(ROOT)}")
+            runpy.run_path(str(path), run_name="__main__")
+    return 0
+
+
+def cmd_reduce(argv):
+    import orionlab_reduction
+
+    return orionlab_reduction.main(argv)
+
+
+def cmd_calib(argv):
+    import orionlab_calib
+
+    return orionlab_calib.main(argv)
+
+
+def cmd_stack(argv):
+    import orionlab_stack
+
+    return orionlab_stack.main(argv)
+
+
+def cmd_register(argv):
+    import orionlab_register
+
+    return orionlab_register.main(argv)
+
+
+def cmd_dither(argv):
+    import orionlab_dither
+
+    return orionlab_dither.main(argv)
+
+
+def cmd_debayer(argv):
+    import orionlab_debayer
+
+    return orionlab_debayer.main(argv)
+
+
+def cmd_trails(argv):
+    import orionlab_trails
+
+    return orionlab_trails.main(argv)
+
+
+def cmd_gradient(argv):
+    import orionlab_gradient
+
+    return orionlab_gradient.main(argv)
+
+
+def cmd_wavelets(argv):
+    import orionlab_wavelets
+
+    return orionlab_wavelets.main(argv)
+
+
+def cmd_photometry(argv):
+    import orionlab_photometry
+
+    return orionlab_photometry.main(argv)
+
+
+def cmd_psf(argv):
+    import orionlab_psf
+
+    return orionlab_psf.main(argv)
+
+
+def cmd_xmatch(argv):
+    import orionlab_xmatch
+
+    return orionlab_xmatch.main(argv)
+
+
+def cmd_ephem(argv):
+    import orionlab_ephem
+
+    return orionlab_ephem.main(argv)
+
+
+def cmd_visibility(argv):
+    import orionlab_visibility
+
+    return orionlab_visibility.main(argv)
+
+
+def cmd_plan(argv):
+    from orionlab_snr import CAMERAS, TARGET_SNR, expected_snr, recommended_subs
+
+    parser = argparse.ArgumentParser(prog="orionlab plan",
+                                     description="SNR por sub y subs recomendados (modelo P05).")
+    parser.add_argument("--camera", default=CAMERAS[-1]["name"],
+                        choices=[c["name"] for c in CAMERAS])
+    parser.add_argument("--exposure", type=float, required=True, help="Exposición por sub (s).")
+    parser.add_argument("--bortle", type=float, default=5)
+    parser.add_argument("--filter", default="None", help='Nombre del filtro o "None".')
+    parser.add_argument("--sensor-temp", type=float, default=0, help="Temperatura del sensor (°C).")
+    parser.add_argument("--target-snr", type=float, default=TARGET_SNR)
+    args = parser.parse_args(argv)
+
+    try:
+        snr = expected_snr(args.camera, args.exposure, args.bortle, args.filter, args.sensor_temp)
+    except ValueError as e:
+        parser.error(str(e))
+    subs = recommended_subs(args.camera, args.exposure, args.bortle, args.filter,
+                            args.sensor_temp, target_snr=args.target_snr)
+    total_min = subs * args.exposure / 60
+
+    print(f"📷 {args.camera} · {args.exposure:g} s · Bortle {args.bortle:g} · "
+          f"filtro {args.filter} · sensor {args.sensor_temp:g} °C")
+    print(f"  SNR por sub:        {snr:.1f}")
+    print(f"  Subs para SNR {args.target_snr:g}: {subs}")
+    print(f"  Integración total:  {total_min:.0f} min")
+    return 0
+
+
+def cmd_rename(argv):
+    import fix_orionlab_names
+
+    argparse.ArgumentParser(prog="orionlab rename",
+                            description="Renombra carpetas pXX y papers a la convención estándar.").parse_args(argv)
+    fix_orionlab_names.main()
+    return 0
+
+
+HANDLERS = {
+    "build": cmd_build,
+    "bench": cmd_bench,
+    "analyze": cmd_analyze,
+    "reduce": cmd_reduce,
+    "calib": cmd_calib,
+    "stack": cmd_stack,
+    "register": cmd_register,
+    "dither": cmd_dither,
+    "debayer": cmd_debayer,
+    "trails": cmd_trails,
+    "gradient": cmd_gradient,
+    "wavelets": cmd_wavelets,
+    "photometry": cmd_photometry,
+    "psf": cmd_psf,
+    "xmatch": cmd_xmatch,
+    "ephem": cmd_ephem,
+    "visibility": cmd_visibility,
+    "plan": cmd_plan,
+    "rename": cmd_rename,
+}
+
+
+# ----------------------------------------------------------
+# PERFIL DE IMPORTACIÓN
+# ----------------------------------------------------------
+def parse_importtime(stderr):
+    """
+    Convierte la salida de `python -X importtime` en filas
+    (módulo, self_us, cumulative_us, nivel de anidación).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_profile(argv, top=15):
+    """
+    Re-ejecuta el subcomando con `-X importtime` y resume el costo de
+    importación por módulo de primer nivel.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", str(Path(__file__).resolve()), *argv],
+        stderr=subprocess.PIPE, text=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    # Los mensajes de error del subcomando (no de importtime) se reenvían tal cual
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            print(line, file=sys.stderr)
+
+    top_level = sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])
+    total_ms = sum(r[2] for r in top_level) / 1000
+    print("\nPerfil de importación (módulos de primer nivel)")
+    print("-" * 56)
+    print(f"  {'módulo':<32} {'acumulado':>10} {'propio':>10}")
+    for name, self_us, cumulative_us, _ in top_level[:top]:
+        print(f"  {name:<32} {cumulative_us / 1000:8.1f} ms {self_us / 1000:8.1f} ms")
+    print("-" * 56)
+    print(f"  Total importaciones: {total_ms:.1f} ms ({len(rows)} módulos)")
+    return proc.returncode
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="orionlab",
+        description=f"CLI de OrionLab Research ({', '.join(HANDLERS)}).",
+    )
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Reporta el tiempo de importación por módulo del subcomando.")
+    parser.add_argument("command", choices=list(HANDLERS))
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="Argumentos del subcomando (ver `orionlab <comando> -h`).")
+    args = parser.parse_args(argv)
+
+    if args.import_profile:
+        return import_profile([args.command, *args.args])
+
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return HANDLERS[args.command](args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+orionlab_bench.py
+
+Benchmarks de las rutas calientes de generación de datos, I/O y gráficos.
+
+Cada benchmark se mide en varios factores de escala (tamaño de grilla P05,
+filas EEG, número de proyectos batch, puntos por figura) y
+registra:
+
+- tiempo (mediana de `--repeat` corridas, con `time.perf_counter`),
+- memoria pico (corrida aparte con `tracemalloc`, que ve también los
+  buffers de NumPy).
+
+Con los resultados se imprime la curva de escalamiento por función
+(exponente log-log: 1.0 ≈ lineal) y se pueden guardar en un JSON base para
+comparar después y detectar regresiones.
+
+Uso:
+    python orionlab_bench.py --list
+    python orionlab_bench.py --save bench_baseline.json
+    python orionlab_bench.py --compare bench_baseline.json --threshold 1.25
+    python orionlab_bench.py p05.snr_grid eeg.make_dataset --scales 1 4
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+DEFAULT_SCALES = (1, 4, 16)
+
+# Registro: nombre → (función de preparación, unidad de la escala)
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    """
+    Registra un benchmark. La función decorada recibe `(scale, workdir)` y
+    devuelve `(run, n_units)`: `run()` es lo que se mide y `n_units` el
+    tamaño efectivo (filas, sujetos, proyectos, puntos) para la curva.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+    return decorator
+
+
+# ----------------------------------------------------------
+# BENCHMARKS
+# ----------------------------------------------------------
+def _p05_exposures(scale):
+    """Eje de exposición de P05 ampliado `scale` veces (grilla base: 6 valores)."""
+    from orionlab_snr import EXPOSURES
+
+    step = EXPOSURES[1] - EXPOSURES[0]
+    return [EXPOSURES[0] + step * i for i in range(len(EXPOSURES) * scale)]
+
+
+@benchmark("p05.snr_grid", "filas")
+def bench_snr_grid(scale, workdir):
+    from orionlab_snr import grid_shape, snr_grid
+
+    exposures = _p05_exposures(scale)
+    n_rows = math.prod(grid_shape(exposures=exposures))
+    return (lambda: snr_grid(exposures=exposures, scenario_date="2025-01-01")), n_rows
+
+
+@benchmark("p05.generate_snr_dataset", "filas")
+def bench_generate_snr_dataset(scale, workdir):
+    # El generador real del estudio, escribiendo en el directorio temporal
+    from orionlab_snr import grid_shape
+    from setup_p05_long_exposure_snr import generate_snr_dataset
+
+    exposures = _p05_exposures(scale)
+    csv_path = Path(workdir) / "p05_snr_simulation_data.csv"
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):   # sin el "✅ Dataset generado" de cada corrida
+            generate_snr_dataset(csv_path=csv_path, exposures=exposures)
+
+    return run, math.prod(grid_shape(exposures=exposures))
+
+
+@benchmark("p05.write_snr_table", "filas")
+def bench_write_snr_table(scale, workdir):
+    from orionlab_snr import grid_shape, write_snr_table
+
+    exposures = _p05_exposures(scale)
+    csv_path = Path(workdir) / "p05_snr_stream.csv"
+    return (lambda: write_snr_table(csv_path, chunk_rows=50_000, exposures=exposures,
+                                    scenario_date="2025-01-01")), \
+        math.prod(grid_shape(exposures=exposures))
+
+
+@benchmark("eeg.make_dataset", "filas")
+def bench_make_eeg_dataset(scale, workdir):
+    from setup_orionlab_neuro import make_eeg_dataset
+
+    # 100 000 registros en la escala 1 (15 por sujeto, como P02): con los 300
+    # del estudio sólo se mediría el overhead de la llamada (~2 ms)
+    n_rows = 100_000 * scale
+    return (lambda: make_eeg_dataset("stress_level", ["low", "medium", "high"],
+                                     n=n_rows, n_subjects=n_rows // 15)), n_rows
+
+
+@benchmark("batch.write_csv", "proyectos")
+def bench_write_csv(scale, workdir):
+    from setup_orionlab_batch_papers import PROJECTS, ensure_dirs, write_csv
+
+    # Escala 1 = los proyectos batch una vez; más escalas los repiten en otras carpetas
+    projects = [(f"{pid}", Path(workdir) / f"rep{rep}" / pid)
+                for rep in range(scale) for pid, _ in PROJECTS]
+    for _, project_root in projects:
+        ensure_dirs(project_root)
+
+    def run():
+        for project_id, project_root in projects:
+            write_csv(project_id, project_root)
+
+    return run, len(projects)
+
+
+def _draw_scatter(fig, ax, x, y, c):
+    sc = ax.scatter(x, y, c=c, s=4, cmap="viridis")
+    fig.colorbar(sc, ax=ax, label="Índice Bortle")
+    ax.set_xlabel("Exposición (s)")
+    ax.set_ylabel("SNR por sub")
+    ax.grid(True)
+
+
+@benchmark("plot.scatter", "puntos")
+def bench_plot_scatter(scale, workdir):
+    # Scatter tipo P05/P06 sobre la grilla completa
+    from orionlab_plot import plot_figure
+    from orionlab_snr import snr_grid
+
+    df = snr_grid(exposures=_p05_exposures(scale), scenario_date="2025-01-01")
+    args = (df["exposure_s"].to_numpy(), df["snr_single_sub"].to_numpy(),
+            df["bortle_class"].to_numpy())
+    out = Path(workdir) / "scatter.png"
+    return (lambda: plot_figure(_draw_scatter, out, *args, figsize=(8, 5))), len(df)
+
+
+@benchmark("plot.scatter_decimated", "puntos")
+def bench_plot_scatter_decimated(scale, workdir):
+    from orionlab_plot import decimate_indices, plot_figure
+    from orionlab_snr import snr_grid
+
+    df = snr_grid(exposures=_p05_exposures(scale), scenario_date="2025-01-01")
+    x = df["exposure_s"].to_numpy()
+    y = df["snr_single_sub"].to_numpy()
+    c = df["bortle_class"].to_numpy()
+    out = Path(workdir) / "scatter_decimated.png"
+
+    def run():
+        idx = decimate_indices(x, y)
+        plot_figure(_draw_scatter, out, x[idx], y[idx], c[idx], figsize=(8, 5))
+
+    return run, len(df)
+
+
+# ----------------------------------------------------------
+# MEDICIÓN
+# ----------------------------------------------------------
+def measure(run, repeat=3):
+    """Mediana de tiempo (s) de `repeat` corridas y memoria pico (MiB) de una corrida aparte."""
+    run()  # calentamiento: imports perezosos, caches de matplotlib, etc.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak / 2**20
+
+
+def scaling_exponent(points):
+    """Pendiente log-log de tiempo vs tamaño (mínimos cuadrados)."""
+    pts = [(math.log(n), math.log(t)) for n, t in points if n > 0 and t > 0]
+    if len(pts) < 2:
+        return None
+    mx = sum(p[0] for p in pts) / len(pts)
+    my = sum(p[1] for p in pts) / len(pts)
+    sxx = sum((p[0] - mx) ** 2 for p in pts)
+    if sxx == 0:
+        return None
+    return sum((p[0] - mx) * (p[1] - my) for p in pts) / sxx
+
+
+def run_benchmarks(names=None, scales=DEFAULT_SCALES, repeat=3):
+    """
+    Ejecuta los benchmarks indicados (todos si `names` es None).
+
+    Devuelve un dict serializable:
+    `{"meta": {...}, "results": {nombre: {escala: {"n", "seconds", "peak_mib"}}}}`.
+    """
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    names = list(names or BENCHMARKS)
+    unknown = sorted(set(names) - set(BENCHMARKS))
+    if unknown:
+        raise ValueError(f"Benchmarks desconocidos: {unknown} (opciones: {list(BENCHMARKS)})")
+
+    results = {}
+    for name in names:
+        setup, unit = BENCHMARKS[name]
+        results[name] = {}
+        for scale in scales:
+            with tempfile.TemporaryDirectory(prefix="orionlab_bench_") as workdir:
+                run, n_units = setup(scale, workdir)
+                seconds, peak_mib = measure(run, repeat=repeat)
+            results[name][str(scale)] = {"n": n_units, "seconds": seconds, "peak_mib": peak_mib}
+            print(f"  {name:<28} x{scale:<4} {n_units:>9} {unit:<9} "
+                  f"{seconds * 1000:10.1f} ms {peak_mib:9.1f} MiB")
+
+    meta = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "scales": list(scales),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+
+# ----------------------------------------------------------
+# REPORTES
+# ----------------------------------------------------------
+def print_scaling(report):
+    """Curva de escalamiento por función: costo por unidad y exponente log-log."""
+    print("\nEscalamiento por función")
+    print("-" * 64)
+    for name, by_scale in report["results"].items():
+        points = [(r["n"], r["seconds"]) for r in by_scale.values()]
+        exponent = scaling_exponent(points)
+        per_unit = ", ".join(f"{r['seconds'] / r['n'] * 1e6:.2f}" for r in by_scale.values())
+        exp_txt = f"{exponent:.2f}" if exponent is not None else "—"
+        print(f"  {name:<28} exponente {exp_txt:>5}   µs/{BENCHMARKS[name][1]}: {per_unit}")
+
+
+def compare(report, baseline, threshold=1.25):
+    """
+    Compara tiempos y memoria pico contra un reporte base.
+
+    Marca como regresión toda medición más lenta (o con más memoria) que
+    `threshold` veces la base. Devuelve la lista de regresiones.
+    """
+    regressions = []
+    print(f"\nComparación contra base ({baseline['meta'].get('date', '?')})")
+    print("-" * 64)
+    for name, by_scale in report["results"].items():
+        base_scales = baseline["results"].get(name, {})
+        for scale, r in by_scale.items():
+            base = base_scales.get(scale)
+            if base is None:
+                print(f"  {name:<28} x{scale:<4} sin base")
+                continue
+            t_ratio = r["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+            m_ratio = r["peak_mib"] / base["peak_mib"] if base["peak_mib"] else 1.0
+            flag = ""
+            if t_ratio > threshold or m_ratio > threshold:
+                flag = "  ⚠ regresión"
+                regressions.append((name, scale, t_ratio, m_ratio))
+            print(f"  {name:<28} x{scale:<4} tiempo {t_ratio:5.2f}x  memoria {m_ratio:5.2f}x{flag}")
+    if not regressions:
+        print("✅ Sin regresiones sobre el umbral")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de generación, I/O y gráficos OrionLab.")
+    parser.add_argument("names", nargs="*", help="Benchmarks a correr; por defecto todos.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="Factores de escala (por defecto 1 4 16).")
+    parser.add_argument("--repeat", type=int, default=3, help="Corridas medidas por punto.")
+    parser.add_argument("--save", type=Path, help="Guarda el reporte como JSON base.")
+    parser.add_argument("--compare", type=Path, help="JSON base contra el cual comparar.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Razón sobre la base que cuenta como regresión.")
+    parser.add_argument("--list", action="store_true", help="Sólo lista los benchmarks.")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (_, unit) in BENCHMARKS.items():
+            print(f"{name:<28} ({unit})")
+        return 0
+
+    report = run_benchmarks(args.names or None, scales=args.scales, repeat=args.repeat)
+    print_scaling(report)
+
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"✅ Base guardada en {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if compare(report, baseline, threshold=args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+orionlab_build.py
+
+Punto de entrada único para regenerar todos los estudios del repositorio en
+paralelo (un proceso por estudio pXX).
+
+Descubre los builders sin importar los scripts (se leen con `ast`, así que
+los scripts con código a nivel de módulo no se ejecutan al descubrirlos):
+
+- `setup_orionlab_research.py` / `extend_orionlab_content.py`: funciones `write_pXX_*`
+- `setup_orionlab_neuro.py`: funciones `build_pXX`
+- `setup_orionlab_batch_papers.py`: cada proyecto de `PROJECTS` (`build_project`)
+- `setup_pXX_*.py`: el script completo, ejecutado como `__main__`
+
+Los pasos de un mismo estudio se ejecutan en orden dentro de un solo proceso
+(escriben la misma carpeta); estudios distintos corren en paralelo. Los pasos
+que usan `orionlab_cache` se saltan si sus entradas no cambiaron (`--force`
+regenera todo).
+
+Uso:
+    python orionlab_build.py                 # todos los estudios, un worker por núcleo
+    python orionlab_build.py --jobs 4 p05 p08
+    python orionlab_build.py --list
+    python orionlab_build.py --force
+"""
+
+import argparse
+import ast
+import importlib
+import io
+import logging
+import os
+import re
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+log = logging.getLogger("orionlab.build")
+
+# Scripts con funciones por estudio, en el orden en que se ejecutaban a mano
+FUNCTION_BUILDERS = [
+    ("setup_orionlab_research", re.compile(r"^write_(p\d\d)_")),
+    ("extend_orionlab_content", re.compile(r"^write_(p\d\d)_")),
+    ("setup_orionlab_neuro", re.compile(r"^build_(p\d\d)$")),
+]
+BATCH_MODULE = "setup_orionlab_batch_papers"
+SCRIPT_PATTERN = re.compile(r"^setup_(p\d\d)_\w+\.py$")
+
+
+def _parse(module):
+    return ast.parse((ROOT / f"{module}.py").read_text(encoding="utf-8"))
+
+
+def _top_level_functions(tree):
+    return [node.name for node in tree.body if isinstance(node, ast.FunctionDef)]
+
+
+def _literal_assignment(tree, name):
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise LookupError(f"{name} no está definido como literal")
+
+
+def discover_tasks():
+    """
+    Devuelve {estudio: [paso, ...]} con cada paso como tupla
+    `(módulo, función | None, args)`; `None` ejecuta el módulo como script.
+    """
+    tasks = {}
+
+    for module, pattern in FUNCTION_BUILDERS:
+        if not (ROOT / f"{module}.py").exists():
+            continue
+        for func in _top_level_functions(_parse(module)):
+            match = pattern.match(func)
+            if match:
+                tasks.setdefault(match.group(1), []).append((module, func, ()))
+
+    if (ROOT / f"{BATCH_MODULE}.py").exists():
+        for project_id, title in _literal_assignment(_parse(BATCH_MODULE), "PROJECTS"):
+            tasks.setdefault(project_id[:3], []).append(
+                (BATCH_MODULE, "build_project", (project_id, title)))
+
+    for path in sorted(ROOT.glob("setup_p*.py")):
+        match = SCRIPT_PATTERN.match(path.name)
+        if match:
+            tasks.setdefault(match.group(1), []).append((path.stem, None, ()))
+
+    return dict(sorted(tasks.items()))
+
+
+def _run_step(module, func, args):
+    if func is None:
+        runpy.run_path(str(ROOT / f"{module}.py"), run_name="__main__")
+    else:
+        getattr(importlib.import_module(module), func)(*args)
+
+
+def run_task(study, steps):
+    """
+    Ejecuta los pasos de un estudio (en el proceso worker).
+
+    Devuelve (estudio, segundos, salida capturada, traceback o None).
+    """
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    buf = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    with redirect_stdout(buf), redirect_stderr(buf):
+        try:
+            for module, func, args in steps:
+                _run_step(module, func, args)
+        except Exception:
+            error = traceback.format_exc()
+    return study, time.perf_counter() - start, buf.getvalue(), error
+
+
+def _log_result(study, seconds, output, error):
+    task_log = log.getChild(study)
+    for line in output.splitlines():
+        if line.strip():
+            task_log.info(line)
+    if error:
+        for line in error.rstrip().splitlines():
+            task_log.error(line)
+        task_log.error("❌ falló tras %.2f s", seconds)
+    else:
+        task_log.info("✅ listo en %.2f s", seconds)
+
+
+def print_summary(results, wall_seconds):
+    """Tabla de tiempo por estudio y speedup del build paralelo."""
+    print("\nResumen del build")
+    print("-" * 40)
+    for study, seconds, _, error in sorted(results, key=lambda r: -r[1]):
+        status = "ERROR" if error else "ok"
+        print(f"  {study:<6} {seconds:8.2f} s  {status}")
+    busy = sum(r[1] for r in results)
+    print("-" * 40)
+    print(f"  Tiempo total (reloj): {wall_seconds:.2f} s")
+    print(f"  Suma por estudio:     {busy:.2f} s")
+    if wall_seconds > 0:
+        print(f"  Speedup paralelo:     {busy / wall_seconds:.2f}x")
+
+
+def build(studies=None, jobs=None):
+    """
+    Regenera los estudios indicados (todos si `studies` es None) en un pool
+    de procesos. Devuelve la lista de resultados de `run_task`.
+    """
+    tasks = discover_tasks()
+    if studies:
+        unknown = sorted(set(studies) - set(tasks))
+        if unknown:
+            raise ValueError(f"Estudios desconocidos: {unknown} (opciones: {list(tasks)})")
+        tasks = {s: tasks[s] for s in tasks if s in studies}
+
+    jobs = jobs or os.cpu_count() or 1
+    log.info("🚀 %d estudios, %d workers", len(tasks), jobs)
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_task, study, steps) for study, steps in tasks.items()]
+        for future in as_completed(futures):
+            result = future.result()
+            _log_result(*result)
+            results.append(result)
+    print_summary(results, time.perf_counter() - start)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build paralelo de los estudios OrionLab.")
+    parser.add_argument("studies", nargs="*", help="Estudios a regenerar (p. ej. p05 p08); por defecto todos.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Número de procesos (por defecto, núcleos).")
+    parser.add_argument("--list", action="store_true", help="Sólo lista los estudios y sus pasos.")
+    parser.add_argument("--force", action="store_true",
+                        help="Ignora el caché de build (orionlab_cache) y regenera todo.")
+    args = parser.parse_args(argv)
+
+    if args.force:
+        # Los workers heredan el entorno del proceso padre
+        os.environ["ORIONLAB_FORCE"] = "1"
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(message)s",
+                        datefmt="%H:%M:%S")
+
+    if args.list:
+        for study, steps in discover_tasks().items():
+            print(study)
+            for module, func, step_args in steps:
+                target = f"{module}.{func}{step_args}" if func else f"{module}.py (script)"
+                print(f"  - {target}")
+        return 0
+
+    results = build(args.studies, args.jobs)
+    return 1 if any(r[3] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
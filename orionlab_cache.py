@@ -0,0 +1,196 @@
+"""
+orionlab_cache.py
+
+Caché de build incremental (estilo make) para los generadores de estudios.
+
+Cada paso cacheado se identifica por una huella SHA-256 de sus entradas:
+
+- código fuente de la función y de las funciones del mismo módulo que llama,
+- constantes globales que la función usa (salvo las declaradas volátiles),
+- parámetros y semilla,
+- contenido de los archivos de datos de entrada,
+- código de los módulos `orionlab_*` locales que importa el script.
+
+En cada carpeta pXX se guarda un manifiesto `.orionlab_manifest.json` con la
+huella de cada paso y el hash de los archivos que produjo. Si la huella no
+cambió y las salidas siguen intactas, el paso se salta y los archivos (CSV,
+PNG, markdown) no se reescriben, así que Git no ve diffs espurios.
+
+Uso:
+    from orionlab_cache import cached_call
+    cached_call(project_root, "write_csv", write_csv, project_id, project_root)
+
+La función cacheada debe devolver la ruta (o lista de rutas) que escribió, o
+bien declararlas con `outputs=`. Con la variable de entorno `ORIONLAB_FORCE=1`
+se ignora el caché.
+"""
+
+import ast
+import hashlib
+import inspect
+import json
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+MANIFEST_NAME = ".orionlab_manifest.json"
+
+_SIMPLE_TYPES = (str, int, float, bool, type(None), tuple, list, dict, Path)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 del contenido de un archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _local_deps(source_file, seen=None):
+    """Módulos del repo importados (transitivamente) por `source_file`."""
+    seen = set() if seen is None else seen
+    try:
+        tree = ast.parse(Path(source_file).read_text(encoding="utf-8"))
+    except (OSError, SyntaxError):
+        return seen
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            dep = ROOT / f"{name.split('.')[0]}.py"
+            if dep.exists() and dep not in seen:
+                seen.add(dep)
+                _local_deps(dep, seen)
+    return seen
+
+
+def _hash_function(h, func, volatile, seen):
+    """
+    Agrega a `h` el código de `func`, las constantes globales simples que usa
+    y, recursivamente, las funciones del mismo módulo a las que llama (p. ej.
+    las funciones de dibujo que usa un `render_plots`).
+    """
+    if func in seen:
+        return
+    seen.add(func)
+    h.update(inspect.getsource(func).encode("utf-8"))
+
+    module_globals = getattr(func, "__globals__", {})
+    for name in sorted(set(func.__code__.co_names) - volatile):
+        if name not in module_globals:
+            continue
+        value = module_globals[name]
+        if isinstance(value, _SIMPLE_TYPES):
+            h.update(f"{name}={value!r}".encode("utf-8"))
+        elif inspect.isfunction(value) and value.__module__ == func.__module__:
+            _hash_function(h, value, volatile, seen)
+
+
+def fingerprint(func, params=None, seed=None, inputs=(), volatile=()):
+    """
+    Huella de las entradas de `func`. Ver docstring del módulo.
+
+    `volatile`: nombres de globales que no deben invalidar el caché
+    (p. ej. `TODAY`, que cambia a diario sin cambiar el contenido real).
+    """
+    h = hashlib.sha256()
+    _hash_function(h, func, set(volatile), set())
+
+    h.update(repr(params).encode("utf-8"))
+    h.update(repr(seed).encode("utf-8"))
+
+    for path in sorted(str(p) for p in inputs):
+        h.update(path.encode("utf-8"))
+        h.update((file_digest(path) if Path(path).exists() else "missing").encode("utf-8"))
+
+    source_file = inspect.getsourcefile(func)
+    if source_file:
+        for dep in sorted(_local_deps(source_file)):
+            h.update(dep.name.encode("utf-8"))
+            h.update(file_digest(dep).encode("utf-8"))
+    return h.hexdigest()
+
+
+class BuildCache:
+    """Manifiesto de build de una carpeta de estudio."""
+
+    def __init__(self, project_dir):
+        self.project_dir = Path(project_dir)
+        self.path = self.project_dir / MANIFEST_NAME
+        try:
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_fresh(self, target, key):
+        """True si `target` se construyó con la misma huella y sus salidas no cambiaron."""
+        entry = self.entries.get(target)
+        if not entry or entry.get("key") != key:
+            return False
+        for rel, digest in entry.get("outputs", {}).items():
+            out = self.project_dir / rel
+            if not out.exists() or file_digest(out) != digest:
+                return False
+        return True
+
+    def record(self, target, key, outputs):
+        outs = {}
+        for out in outputs:
+            out = Path(out)
+            if out.exists():
+                try:
+                    rel = out.resolve().relative_to(self.project_dir.resolve())
+                except ValueError:
+                    rel = Path(os.path.relpath(out.resolve(), self.project_dir.resolve()))
+                outs[rel.as_posix()] = file_digest(out)
+        self.entries[target] = {"key": key, "outputs": outs}
+        self.project_dir.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def _as_paths(result):
+    if result is None:
+        return []
+    if isinstance(result, (str, Path)):
+        return [Path(result)]
+    return [Path(p) for p in result if p is not None]
+
+
+def force_rebuild():
+    return os.environ.get("ORIONLAB_FORCE", "") not in ("", "0")
+
+
+def cached_call(project_dir, target, func, *args, params=None, seed=None, inputs=(),
+                outputs=(), volatile=(), **kwargs):
+    """
+    Ejecuta `func(*args, **kwargs)` sólo si sus entradas cambiaron.
+
+    `params` se usa para la huella; por defecto son `args`/`kwargs`, lo que
+    sirve cuando son valores simples (no DataFrames). Devuelve True si el paso
+    se ejecutó y False si se saltó por estar al día.
+    """
+    if params is None:
+        params = (args, sorted(kwargs.items()))
+    key = fingerprint(func, params=params, seed=seed, inputs=inputs, volatile=volatile)
+    cache = BuildCache(project_dir)
+
+    if not force_rebuild() and cache.is_fresh(target, key):
+        print(f"  ↷ {Path(project_dir).name}:{target} al día, se omite")
+        return False
+
+    result = func(*args, **kwargs)
+    cache.record(target, key, list(outputs) + _as_paths(result))
+    return True
+
+
+if __name__ == "__main__":
+    # Inspección rápida: python orionlab_cache.py p05_long_exposure_snr
+    for folder in sys.argv[1:]:
+        for target, entry in sorted(BuildCache(ROOT / folder).entries.items()):
+            print(f"{folder}:{target}  {entry['key'][:12]}  {len(entry['outputs'])} salidas")
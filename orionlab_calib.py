@@ -0,0 +1,414 @@
+"""
+orionlab_calib.py
+
+Biblioteca de masters de calibración (bias, dark, flat) reutilizable entre
+noches.
+
+Los masters se construyen una vez (mediana o media con rechazo sigma, por
+bandas de filas: `orionlab_reduction.master_frame`) y se guardan en disco
+con un índice `index.json`, identificados por:
+
+    tipo, cámara, ganancia, exposición, temperatura del sensor (y filtro en flats)
+
+Al reducir una sesión se elige el master más cercano en vez de reconstruirlo:
+
+- bias: misma cámara/ganancia, temperatura más cercana;
+- dark: misma cámara/ganancia; el más cercano en temperatura y exposición.
+  Si no coincide exactamente, se escala por exposición y por el modelo de
+  dark current de P20 (duplicación exponencial con la temperatura);
+- flat: misma cámara/ganancia/filtro, el más reciente.
+
+Los darks se guardan sin bias (sólo señal térmica), así el escalado es válido.
+
+La biblioteca vive en `$ORIONLAB_CALIB_DIR` o, por defecto, en
+`~/.orionlab/calibration`.
+
+Uso:
+    python orionlab_calib.py build dark darks/*.fits --camera "ZWO ASI533MC Pro" \\
+        --gain 100 --exposure 180 --sensor-temp -10 --method sigma_clip
+    python orionlab_calib.py list
+    python orionlab_calib.py select dark --camera "ZWO ASI533MC Pro" --gain 100 \\
+        --exposure 300 --sensor-temp -5
+    python orionlab_calib.py model
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import open_frame
+from orionlab_io import study_dir
+from orionlab_reduction import COMBINE_METHODS, master_frame
+
+KINDS = ("bias", "dark", "flat")
+INDEX_NAME = "index.json"
+
+# Métodos de combinación cuyo resultado depende de `sigma`
+SIGMA_METHODS = ("sigma_clip", "winsorized")
+
+# Diferencia de temperatura (°C) que se considera "la misma" al elegir masters
+TEMP_TOLERANCE_C = 1.0
+
+# Modelo de dark current: estudio P20 (nombre actual y nombre del generador batch)
+P20_DIRS = ["p20_asi533_ruido_termico", "p20_asi533_thermal_noise_model"]
+P20_TABLE = "asi533_thermal_noise_model.csv"
+
+# Duplicación típica de la dark current en sensores CMOS (°C), usada si la
+# tabla P20 no permite ajustar una pendiente positiva
+DEFAULT_DOUBLING_C = 6.0
+
+
+def default_library_dir():
+    return Path(os.environ.get("ORIONLAB_CALIB_DIR", Path.home() / ".orionlab" / "calibration"))
+
+
+# ----------------------------------------------------------
+# MODELO DE DARK CURRENT (P20)
+# ----------------------------------------------------------
+class DarkCurrentModel:
+    """
+    Dark current exponencial en la temperatura del sensor:
+
+        D(T) = D_ref · 2 ** ((T - T_ref) / doubling_c)      [e-/s]
+    """
+
+    def __init__(self, dark_ref=0.05, temp_ref=0.0, doubling_c=DEFAULT_DOUBLING_C):
+        self.dark_ref = dark_ref
+        self.temp_ref = temp_ref
+        self.doubling_c = doubling_c
+
+    @classmethod
+    def from_p20(cls, csv_path=None):
+        """
+        Ajusta el modelo a la tabla P20 (regresión de log2 D vs T sobre la
+        mediana por temperatura). Si la pendiente no es positiva se conserva
+        la duplicación por defecto y sólo se ajusta el nivel.
+        """
+        import csv
+
+        csv_path = Path(csv_path) if csv_path else study_dir(*P20_DIRS) / "data" / P20_TABLE
+        by_temp = {}
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                by_temp.setdefault(float(row["sensor_temp_c"]), []).append(
+                    float(row["dark_current_e_s"]))
+
+        temps = np.array(sorted(by_temp))
+        dark = np.array([np.median(by_temp[t]) for t in temps])
+        temp_ref = float(temps.mean())
+        if len(temps) >= 2:
+            slope, intercept = np.polyfit(temps - temp_ref, np.log2(dark), 1)
+            if slope > 0:
+                return cls(float(2 ** intercept), temp_ref, float(1 / slope))
+        print(f"⚠ {csv_path.name}: la dark current no crece con la temperatura; "
+              f"se usa duplicación cada {DEFAULT_DOUBLING_C:g} °C")
+        return cls(float(np.exp(np.mean(np.log(dark)))), temp_ref, DEFAULT_DOUBLING_C)
+
+    def dark_current(self, sensor_temp_c):
+        return self.dark_ref * 2 ** ((sensor_temp_c - self.temp_ref) / self.doubling_c)
+
+    def ratio(self, temp_from, temp_to):
+        """Factor para llevar una señal térmica de `temp_from` a `temp_to`."""
+        return 2 ** ((temp_to - temp_from) / self.doubling_c)
+
+    def __repr__(self):
+        return (f"DarkCurrentModel(dark_ref={self.dark_ref:.4f} e-/s @ {self.temp_ref:g} °C, "
+                f"doubling_c={self.doubling_c:.2f})")
+
+
+# ----------------------------------------------------------
+# BIBLIOTECA
+# ----------------------------------------------------------
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "-", str(text)).strip("-").lower()
+
+
+def _sources_signature(paths):
+    """Firma barata de los frames fuente (ruta, tamaño, mtime)."""
+    h = hashlib.sha256()
+    for path in sorted(Path(p).resolve() for p in paths):
+        stat = path.stat()
+        h.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class CalibrationLibrary:
+    """
+    Masters de calibración en disco con índice JSON.
+
+    La ganancia se guarda como texto (ganancia ZWO o ISO de la DSLR).
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else default_library_dir()
+        self.index_path = self.root / INDEX_NAME
+        try:
+            self.masters = json.loads(self.index_path.read_text(encoding="utf-8"))["masters"]
+        except (OSError, ValueError, KeyError):
+            self.masters = []
+
+    def _save_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        payload = {"version": 1, "masters": self.masters}
+        self.index_path.write_text(json.dumps(payload, indent=2, sort_keys=True), encoding="utf-8")
+
+    @staticmethod
+    def _key(entry):
+        return (entry["kind"], entry["camera"], entry["gain"], entry["exposure_s"],
+                entry["sensor_temp_c"], entry.get("filter"))
+
+    def entries(self, kind=None, camera=None, gain=None, filter=None):
+        """Masters del índice que coinciden con los campos dados (None = cualquiera)."""
+        out = []
+        for entry in self.masters:
+            if kind is not None and entry["kind"] != kind:
+                continue
+            if camera is not None and entry["camera"] != camera:
+                continue
+            if gain is not None and entry["gain"] != str(gain):
+                continue
+            if filter is not None and entry.get("filter") != filter:
+                continue
+            out.append(entry)
+        return out
+
+    def load(self, entry):
+        """Master como memmap de sólo lectura."""
+        return open_frame(self.root / entry["file"])
+
+    # ------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------
+    def build(self, kind, paths, camera, gain, exposure_s=0.0, sensor_temp_c=None,
+              filter=None, method="median", sigma=3.0, bias="auto", max_memory_mb=256):
+        """
+        Construye (o reutiliza) un master y lo registra en el índice.
+
+        `bias="auto"` resta a darks y flats el bias más cercano de la
+        biblioteca; también acepta un arreglo, o None para no restar.
+        Si ya existe un master con la misma clave, construido con los mismos
+        frames y método, no se recalcula.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Tipo de master desconocido: {kind!r} (opciones: {KINDS})")
+        if kind != "bias" and not exposure_s > 0:
+            raise ValueError(f"Un master {kind} necesita una exposición > 0 s (recibido {exposure_s!r})")
+        paths = [Path(p) for p in paths]
+        entry = {
+            "kind": kind,
+            "camera": camera,
+            "gain": str(gain),
+            "exposure_s": float(exposure_s) if kind != "bias" else 0.0,
+            "sensor_temp_c": None if sensor_temp_c is None else float(sensor_temp_c),
+            "filter": filter if kind == "flat" else None,
+            "method": method,
+            "sigma": sigma if method in SIGMA_METHODS else None,
+            "n_frames": len(paths),
+            "sources": _sources_signature(paths),
+        }
+
+        for existing in self.masters:
+            if (self._key(existing) == self._key(entry)
+                    and existing["sources"] == entry["sources"]
+                    and existing["method"] == method
+                    and existing.get("sigma") == entry["sigma"]
+                    and (self.root / existing["file"]).exists()):
+                print(f"  ↷ master {kind} {Path(existing['file']).name} al día, se omite")
+                return existing
+
+        subtract = None
+        if kind != "bias":
+            if isinstance(bias, str) and bias == "auto":
+                bias_entry = self.select("bias", camera, gain, sensor_temp_c=sensor_temp_c)
+                if bias_entry is not None:
+                    subtract = np.array(self.load(bias_entry), dtype=np.float32)
+                    entry["bias"] = bias_entry["file"]
+                else:
+                    print(f"⚠ No hay bias para {camera} (ganancia {gain}); master {kind} sin restar bias")
+            elif bias is not None:
+                subtract = np.asarray(bias, dtype=np.float32)
+
+        master = master_frame(paths, method=method, subtract=subtract,
+                              normalize=(kind == "flat"), sigma=sigma,
+                              max_memory_mb=max_memory_mb)
+
+        parts = [kind, _slug(camera), f"g{_slug(gain)}"]
+        if kind != "bias":
+            parts.append(f"{entry['exposure_s']:g}s")
+        if entry["sensor_temp_c"] is not None:
+            parts.append(f"{entry['sensor_temp_c']:g}C")
+        if entry["filter"]:
+            parts.append(_slug(filter))
+        entry["file"] = "_".join(parts) + ".npy"
+        entry["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        np.save(self.root / entry["file"], master.astype(np.float32))
+        self.masters = [m for m in self.masters if self._key(m) != self._key(entry)]
+        self.masters.append(entry)
+        self._save_index()
+        print(f"✅ Master {kind}: {self.root / entry['file']} ({len(paths)} frames, {method})")
+        return entry
+
+    # ------------------------------------------------------
+    # Selección
+    # ------------------------------------------------------
+    def select(self, kind, camera, gain, exposure_s=None, sensor_temp_c=None, filter=None):
+        """
+        Master más cercano para la configuración pedida, o None.
+
+        Darks: minimiza |ΔT| / TEMP_TOLERANCE_C + |log2(exposición / exposición_master)|
+        (se ignoran darks con exposición 0, que no se pueden escalar).
+        Bias: temperatura más cercana. Flats: mismo filtro, el más reciente.
+        """
+        candidates = self.entries(kind, camera, gain, filter if kind == "flat" else None)
+        if kind == "dark":
+            candidates = [e for e in candidates if e["exposure_s"] > 0]
+        if not candidates:
+            return None
+
+        def temp_cost(entry):
+            if sensor_temp_c is None or entry["sensor_temp_c"] is None:
+                return 0.0
+            return abs(entry["sensor_temp_c"] - sensor_temp_c) / TEMP_TOLERANCE_C
+
+        if kind == "dark":
+            def cost(entry):
+                exp_cost = 0.0
+                if exposure_s and exposure_s > 0:
+                    exp_cost = abs(math.log2(exposure_s / entry["exposure_s"]))
+                return temp_cost(entry) + exp_cost
+            return min(candidates, key=cost)
+        if kind == "bias":
+            return min(candidates, key=temp_cost)
+        return max(candidates, key=lambda e: e["created"])
+
+    def dark_for(self, camera, gain, exposure_s, sensor_temp_c, model=None):
+        """
+        Master dark listo para restar a lights de `exposure_s` a `sensor_temp_c`.
+
+        Devuelve `(arreglo float32, entrada, escala)`; la escala combina la
+        razón de exposiciones y, si la temperatura difiere más que
+        `TEMP_TOLERANCE_C`, el factor térmico de `model` (P20 por defecto).
+        Devuelve `(None, None, None)` si la biblioteca no tiene darks.
+        """
+        if not exposure_s > 0:
+            raise ValueError(f"La exposición de los lights debe ser > 0 s (recibido {exposure_s!r})")
+        entry = self.select("dark", camera, gain, exposure_s, sensor_temp_c)
+        if entry is None:
+            return None, None, None
+
+        scale = exposure_s / entry["exposure_s"]
+        if (sensor_temp_c is not None and entry["sensor_temp_c"] is not None
+                and abs(entry["sensor_temp_c"] - sensor_temp_c) > TEMP_TOLERANCE_C):
+            model = model or DarkCurrentModel.from_p20()
+            scale *= model.ratio(entry["sensor_temp_c"], sensor_temp_c)
+        dark = np.array(self.load(entry), dtype=np.float32)
+        if scale != 1.0:
+            dark *= scale
+        return dark, entry, scale
+
+    def masters_for(self, camera, gain, exposure_s, sensor_temp_c, filter=None, model=None):
+        """
+        Masters para `orionlab_reduction.reduce_session`:
+        `{"bias": ..., "darks": ..., "flats": ...}` (None donde falten).
+        """
+        bias_entry = self.select("bias", camera, gain, sensor_temp_c=sensor_temp_c)
+        flat_entry = self.select("flat", camera, gain, filter=filter)
+        dark, dark_entry, scale = self.dark_for(camera, gain, exposure_s, sensor_temp_c, model)
+
+        for label, entry in (("bias", bias_entry), ("dark", dark_entry), ("flat", flat_entry)):
+            if entry is None:
+                print(f"⚠ Sin master {label} para {camera} (ganancia {gain})")
+            else:
+                extra = f" ×{scale:.3f}" if label == "dark" and scale != 1.0 else ""
+                print(f"  📚 {label}: {entry['file']}{extra}")
+
+        return {
+            "bias": np.array(self.load(bias_entry), dtype=np.float32) if bias_entry else None,
+            "darks": dark,
+            "flats": np.array(self.load(flat_entry), dtype=np.float32) if flat_entry else None,
+        }
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def _add_key_args(parser, exposure_required=False):
+    parser.add_argument("--camera", required=True)
+    parser.add_argument("--gain", required=True, help="Ganancia o ISO (se guarda como texto).")
+    parser.add_argument("--exposure", type=float, default=0.0 if not exposure_required else None,
+                        required=exposure_required, help="Exposición (s).")
+    parser.add_argument("--sensor-temp", type=float, help="Temperatura del sensor (°C).")
+    parser.add_argument("--filter", help="Filtro (sólo flats).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Biblioteca de masters de calibración OrionLab.")
+    parser.add_argument("--library", type=Path, help="Directorio de la biblioteca.")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_build = sub.add_parser("build", help="Construye un master desde frames.")
+    p_build.add_argument("kind", choices=KINDS)
+    p_build.add_argument("frames", nargs="+", type=Path)
+    _add_key_args(p_build)
+    p_build.add_argument("--method", choices=list(COMBINE_METHODS), default="median")
+    p_build.add_argument("--sigma", type=float, default=3.0)
+    p_build.add_argument("--max-memory-mb", type=float, default=256)
+
+    sub.add_parser("list", help="Lista los masters del índice.")
+
+    p_select = sub.add_parser("select", help="Muestra el master elegido para una sesión.")
+    p_select.add_argument("kind", choices=KINDS)
+    _add_key_args(p_select)
+
+    p_model = sub.add_parser("model", help="Ajusta y muestra el modelo de dark current P20.")
+    p_model.add_argument("--table", type=Path)
+
+    args = parser.parse_args(argv)
+    needs_exposure = (args.action == "build" and args.kind != "bias") or \
+        (args.action == "select" and args.kind == "dark")
+    if needs_exposure and not args.exposure > 0:
+        parser.error(f"{args.action} {args.kind} necesita --exposure > 0")
+    library = CalibrationLibrary(args.library)
+
+    if args.action == "build":
+        library.build(args.kind, args.frames, args.camera, args.gain, args.exposure,
+                      args.sensor_temp, args.filter, method=args.method, sigma=args.sigma,
+                      max_memory_mb=args.max_memory_mb)
+    elif args.action == "list":
+        print(f"Biblioteca: {library.root}")
+        for m in sorted(library.masters, key=lambda m: (m["kind"], m["camera"], m["gain"],
+                                                         m["exposure_s"], m["sensor_temp_c"] or 0)):
+            temp = "—" if m["sensor_temp_c"] is None else f"{m['sensor_temp_c']:g} °C"
+            print(f"  {m['kind']:<5} {m['camera']:<20} g{m['gain']:<5} {m['exposure_s']:>6g} s "
+                  f"{temp:>7}  {m.get('filter') or '':<24} {m['n_frames']:>4} frames  {m['file']}")
+    elif args.action == "select":
+        if args.kind == "dark":
+            dark, entry, scale = library.dark_for(args.camera, args.gain, args.exposure,
+                                                  args.sensor_temp)
+            if entry is not None:
+                print(f"{entry['file']}  (escala ×{scale:.3f})")
+        else:
+            entry = library.select(args.kind, args.camera, args.gain, args.exposure,
+                                   args.sensor_temp, args.filter)
+            if entry is not None:
+                print(entry["file"])
+        if entry is None:
+            print(f"⚠ Sin master {args.kind} para esa configuración")
+            return 1
+    elif args.action == "model":
+        print(DarkCurrentModel.from_p20(args.table))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+orionlab_debayer.py
+
+Debayer de subs OSC (ZWO ASI533MC Pro, matriz RGGB) para P10, P13 y P14.
+
+Todas las funciones aceptan un frame (alto, ancho) o un lote
+(..., alto, ancho) como un solo arreglo NumPy, y devuelven RGB en el último
+eje:
+
+- superpixel  cada celda 2×2 da un píxel RGB (mitad de resolución, sin
+              interpolar: R, media de los dos G, B)
+- bilinear    interpolación bilineal de cada canal (resolución completa)
+- vng         estilo VNG (Variable Number of Gradients): por píxel se miden
+              gradientes en 8 direcciones sobre la CFA y se promedian las
+              diferencias de color sólo en las direcciones suaves, lo que
+              evita el "zipper" en bordes de estrellas
+
+`cfa_views` entrega los cuatro canales de la CFA (R, G1, G2, B) como vistas
+con stride 2, sin copiar: sirven para estadísticas o correcciones por canal
+(p. ej. normalizar un flat por canal con `normalize_cfa_flat`).
+
+Como calibrar y apilar no mezclan píxeles, la reducción puede trabajar sobre
+la CFA cruda y debayerizar una sola vez el apilado final, en vez de cada sub
+(ver `orionlab_reduction.py --debayer`). Para eso el registro debe mover los
+subs en pasos pares, que conservan la fase de la matriz.
+
+Uso:
+    python orionlab_debayer.py stacked.fits --method vng --out stacked_rgb.npy
+    python orionlab_debayer.py subs/*.fits --method superpixel --out-dir rgb/
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import open_frame, read_header, save_frame
+
+BAYER_PATTERNS = ("RGGB", "BGGR", "GRBG", "GBRG")
+DEBAYER_METHODS = ("superpixel", "bilinear", "vng")
+
+# ASI533MC Pro
+DEFAULT_PATTERN = "RGGB"
+
+# Umbral VNG (Chang et al.): T = k1·mínimo + k2·(máximo - mínimo)
+VNG_K1 = 1.5
+VNG_K2 = 0.5
+
+_CHANNEL_INDEX = {"R": 0, "G": 1, "B": 2}
+
+# Direcciones VNG (dy, dx): N, S, O, E y diagonales
+_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+
+_KERNEL_G = np.array([[0, 1, 0], [1, 4, 1], [0, 1, 0]], dtype=np.float32) / 4
+_KERNEL_RB = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32) / 4
+
+
+def _check_pattern(pattern):
+    pattern = pattern.upper()
+    if pattern not in BAYER_PATTERNS:
+        raise ValueError(f"Matriz Bayer desconocida: {pattern!r} (opciones: {list(BAYER_PATTERNS)})")
+    return pattern
+
+
+def bayer_pattern(path, default=DEFAULT_PATTERN):
+    """Matriz Bayer de un sub (tarjeta FITS `BAYERPAT` que escribe el ASIAIR) o `default`."""
+    return _check_pattern(read_header(path).get("BAYERPAT", default))
+
+
+def cfa_offsets(pattern=DEFAULT_PATTERN):
+    """`{"R": (fila, col), "G1": ..., "G2": ..., "B": ...}` dentro de la celda 2×2."""
+    pattern = _check_pattern(pattern)
+    offsets = {}
+    for k, color in enumerate(pattern):
+        name = color if color != "G" else ("G2" if "G1" in offsets else "G1")
+        offsets[name] = (k // 2, k % 2)
+    return offsets
+
+
+def cfa_views(frames, pattern=DEFAULT_PATTERN):
+    """Canales R, G1, G2 y B de `frames` (..., alto, ancho) como vistas de stride 2 (sin copia)."""
+    return {name: frames[..., r::2, c::2] for name, (r, c) in cfa_offsets(pattern).items()}
+
+
+def _color_map(shape, pattern):
+    """Índice de color (0=R, 1=G, 2=B) de cada píxel de un frame `shape`."""
+    cell = np.array([_CHANNEL_INDEX[c] for c in _check_pattern(pattern)]).reshape(2, 2)
+    h, w = shape
+    return np.tile(cell, (-(-h // 2), -(-w // 2)))[:h, :w]
+
+
+def normalize_cfa_flat(flat, pattern=DEFAULT_PATTERN):
+    """
+    Normaliza un master flat por canal de la CFA (mediana 1 en cada uno), en
+    su lugar: normalizar con una sola mediana deja el color del flat en los lights.
+    """
+    for view in cfa_views(flat, pattern).values():
+        view /= np.nanmedian(view)
+    return flat
+
+
+# ----------------------------------------------------------
+# DEBAYER
+# ----------------------------------------------------------
+def superpixel(frames, pattern=DEFAULT_PATTERN):
+    """RGB a mitad de resolución: (..., alto/2, ancho/2, 3)."""
+    v = cfa_views(frames, pattern)
+    h, w = (s // 2 * 2 for s in frames.shape[-2:])
+    crop = (Ellipsis, slice(0, h // 2), slice(0, w // 2))
+    out = np.empty(frames.shape[:-2] + (h // 2, w // 2, 3), dtype=np.float32)
+    out[..., 0] = v["R"][crop]
+    np.add(v["G1"][crop], v["G2"][crop], out=out[..., 1], dtype=np.float32)
+    out[..., 1] *= 0.5
+    out[..., 2] = v["B"][crop]
+    return out
+
+
+def _pad(frames, n):
+    # "reflect" (sin repetir el borde) conserva la paridad y por lo tanto la fase CFA
+    width = [(0, 0)] * (frames.ndim - 2) + [(n, n), (n, n)]
+    return np.pad(frames, width, mode="reflect")
+
+
+def _convolve3(frames, kernel):
+    """Convolución 3×3 sobre los dos últimos ejes como suma de vistas desplazadas."""
+    padded = _pad(frames, 1)
+    h, w = frames.shape[-2:]
+    out = np.zeros(frames.shape, dtype=np.float32)
+    for dy in range(3):
+        for dx in range(3):
+            if kernel[dy, dx]:
+                out += kernel[dy, dx] * padded[..., dy:dy + h, dx:dx + w]
+    return out
+
+
+def bilinear(frames, pattern=DEFAULT_PATTERN):
+    """RGB a resolución completa por interpolación bilineal: (..., alto, ancho, 3)."""
+    frames = np.asarray(frames, dtype=np.float32)
+    colors = _color_map(frames.shape[-2:], pattern)
+    out = np.empty(frames.shape + (3,), dtype=np.float32)
+    for c, kernel in ((0, _KERNEL_RB), (1, _KERNEL_G), (2, _KERNEL_RB)):
+        out[..., c] = _convolve3(np.where(colors == c, frames, 0), kernel)
+    return out
+
+
+def vng(frames, pattern=DEFAULT_PATTERN, k1=VNG_K1, k2=VNG_K2):
+    """
+    RGB a resolución completa, estilo VNG: (..., alto, ancho, 3).
+
+    Gradiente en la dirección d: |C(p+d) - C(p-d)| + |C(p+2d) - C(p)| sobre
+    la CFA cruda (pares del mismo color). Se usan las direcciones con
+    gradiente ≤ k1·mín + k2·(máx - mín) y en ellas se promedia la diferencia
+    de color del vecino p+d (tomada del bilineal); el color propio del
+    píxel queda intacto.
+    """
+    frames = np.asarray(frames, dtype=np.float32)
+    h, w = frames.shape[-2:]
+    base = bilinear(frames, pattern)
+    colors = _color_map((h, w), pattern)
+
+    raw = _pad(frames, 2)
+    center = raw[..., 2:2 + h, 2:2 + w]
+    grads = np.empty((len(_DIRECTIONS),) + frames.shape, dtype=np.float32)
+    for k, (dy, dx) in enumerate(_DIRECTIONS):
+        plus = raw[..., 2 + dy:2 + dy + h, 2 + dx:2 + dx + w]
+        minus = raw[..., 2 - dy:2 - dy + h, 2 - dx:2 - dx + w]
+        plus2 = raw[..., 2 + 2 * dy:2 + 2 * dy + h, 2 + 2 * dx:2 + 2 * dx + w]
+        grads[k] = np.abs(plus - minus) + np.abs(plus2 - center)
+    g_min, g_max = grads.min(axis=0), grads.max(axis=0)
+    threshold = k1 * g_min + k2 * (g_max - g_min)
+
+    padded = _pad(np.moveaxis(base, -1, 0), 1)   # (3, ..., alto+2, ancho+2)
+    own = np.broadcast_to(colors, frames.shape)
+    acc = np.zeros(base.shape, dtype=np.float32)
+    count = np.zeros(frames.shape, dtype=np.float32)
+    for k, (dy, dx) in enumerate(_DIRECTIONS):
+        use = grads[k] <= threshold
+        neighbour = padded[..., 1 + dy:1 + dy + h, 1 + dx:1 + dx + w]   # (3, ..., alto, ancho)
+        own_value = np.choose(own, neighbour)
+        for c in range(3):
+            acc[..., c] += np.where(use, neighbour[c] - own_value, 0)
+        count += use
+    # En el canal propio la diferencia es 0: queda el valor crudo
+    return frames[..., None] + acc / np.maximum(count, 1)[..., None]
+
+
+DEBAYERS = {"superpixel": superpixel, "bilinear": bilinear, "vng": vng}
+
+
+def debayer(frames, method="bilinear", pattern=DEFAULT_PATTERN):
+    """Debayer de un frame o lote con `method` (`DEBAYER_METHODS`)."""
+    if method not in DEBAYERS:
+        raise ValueError(f"Método desconocido: {method!r} (opciones: {list(DEBAYER_METHODS)})")
+    return DEBAYERS[method](np.asarray(frames), pattern)
+
+
+def save_rgb(path, rgb):
+    """Guarda un RGB (alto, ancho, 3) como `.npy` o FITS de 3 planos (NAXIS3 = 3)."""
+    path = Path(path)
+    if path.suffix.lower() in (".fits", ".fit", ".fts"):
+        return save_frame(path, np.moveaxis(rgb, -1, 0))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, np.asarray(rgb, dtype=np.float32))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Debayer de subs o apilados OSC.")
+    parser.add_argument("frames", nargs="+", type=Path, help="Frames CFA (.npy/.fits).")
+    parser.add_argument("--method", choices=DEBAYER_METHODS, default="vng")
+    parser.add_argument("--pattern", choices=BAYER_PATTERNS,
+                        help="Matriz Bayer (por defecto BAYERPAT del FITS o RGGB).")
+    parser.add_argument("--out", type=Path, help="Salida para un solo frame (.npy/.fits).")
+    parser.add_argument("--out-dir", type=Path, help="Directorio de salida para varios frames.")
+    args = parser.parse_args(argv)
+
+    if len(args.frames) > 1 and not args.out_dir:
+        parser.error("con varios frames use --out-dir")
+    for path in args.frames:
+        pattern = args.pattern or bayer_pattern(path)
+        rgb = debayer(np.asarray(open_frame(path), dtype=np.float32), args.method, pattern)
+        out = args.out or (args.out_dir or path.parent) / f"{path.stem}_rgb.npy"
+        save_rgb(out, rgb)
+        print(f"✅ {path.name} ({pattern}, {args.method}) → {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
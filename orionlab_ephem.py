@@ -0,0 +1,446 @@
+"""
+orionlab_ephem.py
+
+Efemérides y altitudes offline para la visibilidad Messier/NGC desde Chile
+(estudio P18) y la planificación por región de P12.
+
+- Tiempo sidéreo (GMST de la IAU 1982 + longitud del sitio), posición del
+  Sol de baja precisión (Almanaque Astronómico, ~0,01°) y precesión de
+  primer orden de J2000 a la época del año calculado.
+- `altaz` transmite (broadcasting) cualquier combinación de objetos ×
+  tiempos × sitios.
+- Para un año completo se arma por sitio una grilla noche × bin de hora
+  local (de `NIGHT_START_H` a `NIGHT_END_H`, cada `STEP_MIN` minutos, con el
+  horario de verano de Chile continental) y una máscara de oscuridad (Sol
+  bajo `SUN_ALT_DARK`). Como
+
+      sin h = sin φ sin δ + cos φ cos δ (cos LST cos α + sin LST sin α)
+
+  el seno de la altitud de todos los objetos en todos los bins es un
+  producto de matrices (objetos × 4) @ (4 × bins), con una cuarta fila que
+  castiga los bins con Sol. El máximo por noche es un `argmax` sobre el eje
+  de bins; el arcoseno sólo se aplica al resultado. Los bloques de objetos
+  y noches se reparten en un pool de hilos.
+
+La tabla P18 (`object, month, max_altitude_deg, best_hour_local`) guarda por
+mes la altitud máxima en noche astronómica y la hora local mediana de
+culminación dentro de la noche.
+
+Uso:
+    python orionlab_ephem.py --table                              # P18 desde Santiago
+    python orionlab_ephem.py --objects all --catalog NGC.csv --sites Santiago Elqui Atacama
+    python orionlab_ephem.py --demo
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+
+# Estudio P18
+P18_DIRS = ["p18_messier_ngc_chile", "p18_messier_ngc_from_chile"]
+TABLE_NAME = "messier_ngc_visibility_chile.csv"
+P18_FIELDS = ["object", "month", "max_altitude_deg", "best_hour_local"]
+P18_OBJECTS = ("M8", "M20", "M42", "M83", "NGC253", "NGC3372")
+P18_YEAR = 2026   # año de la tabla P18 versionada: fijo para que --table la reproduzca
+
+# Sitios de P06 (Santiago, Elqui, Atacama) y regiones de P12
+SITES = {
+    "Santiago": {"region": "RM", "lat": -33.41, "lon": -70.55, "elevation_m": 800},
+    "Elqui": {"region": "IV", "lat": -30.17, "lon": -70.49, "elevation_m": 1300},
+    "Atacama": {"region": "II", "lat": -22.91, "lon": -68.20, "elevation_m": 2400},
+    "Araucania": {"region": "IX", "lat": -38.74, "lon": -72.60, "elevation_m": 120},
+    "Los Lagos": {"region": "X", "lat": -41.47, "lon": -72.94, "elevation_m": 80},
+}
+
+STEP_MIN = 5
+NIGHT_START_H = 18.0     # hora local del primer bin
+NIGHT_END_H = 32.0       # 08:00 del día siguiente
+SUN_ALT_DARK = -18.0     # noche astronómica
+OBJ_BLOCK = 256
+NIGHT_BLOCK = 16
+
+J2000 = np.datetime64("2000-01-01T12:00:00", "s")
+PRECESSION_M = 46.124 / 3600    # grados/año
+PRECESSION_N = 20.043 / 3600
+
+# Messier (J2000, RA hh:mm.m, Dec ±dd:mm) + objetos NGC de P18
+MESSIER = """
+M1 05:34.5 +22:01  M2 21:33.5 -00:49  M3 13:42.2 +28:23  M4 16:23.6 -26:32  M5 15:18.6 +02:05
+M6 17:40.1 -32:13  M7 17:53.9 -34:49  M8 18:03.8 -24:23  M9 17:19.2 -18:31  M10 16:57.1 -04:06
+M11 18:51.1 -06:16  M12 16:47.2 -01:57  M13 16:41.7 +36:28  M14 17:37.6 -03:15  M15 21:30.0 +12:10
+M16 18:18.8 -13:47  M17 18:20.8 -16:11  M18 18:19.9 -17:08  M19 17:02.6 -26:16  M20 18:02.6 -23:02
+M21 18:04.6 -22:30  M22 18:36.4 -23:54  M23 17:56.8 -19:01  M24 18:16.9 -18:29  M25 18:31.6 -19:15
+M26 18:45.2 -09:24  M27 19:59.6 +22:43  M28 18:24.5 -24:52  M29 20:23.9 +38:32  M30 21:40.4 -23:11
+M31 00:42.7 +41:16  M32 00:42.7 +40:52  M33 01:33.9 +30:39  M34 02:42.0 +42:47  M35 06:08.9 +24:20
+M36 05:36.1 +34:08  M37 05:52.4 +32:33  M38 05:28.4 +35:50  M39 21:32.2 +48:26  M40 12:22.4 +58:05
+M41 06:46.0 -20:44  M42 05:35.4 -05:27  M43 05:35.6 -05:16  M44 08:40.1 +19:59  M45 03:47.0 +24:07
+M46 07:41.8 -14:49  M47 07:36.6 -14:30  M48 08:13.8 -05:48  M49 12:29.8 +08:00  M50 07:03.2 -08:20
+M51 13:29.9 +47:12  M52 23:24.2 +61:35  M53 13:12.9 +18:10  M54 18:55.1 -30:29  M55 19:40.0 -30:58
+M56 19:16.6 +30:11  M57 18:53.6 +33:02  M58 12:37.7 +11:49  M59 12:42.0 +11:39  M60 12:43.7 +11:33
+M61 12:21.9 +04:28  M62 17:01.2 -30:07  M63 13:15.8 +42:02  M64 12:56.7 +21:41  M65 11:18.9 +13:05
+M66 11:20.2 +12:59  M67 08:50.4 +11:49  M68 12:39.5 -26:45  M69 18:31.4 -32:21  M70 18:43.2 -32:18
+M71 19:53.8 +18:47  M72 20:53.5 -12:32  M73 20:58.9 -12:38  M74 01:36.7 +15:47  M75 20:06.1 -21:55
+M76 01:42.4 +51:34  M77 02:42.7 -00:01  M78 05:46.7 +00:03  M79 05:24.5 -24:33  M80 16:17.0 -22:59
+M81 09:55.6 +69:04  M82 09:55.8 +69:41  M83 13:37.0 -29:52  M84 12:25.1 +12:53  M85 12:25.4 +18:11
+M86 12:26.2 +12:57  M87 12:30.8 +12:24  M88 12:32.0 +14:25  M89 12:35.7 +12:33  M90 12:36.8 +13:10
+M91 12:35.4 +14:30  M92 17:17.1 +43:08  M93 07:44.6 -23:52  M94 12:50.9 +41:07  M95 10:44.0 +11:42
+M96 10:46.8 +11:49  M97 11:14.8 +55:01  M98 12:13.8 +14:54  M99 12:18.8 +14:25  M100 12:22.9 +15:49
+M101 14:03.2 +54:21  M102 15:06.5 +55:46  M103 01:33.2 +60:42  M104 12:40.0 -11:37  M105 10:47.8 +12:35
+M106 12:19.0 +47:18  M107 16:32.5 -13:03  M108 11:11.5 +55:40  M109 11:57.6 +53:23  M110 00:40.4 +41:41
+NGC253 00:47.6 -25:17  NGC3372 10:45.1 -59:52
+"""
+
+
+def _sexagesimal(text, hours):
+    sign = -1.0 if text.strip().startswith("-") else 1.0
+    parts = [abs(float(p)) for p in text.strip().lstrip("+-").split(":")]
+    value = sum(p / 60 ** i for i, p in enumerate(parts))
+    return sign * value * (15.0 if hours else 1.0)
+
+
+def _builtin_objects():
+    tokens = MESSIER.split()
+    return {name: (_sexagesimal(ra, True), _sexagesimal(dec, False))
+            for name, ra, dec in zip(tokens[::3], tokens[1::3], tokens[2::3])}
+
+
+OBJECTS = _builtin_objects()
+
+
+def normalize_name(name):
+    """`NGC 0253` / `ngc253` → `NGC253` (mismo formato que P18)."""
+    name = re.sub(r"\s+", "", str(name)).upper()
+    return re.sub(r"^(NGC|IC|M)0*(?=\d)", r"\1", name)
+
+
+def load_objects(path):
+    """
+    Objetos (nombre → (ra, dec) en grados) desde un CSV/Parquet.
+
+    Acepta RA/Dec en grados o sexagesimal (`hh:mm:ss`, `±dd:mm:ss`), p. ej.
+    el `NGC.csv` de OpenNGC (separado por `;`). Las filas sin coordenadas se
+    descartan.
+    """
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix.lower() in (".parquet", ".pq"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, sep=None, engine="python")
+    lookup = {c.lower(): c for c in df.columns}
+    name_col = next((lookup[c] for c in ("name", "object", "id") if c in lookup), None)
+    ra_col = next((lookup[c] for c in ("ra", "raj2000", "ra_deg") if c in lookup), None)
+    dec_col = next((lookup[c] for c in ("dec", "dej2000", "dec_deg") if c in lookup), None)
+    if name_col is None or ra_col is None or dec_col is None:
+        raise ValueError(f"{path}: se esperaban columnas name/ra/dec ({', '.join(map(str, df.columns))})")
+    df = df.dropna(subset=[ra_col, dec_col])
+    objects = {}
+    for name, ra, dec in zip(df[name_col], df[ra_col], df[dec_col]):
+        if isinstance(ra, str):
+            ra, dec = _sexagesimal(ra, True), _sexagesimal(str(dec), False)
+        objects[normalize_name(name)] = (float(ra), float(dec))
+    return objects
+
+
+# ----------------------------------------------------------
+# TIEMPO Y POSICIONES
+# ----------------------------------------------------------
+def days_since_j2000(times):
+    """Días (UT) desde J2000.0 de un arreglo `datetime64`."""
+    return (np.asarray(times, dtype="datetime64[s]") - J2000) / np.timedelta64(86400, "s")
+
+
+def sidereal_time(d, lon_deg):
+    """Tiempo sidéreo local en radianes (GMST IAU 1982, lon positiva al este)."""
+    d = np.asarray(d, dtype=np.float64)
+    t = d / 36525.0
+    gmst = 280.46061837 + 360.98564736629 * d + 0.000387933 * t * t
+    return np.radians(np.mod(gmst + np.asarray(lon_deg), 360.0))
+
+
+def sun_radec(d):
+    """RA/Dec aparentes del Sol en grados (precisión ~0,01°)."""
+    d = np.asarray(d, dtype=np.float64)
+    mean_lon = 280.460 + 0.9856474 * d
+    g = np.radians(357.528 + 0.9856003 * d)
+    ecl_lon = np.radians(mean_lon + 1.915 * np.sin(g) + 0.020 * np.sin(2 * g))
+    eps = np.radians(23.439 - 4e-7 * d)
+    ra = np.degrees(np.arctan2(np.cos(eps) * np.sin(ecl_lon), np.cos(ecl_lon))) % 360.0
+    dec = np.degrees(np.arcsin(np.sin(eps) * np.sin(ecl_lon)))
+    return ra, dec
+
+
+def precess(ra_deg, dec_deg, epoch):
+    """Precesión de primer orden J2000 → `epoch` (años decimales)."""
+    ra, dec = np.radians(ra_deg), np.radians(np.clip(dec_deg, -89.0, 89.0))
+    t = epoch - 2000.0
+    ra_out = np.asarray(ra_deg) + (PRECESSION_M + PRECESSION_N * np.sin(ra) * np.tan(dec)) * t
+    dec_out = np.asarray(dec_deg) + PRECESSION_N * np.cos(ra) * t
+    return ra_out % 360.0, dec_out
+
+
+def altaz(ra_deg, dec_deg, lat_deg, lst):
+    """
+    Altitud y azimut (grados; az desde el norte hacia el este).
+
+    Todos los argumentos transmiten entre sí: p. ej. objetos `(n, 1, 1)`,
+    sitios `(1, s, 1)` y `lst` `(1, s, t)` dan `(n, s, t)`.
+    """
+    dec, lat = np.radians(dec_deg), np.radians(lat_deg)
+    h = lst - np.radians(ra_deg)
+    sin_dec, cos_dec = np.sin(dec), np.cos(dec)
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    cos_h = np.cos(h)
+    sin_alt = sin_dec * sin_lat + cos_dec * cos_lat * cos_h
+    alt = np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+    az = np.degrees(np.arctan2(-cos_dec * np.sin(h), sin_dec * cos_lat - cos_dec * cos_h * sin_lat)) % 360.0
+    return alt, az
+
+
+def chile_utc_offset(nights):
+    """
+    Offset UTC (horas) de Chile continental para cada noche (`datetime64[D]`).
+
+    Horario de verano (UTC−3) desde el primer domingo de septiembre hasta el
+    primer domingo de abril; el resto del año UTC−4.
+    """
+    nights = np.asarray(nights, dtype="datetime64[D]")
+    year = nights.astype("datetime64[Y]").astype("datetime64[M]")
+
+    def first_sunday(month):
+        first = (year + (month - 1)).astype("datetime64[D]")
+        weekday = (first - np.datetime64("1970-01-04")).astype(np.int64) % 7   # 0 = domingo
+        return first + (7 - weekday) % 7
+
+    summer = (nights >= first_sunday(9)) | (nights < first_sunday(4))
+    return np.where(summer, -3.0, -4.0)
+
+
+class NightGrid:
+    """
+    Grilla noche × bin de hora local de un año para un sitio.
+
+    `d`, `lst` y `dark` tienen forma (noches, bins); la noche `i` empieza la
+    tarde de `nights[i]` y el bin `j` corresponde a la hora local
+    `hours[j]` (18 → 32, es decir hasta las 08:00 del día siguiente).
+    """
+
+    def __init__(self, site, year, step_min=STEP_MIN, sun_alt=SUN_ALT_DARK):
+        if site not in SITES:
+            raise ValueError(f"Sitio desconocido: {site} (opciones: {', '.join(SITES)})")
+        self.site, self.year, self.step_min, self.sun_alt = site, int(year), step_min, sun_alt
+        self.lat, self.lon = SITES[site]["lat"], SITES[site]["lon"]
+        self.nights = np.arange(np.datetime64(f"{year}-01-01"), np.datetime64(f"{year + 1}-01-01"),
+                                dtype="datetime64[D]")
+        n_bins = int(round((NIGHT_END_H - NIGHT_START_H) * 60 / step_min))
+        self.hours = NIGHT_START_H + np.arange(n_bins) * step_min / 60.0
+        self.utc_offset = chile_utc_offset(self.nights)
+        day0 = (self.nights - np.datetime64("2000-01-01")).astype(np.float64) - 0.5
+        self.d = day0[:, None] + (self.hours[None, :] - self.utc_offset[:, None]) / 24.0
+        self.lst = sidereal_time(self.d, self.lon)
+        sun_ra, sun_dec = sun_radec(self.d)
+        self.sun_altitude = altaz(sun_ra, sun_dec, self.lat, self.lst)[0]
+        self.dark = self.sun_altitude < sun_alt
+
+    @property
+    def shape(self):
+        return self.d.shape
+
+    @property
+    def months(self):
+        return self.nights.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+    def time_terms(self):
+        """Matriz (4, noches·bins): [1, cos LST, sin LST, castigo de bins con Sol]."""
+        lst = self.lst.ravel()
+        penalty = np.where(self.dark.ravel(), 0.0, -4.0)
+        return np.stack([np.ones_like(lst), np.cos(lst), np.sin(lst), penalty]).astype(np.float32)
+
+    def object_terms(self, ra_deg, dec_deg):
+        """Matriz (objetos, 4) a la época del año: [sin φ sin δ, cos φ cos δ cos α, cos φ cos δ sin α, 1]."""
+        ra, dec = precess(np.asarray(ra_deg, dtype=np.float64), np.asarray(dec_deg, dtype=np.float64),
+                          self.year + 0.5)
+        ra, dec, lat = np.radians(ra), np.radians(dec), math.radians(self.lat)
+        b = math.cos(lat) * np.cos(dec)
+        return np.stack([math.sin(lat) * np.sin(dec), b * np.cos(ra), b * np.sin(ra),
+                         np.ones_like(ra)], axis=1).astype(np.float32)
+
+
+# ----------------------------------------------------------
+# ALTITUDES DEL AÑO
+# ----------------------------------------------------------
+def _blocks(n, size):
+    return [slice(i, min(i + size, n)) for i in range(0, n, size)]
+
+
+def altitude_grid(ra_deg, dec_deg, grid, nights=slice(None), threads=None):
+    """Altitud (grados, float32) de cada objeto en cada bin: (objetos, noches, bins), con o sin Sol."""
+    objects = grid.object_terms(ra_deg, dec_deg)
+    objects[:, 3] = 0.0
+    n_bins = grid.shape[1]
+    terms = grid.time_terms().reshape(4, grid.shape[0], n_bins)[:, nights]
+    n_nights = terms.shape[1]
+    terms = terms.reshape(4, -1)
+    out = np.empty((len(objects), n_nights, n_bins), dtype=np.float32)
+
+    def run(block):
+        s = objects[block] @ terms
+        np.clip(s, -1.0, 1.0, out=s)
+        out[block] = np.degrees(np.arcsin(s)).reshape(-1, n_nights, n_bins)
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+        list(pool.map(run, _blocks(len(objects), OBJ_BLOCK)))
+    return out
+
+
+def nightly_best(ra_deg, dec_deg, grid, threads=None):
+    """
+    Altitud máxima de cada objeto en la parte oscura de cada noche.
+
+    Devuelve `(max_alt, best_bin)` de forma (objetos, noches): grados
+    (float32, NaN si la noche no tiene bins oscuros) y el índice del bin
+    (`grid.hours[best_bin]` es la hora local).
+    """
+    objects = grid.object_terms(ra_deg, dec_deg)
+    terms = grid.time_terms()
+    n_nights, n_bins = grid.shape
+    max_alt = np.empty((len(objects), n_nights), dtype=np.float32)
+    best_bin = np.empty((len(objects), n_nights), dtype=np.int16)
+
+    def run(task):
+        ob, nb = task
+        s = (objects[ob] @ terms[:, nb.start * n_bins:nb.stop * n_bins]).reshape(-1, nb.stop - nb.start, n_bins)
+        idx = s.argmax(axis=2)
+        best = np.take_along_axis(s, idx[..., None], axis=2)[..., 0]
+        best_bin[ob, nb] = idx
+        max_alt[ob, nb] = np.where(best < -1.5, np.nan, np.degrees(np.arcsin(np.clip(best, -1.0, 1.0))))
+
+    tasks = [(ob, nb) for ob in _blocks(len(objects), OBJ_BLOCK) for nb in _blocks(n_nights, NIGHT_BLOCK)]
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+        list(pool.map(run, tasks))
+    return max_alt, best_bin
+
+
+def yearly_visibility(objects, sites, year, step_min=STEP_MIN, sun_alt=SUN_ALT_DARK, threads=None):
+    """`{sitio: (grid, max_alt, best_bin)}` para `objects` (nombre → (ra, dec))."""
+    ra, dec = np.array(list(objects.values()), dtype=np.float64).reshape(-1, 2).T
+    result = {}
+    for site in sites:
+        grid = NightGrid(site, year, step_min, sun_alt)
+        result[site] = (grid, *nightly_best(ra, dec, grid, threads))
+    return result
+
+
+# ----------------------------------------------------------
+# TABLA P18
+# ----------------------------------------------------------
+def monthly_rows(names, max_alt, best_bin, grid):
+    """
+    Filas P18 por objeto y mes: altitud máxima en noche oscura y hora local
+    mediana del máximo de cada noche (sólo noches con el objeto sobre el
+    horizonte, si las hay).
+    """
+    months = grid.months
+    hours = grid.hours[best_bin]
+    rows = []
+    for i, name in enumerate(names):
+        for month in range(1, 13):
+            sel = months == month
+            alt, hour = max_alt[i, sel], hours[i, sel]
+            up = alt > 0
+            hour = hour[up] if up.any() else hour[np.isfinite(alt)]
+            rows.append({
+                "object": name,
+                "month": month,
+                "max_altitude_deg": round(float(np.nanmax(alt)), 1),
+                "best_hour_local": int(round(float(np.median(hour)))) % 24,
+            })
+    return rows
+
+
+def write_p18_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P18_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, P18_FIELDS, csv_path)
+    print(f"✅ Tabla P18: {csv_path} ({len(rows)} filas)")
+    return csv_path
+
+
+def synthetic_ngc(n_objects=7840, seed=0):
+    """Lista tipo NGC uniforme en la esfera (para medir tiempos sin catálogo)."""
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0.0, 360.0, n_objects)
+    dec = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, n_objects)))
+    return {f"NGC{i + 1}": (float(r), float(d)) for i, (r, d) in enumerate(zip(ra, dec))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Visibilidad anual Messier/NGC desde sitios de Chile (P18).")
+    parser.add_argument("--objects", nargs="+", default=list(P18_OBJECTS),
+                        help="Objetos (M42 NGC253 …) o `all` para todo el catálogo cargado.")
+    parser.add_argument("--catalog", type=Path, help="CSV/Parquet NGC/IC adicional (p. ej. NGC.csv de OpenNGC).")
+    parser.add_argument("--sites", nargs="+", default=["Santiago"], choices=list(SITES),
+                        help="Sitios; la tabla P18 usa el primero.")
+    parser.add_argument("--year", type=int, default=P18_YEAR,
+                        help=f"Año de las efemérides (por defecto {P18_YEAR}, el de la tabla P18).")
+    parser.add_argument("--step", type=int, default=STEP_MIN, help="Resolución en minutos.")
+    parser.add_argument("--sun-alt", type=float, default=SUN_ALT_DARK, help="Altura del Sol para noche oscura.")
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Escribe la tabla P18 (por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--demo", action="store_true",
+                        help="Messier + 7840 objetos NGC sintéticos × Santiago/Elqui/Atacama.")
+    args = parser.parse_args(argv)
+
+    catalog = dict(OBJECTS)
+    if args.catalog:
+        catalog.update(load_objects(args.catalog))
+    if args.demo:
+        catalog.update(synthetic_ngc())
+        args.objects = ["all"]
+        args.sites = ["Santiago", "Elqui", "Atacama"]
+    if args.objects == ["all"]:
+        objects = catalog
+    else:
+        names = [normalize_name(n) for n in args.objects]
+        missing = [n for n in names if n not in catalog]
+        if missing:
+            parser.error(f"objetos sin coordenadas: {', '.join(missing)} (use --catalog)")
+        objects = {n: catalog[n] for n in names}
+
+    n_bins = int(round((NIGHT_END_H - NIGHT_START_H) * 60 / args.step))
+    print(f"🚀 {len(objects)} objetos × {len(args.sites)} sitios × {n_bins} bins de {args.step} min "
+          f"por noche ({args.year})")
+    t0 = time.perf_counter()
+    result = yearly_visibility(objects, args.sites, args.year, args.step, args.sun_alt, args.threads)
+    dt = time.perf_counter() - t0
+    n_eval = sum(r[0].d.size for r in result.values()) * len(objects)
+    print(f"✅ {n_eval / 1e6:.1f} M altitudes en {dt:.2f} s")
+    for site, (grid, max_alt, _) in result.items():
+        dark_h = grid.dark.sum(axis=1) * args.step / 60
+        up = (max_alt > 30).mean(axis=1)
+        print(f"  {site:<10} noche oscura {dark_h.min():.1f}–{dark_h.max():.1f} h · "
+              f"{np.mean(up) * 100:.0f} % de los objetos pasa 30° en una noche media")
+
+    if args.table is not None:
+        grid, max_alt, best_bin = result[args.sites[0]]
+        names = [n for n in P18_OBJECTS if n in objects] if args.demo else list(objects)
+        index = {n: i for i, n in enumerate(objects)}
+        sel = [index[n] for n in names]
+        write_p18_table(monthly_rows(names, max_alt[sel], best_bin[sel], grid), args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+orionlab_frames.py
+
+Acceso a frames de imagen (subs, bias, darks, flats) sin cargar sesiones
+completas en memoria.
+
+- `open_frame`: abre un frame `.npy` o `.fits` como memmap de sólo lectura.
+  El lector FITS es mínimo (HDU primaria, imágenes 2D, BITPIX 8/16/32/-32/-64,
+  BSCALE/BZERO) y no requiere astropy.
+- `FrameSource`: frame en disco que se mapea sólo durante cada lectura de
+  un tile (para recorrer cientos de subs sin que crezca el RSS).
+- `save_frame`: guarda un frame como `.npy` o `.fits` (float32).
+- `FrameStack`: pila (N, alto, ancho) en disco; cada lectura/escritura mapea
+  sólo el frame o la banda de filas pedida y libera el mapeo al terminar, así
+  la memoria residente queda acotada por un frame o una banda.
+- `frame_snr`: SNR robusto (mediana / σ por MAD) sobre una submuestra.
+- `synthetic_session`: genera subs sintéticos uint16 para pruebas y demos.
+
+Uso:
+    from orionlab_frames import FrameStack, open_frame
+    stack = FrameStack.create(workdir / "lights.npy", (200, 3008, 3008))
+    for i, path in enumerate(paths):
+        stack.write(i, open_frame(path))
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+FITS_BLOCK = 2880
+_FITS_DTYPES = {8: ">u1", 16: ">i2", 32: ">i4", -32: ">f4", -64: ">f8"}
+
+# Paso de submuestreo para estadísticas rápidas (1 de cada 8×8 píxeles)
+STATS_STEP = 8
+
+
+# ----------------------------------------------------------
+# FITS MÍNIMO
+# ----------------------------------------------------------
+def _read_fits_header(f):
+    cards = {}
+    n_blocks = 0
+    while True:
+        block = f.read(FITS_BLOCK)
+        if len(block) < FITS_BLOCK:
+            raise ValueError("FITS truncado: no se encontró END")
+        n_blocks += 1
+        for i in range(0, FITS_BLOCK, 80):
+            card = block[i:i + 80].decode("ascii", errors="replace")
+            key = card[:8].strip()
+            if key == "END":
+                return cards, n_blocks * FITS_BLOCK
+            if card[8:10] == "= ":
+                value = card[10:].split("/", 1)[0].strip()
+                cards[key] = value.strip("'").strip() if value.startswith("'") else value
+
+
+def _fits_layout(path):
+    """(dtype, shape, offset, bscale, bzero) de la HDU primaria de un FITS 2D."""
+    with open(path, "rb") as f:
+        cards, offset = _read_fits_header(f)
+    if int(cards.get("NAXIS", 0)) != 2:
+        raise ValueError(f"{path}: sólo se soportan imágenes FITS 2D (NAXIS=2)")
+    bitpix = int(cards["BITPIX"])
+    shape = (int(cards["NAXIS2"]), int(cards["NAXIS1"]))
+    return (np.dtype(_FITS_DTYPES[bitpix]), shape, offset,
+            float(cards.get("BSCALE", 1)), float(cards.get("BZERO", 0)))
+
+
+def _fits_memmap(path):
+    dtype, shape, offset, bscale, bzero = _fits_layout(path)
+    data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+    if dtype == np.dtype(">i2") and bscale == 1 and bzero == 32768:
+        # Convención FITS para uint16 (cámaras de 16 bit): se corrige al leer
+        return _Uint16View(data)
+    if bscale != 1 or bzero != 0:
+        return _ScaledView(data, bscale, bzero)
+    return data
+
+
+class _ScaledView:
+    """Memmap FITS con BSCALE/BZERO aplicados al indexar (sin copiar el archivo)."""
+
+    def __init__(self, raw, bscale, bzero):
+        self.raw, self.bscale, self.bzero = raw, bscale, bzero
+        self.shape = raw.shape
+        self.dtype = np.dtype(np.float32)
+
+    def __getitem__(self, key):
+        return self.raw[key].astype(np.float32) * self.bscale + self.bzero
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[...]
+        return out if dtype is None else out.astype(dtype)
+
+
+class _Uint16View(_ScaledView):
+    def __init__(self, raw):
+        super().__init__(raw, 1, 32768)
+        self.dtype = np.dtype(np.uint16)
+
+    def __getitem__(self, key):
+        return (self.raw[key].view(">u2") ^ 0x8000).astype(np.uint16)
+
+
+def _write_fits(path, data, header=None):
+    data = np.asarray(data, dtype=">f4")
+    cards = [("SIMPLE", "T"), ("BITPIX", -32), ("NAXIS", data.ndim)]
+    cards += [(f"NAXIS{i + 1}", n) for i, n in enumerate(data.shape[::-1])]
+    for key, value in (header or {}).items():
+        cards.append((key.upper()[:8], f"'{value}'" if isinstance(value, str) else value))
+    text = "".join(f"{k:<8}= {str(v):>20}".ljust(80) for k, v in cards) + "END".ljust(80)
+    text = text.ljust(-(-len(text) // FITS_BLOCK) * FITS_BLOCK)
+    with open(path, "wb") as f:
+        f.write(text.encode("ascii"))
+        raw = data.tobytes()
+        f.write(raw)
+        f.write(b"\0" * (-len(raw) % FITS_BLOCK))
+
+
+# ----------------------------------------------------------
+# FRAMES INDIVIDUALES
+# ----------------------------------------------------------
+def read_header(path):
+    """Tarjetas de la cabecera FITS primaria como dict (vacío para `.npy`)."""
+    path = Path(path)
+    if path.suffix.lower() not in (".fits", ".fit", ".fts"):
+        return {}
+    with open(path, "rb") as f:
+        return _read_fits_header(f)[0]
+
+
+def open_frame(path):
+    """Abre un frame 2D `.npy` o `.fits`/`.fit` como memmap de sólo lectura."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    if suffix in (".fits", ".fit", ".fts"):
+        return _fits_memmap(path)
+    raise ValueError(f"Formato de frame no soportado: {path.name}")
+
+
+def save_frame(path, data, header=None):
+    """Guarda un frame 2D como `.npy` o FITS float32 (con tarjetas `header` opcionales)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() in (".fits", ".fit", ".fts"):
+        _write_fits(path, data, header)
+    else:
+        np.save(path, np.asarray(data, dtype=np.float32))
+    return path
+
+
+class FrameSource:
+    """
+    Frame 2D en disco (`.npy`, `.fits` o un frame de un `FrameStack`) que se
+    mapea sólo mientras dura cada `read`.
+    """
+
+    def __init__(self, path, dtype, shape, offset, bscale=1.0, bzero=0.0):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.offset = offset
+        self.bscale, self.bzero = bscale, bzero
+
+    @classmethod
+    def open(cls, path):
+        path = Path(path)
+        if path.suffix.lower() == ".npy":
+            mm = np.load(path, mmap_mode="r")
+            if mm.ndim != 2 or np.isfortran(mm):
+                raise ValueError(f"{path.name}: se esperaba un frame 2D en orden C")
+            source = cls(path, mm.dtype, mm.shape, mm.offset)
+            del mm
+            return source
+        if path.suffix.lower() in (".fits", ".fit", ".fts"):
+            return cls(path, *_fits_layout(path))
+        raise ValueError(f"Formato de frame no soportado: {path.name}")
+
+    def read(self, rows=slice(None), cols=slice(None), dtype=np.float32):
+        """Copia en RAM de `frame[rows, cols]`, con BSCALE/BZERO aplicados."""
+        mm = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=self.shape)
+        out = np.array(mm[rows, cols], dtype=dtype)
+        del mm
+        if self.bscale != 1 or self.bzero != 0:
+            out *= self.bscale
+            out += self.bzero
+        return out
+
+
+def frame_snr(frame, step=STATS_STEP):
+    """
+    SNR robusto de un frame: mediana / (1.4826 · MAD) sobre una submuestra
+    de 1 de cada `step`×`step` píxeles. Ignora NaN (bordes tras registrar).
+    """
+    sample = np.asarray(frame[::step, ::step], dtype=np.float32)
+    med = np.nanmedian(sample)
+    sigma = 1.4826 * np.nanmedian(np.abs(sample - med))
+    return float(med / sigma) if sigma > 0 else float("nan")
+
+
+# ----------------------------------------------------------
+# PILA EN DISCO
+# ----------------------------------------------------------
+class FrameStack:
+    """
+    Pila de frames (N, alto, ancho) guardada como `.npy` en disco.
+
+    No mantiene el archivo mapeado: cada `read`/`write`/`read_band` abre un
+    memmap del tramo pedido y lo suelta, de modo que el RSS del proceso no
+    crece con el tamaño de la sesión.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        header = np.load(self.path, mmap_mode="r")
+        self.shape = header.shape
+        self.dtype = header.dtype
+        self.offset = header.offset
+        del header
+
+    @classmethod
+    def create(cls, path, shape, dtype=np.float32):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        mm = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+        del mm
+        return cls(path)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def frame_shape(self):
+        return self.shape[1:]
+
+    def _map(self, first, count, mode):
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        return np.memmap(self.path, dtype=self.dtype, mode=mode,
+                         offset=self.offset + first * frame_bytes,
+                         shape=(count, *self.frame_shape))
+
+    def read(self, i, dtype=np.float32):
+        """Copia en RAM del frame `i`."""
+        mm = self._map(i, 1, "r")
+        out = np.array(mm[0], dtype=dtype)
+        del mm
+        return out
+
+    def write(self, i, frame):
+        mm = self._map(i, 1, "r+")
+        mm[0] = frame
+        mm.flush()
+        del mm
+
+    def sources(self):
+        """Un `FrameSource` por frame de la pila (para `orionlab_stack`)."""
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        return [FrameSource(self.path, self.dtype, self.frame_shape, self.offset + i * frame_bytes)
+                for i in range(len(self))]
+
+    def read_band(self, row0, row1, dtype=np.float32):
+        """Filas `row0:row1` de todos los frames, como arreglo (N, filas, ancho)."""
+        out = np.empty((len(self), row1 - row0, self.frame_shape[1]), dtype=dtype)
+        for i in range(len(self)):
+            mm = self._map(i, 1, "r")
+            out[i] = mm[0, row0:row1]
+            del mm
+        return out
+
+
+# ----------------------------------------------------------
+# DATOS SINTÉTICOS
+# ----------------------------------------------------------
+def synthetic_session(out_dir, n_lights=20, shape=(512, 512), n_bias=10, n_darks=10,
+                      n_flats=10, n_stars=150, max_shift=6, n_trails=0, cosmic_rate=0.0,
+                      max_rotation_deg=0.0, seed=42):
+    """
+    Genera una sesión sintética tipo ASI533 (uint16, `.npy`) con bias, darks,
+    flats (viñeteo) y lights con estrellas gaussianas desplazadas (dithering).
+
+    `n_trails`: lights que reciben una traza satelital recta (para probar
+    rechazo y detección); `cosmic_rate`: fracción de píxeles con rayos cósmicos;
+    `max_rotation_deg`: rotación de campo máxima de cada light respecto del
+    primero (en torno al centro, aplicada antes del desplazamiento).
+
+    Devuelve un dict con listas de rutas por tipo, los desplazamientos
+    reales `(dy, dx)` y rotaciones (grados) de cada light y las trazas
+    `(índice, (y0, x0, y1, x1))`.
+    """
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    h, w = shape
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+
+    bias_level = 500.0
+    hot = rng.random(shape) < 2e-4
+    dark_current = np.where(hot, 400.0, 8.0).astype(np.float32)
+    vignette = (1.0 - 0.35 * (((yy - h / 2) / h) ** 2 + ((xx - w / 2) / w) ** 2) * 4).astype(np.float32)
+
+    star_y = rng.uniform(0, h, n_stars)
+    star_x = rng.uniform(0, w, n_stars)
+    star_flux = rng.lognormal(7.5, 1.0, n_stars)
+    sigma_psf = 1.6
+
+    def _save(kind, i, data):
+        path = out_dir / f"{kind}_{i:03d}.npy"
+        np.save(path, np.clip(data, 0, 65535).astype(np.uint16))
+        return path
+
+    def _read_noise():
+        return rng.normal(0, 3.5, shape)
+
+    paths = {"bias": [], "darks": [], "flats": [], "lights": [], "shifts": [], "rotations": [],
+             "trails": []}
+    trail_frames = set(rng.choice(n_lights, size=min(n_trails, n_lights), replace=False).tolist())
+    for i in range(n_bias):
+        paths["bias"].append(_save("bias", i, bias_level + _read_noise()))
+    for i in range(n_darks):
+        paths["darks"].append(_save("dark", i, bias_level + rng.poisson(dark_current) + _read_noise()))
+    for i in range(n_flats):
+        flat = rng.poisson(20000 * vignette).astype(np.float32)
+        paths["flats"].append(_save("flat", i, bias_level + flat + _read_noise()))
+
+    for i in range(n_lights):
+        dy, dx = (rng.integers(-max_shift, max_shift + 1, 2) if i else (0, 0))
+        rot = float(rng.uniform(-max_rotation_deg, max_rotation_deg)) if i and max_rotation_deg else 0.0
+        c, s = np.cos(np.radians(rot)), np.sin(np.radians(rot))
+        sy, sx = star_y - h / 2, star_x - w / 2
+        sky = np.full(shape, 300.0, dtype=np.float32)
+        for y0, x0, flux in zip(s * sx + c * sy + h / 2 + dy, c * sx - s * sy + w / 2 + dx, star_flux):
+            r0, r1 = int(max(0, y0 - 8)), int(min(h, y0 + 9))
+            c0, c1 = int(max(0, x0 - 8)), int(min(w, x0 + 9))
+            if r0 >= r1 or c0 >= c1:
+                continue
+            g = np.exp(-((yy[r0:r1, c0:c1] - y0) ** 2 + (xx[r0:r1, c0:c1] - x0) ** 2)
+                       / (2 * sigma_psf ** 2))
+            sky[r0:r1, c0:c1] += flux * g / (2 * np.pi * sigma_psf ** 2)
+        if i in trail_frames:
+            # Traza de borde a borde, ~2 px de ancho
+            y0, y1 = rng.uniform(0, h, 2)
+            t = np.linspace(0, 1, 2 * max(h, w))
+            ty = np.clip((y0 + (y1 - y0) * t).astype(int), 0, h - 1)
+            tx = np.clip((w - 1) * t, 0, w - 1).astype(int)
+            for off in (0, 1):
+                sky[np.clip(ty + off, 0, h - 1), tx] += 2500.0
+            paths["trails"].append((i, (float(y0), 0.0, float(y1), float(w - 1))))
+        light = rng.poisson(sky * vignette + dark_current) + bias_level + _read_noise()
+        if cosmic_rate:
+            hits = rng.random(shape) < cosmic_rate
+            light[hits] += rng.uniform(2000, 20000, int(hits.sum()))
+        paths["lights"].append(_save("light", i, light))
+        paths["shifts"].append((int(dy), int(dx)))
+        paths["rotations"].append(rot)
+    return paths
@@ -0,0 +1,354 @@
+"""
+orionlab_gradient.py
+
+Modelado y resta del gradiente de fondo (contaminación lumínica) para el
+estudio P11.
+
+Por sub:
+
+1. Muestreo del fondo en una grilla de cajas de `GRADIENT_BOX`×`GRADIENT_BOX`
+   px: la imagen (submuestreada cada `SAMPLE_STEP` px) se reordena como un
+   cubo (píxeles de la caja, celdas en y, celdas en x) y se reduce de una vez
+   con el sigma clipping de `orionlab_stack` (las estrellas se rechazan).
+2. Ajuste por mínimos cuadrados de una superficie suave a las cajas:
+   - poly  polinomio 2D de orden `POLY_ORDER` (por defecto 2)
+   - rbf   thin-plate spline (RBF r²·log r + plano) con suavizado
+   Las cajas con residuo > `REJECT_SIGMA`·σ (nebulosa, galaxia, halos de
+   estrellas brillantes) se descartan y se vuelve a ajustar.
+3. Resta de la superficie conservando su mediana como pedestal, para que el
+   sub siga en ADU comparables.
+
+El polinomio se evalúa en el frame completo como producto de dos matrices de
+Vandermonde (filas × coeficientes × columnas); el RBF se evalúa en una malla
+de `RBF_EVAL_BOX` px y se interpola bilinealmente.
+
+El perfil P11 (`angle_deg, radius_pix, background_ADU`) se toma del modelo
+desde el centro del frame: ángulos cada `PROFILE_ANGLE_STEP`° (0° = +x,
+antihorario con las filas hacia arriba) y radios cada `PROFILE_RADIUS_STEP`
+px hasta el borde. Con varios subs (una noche completa) cada sub se procesa
+en un pool de hilos y la tabla guarda la mediana por punto.
+
+Uso:
+    python orionlab_gradient.py noche/*.fits --table               # perfil P11 de la noche
+    python orionlab_gradient.py stacked.fits --method rbf --out stacked_flat.npy
+    python orionlab_gradient.py --demo 8 --table /tmp/p11.csv
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource, save_frame
+from orionlab_register import upsample_grid
+from orionlab_stack import combine_sigma_clip
+
+TABLE_FIELDS = ["angle_deg", "radius_pix", "background_ADU"]
+
+# Estudio P11 (nombre actual y nombre del generador batch)
+P11_DIRS = ["p11_detec_gradiente", "p11_gradient_detection_lp"]
+TABLE_NAME = "gradient_profiles.csv"
+
+GRADIENT_METHODS = ("poly", "rbf")
+
+# Muestreo del fondo
+GRADIENT_BOX = 64
+SAMPLE_STEP = 2
+CLIP_SIGMA = 3.0
+
+# Ajuste
+POLY_ORDER = 2
+RBF_SMOOTHING = 1e-3     # regularización relativa a la escala de la matriz de kernel
+RBF_EVAL_BOX = 32
+REJECT_SIGMA = 3.0
+REJECT_ITERS = 3
+MIN_CELLS = 6
+
+# Perfil P11
+PROFILE_ANGLE_STEP = 15
+PROFILE_RADIUS_STEP = 100
+
+_EVAL_CHUNK = 4096
+
+
+# ----------------------------------------------------------
+# MUESTREO DEL FONDO
+# ----------------------------------------------------------
+def sample_background(image, box=GRADIENT_BOX, sigma=CLIP_SIGMA, step=SAMPLE_STEP):
+    """
+    Fondo por cajas de `box`×`box` px con sigma clipping, tomando un píxel de
+    cada `step`. Devuelve `(yc, xc, values)`: centros de fila y columna de las
+    cajas (px del frame) y la grilla de valores `(ny, nx)`; las cajas sin
+    datos quedan en NaN. Los bordes que no completan una caja se ignoran.
+    """
+    img = np.asarray(image, dtype=np.float32)[::step, ::step]
+    b = max(1, box // step)
+    ny, nx = img.shape[0] // b, img.shape[1] // b
+    if not ny or not nx:
+        raise ValueError(f"Imagen {np.shape(image)} menor que una caja de {box} px")
+    cube = img[:ny * b, :nx * b].reshape(ny, b, nx, b).transpose(1, 3, 0, 2).reshape(b * b, ny, nx)
+    values = combine_sigma_clip(cube, sigma)
+    size = b * step
+    yc = np.arange(ny) * size + (size - 1) / 2
+    xc = np.arange(nx) * size + (size - 1) / 2
+    return yc, xc, values
+
+
+# ----------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------
+def _poly_terms(order):
+    """Exponentes (i, j) de u^i·v^j con i + j ≤ order."""
+    return [(i, total - i) for total in range(order + 1) for i in range(total, -1, -1)]
+
+
+def _tps_kernel(d2):
+    """Thin-plate spline r²·log r, escrito con r² (= ½·r²·log r²)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 0.5 * d2 * np.log(d2)
+    return np.where(d2 > 0, k, 0.0)
+
+
+class GradientModel:
+    """
+    Superficie de fondo ajustada a un frame `shape`. Las coordenadas se
+    normalizan a u = (x - cx)/escala, v = (y - cy)/escala con la escala en
+    el semilado mayor, así los coeficientes no dependen del tamaño del sensor.
+    """
+
+    def __init__(self, method, shape, coeffs, order=POLY_ORDER, centers=None, n_cells=0, n_rejected=0):
+        self.method = method
+        self.shape = tuple(shape)
+        self.coeffs = np.asarray(coeffs, dtype=np.float64)
+        self.order = order
+        self.centers = centers
+        self.n_cells = n_cells
+        self.n_rejected = n_rejected
+
+    def _normalize(self, y, x):
+        h, w = self.shape
+        scale = max(h, w) / 2
+        return (np.asarray(x, dtype=np.float64) - (w - 1) / 2) / scale, \
+            (np.asarray(y, dtype=np.float64) - (h - 1) / 2) / scale
+
+    def __call__(self, y, x):
+        """Fondo del modelo en los píxeles (y, x) (escalares o arreglos que se difunden)."""
+        u, v = np.broadcast_arrays(*self._normalize(y, x))
+        if self.method == "poly":
+            return sum(c * u ** i * v ** j for c, (i, j) in zip(self.coeffs, _poly_terms(self.order)))
+        flat_u, flat_v = u.ravel(), v.ravel()
+        out = np.empty(flat_u.size)
+        weights, plane = self.coeffs[:-3], self.coeffs[-3:]
+        for s in range(0, flat_u.size, _EVAL_CHUNK):
+            cu, cv = flat_u[s:s + _EVAL_CHUNK], flat_v[s:s + _EVAL_CHUNK]
+            d2 = (cu[:, None] - self.centers[:, 0]) ** 2 + (cv[:, None] - self.centers[:, 1]) ** 2
+            out[s:s + _EVAL_CHUNK] = _tps_kernel(d2) @ weights + plane[0] + plane[1] * cu + plane[2] * cv
+        return out.reshape(u.shape)
+
+    def surface(self, dtype=np.float32):
+        """Superficie completa `shape` del frame."""
+        h, w = self.shape
+        if self.method == "poly":
+            u, v = self._normalize(np.arange(h), np.arange(w))
+            c = np.zeros((self.order + 1, self.order + 1))
+            for coeff, (i, j) in zip(self.coeffs, _poly_terms(self.order)):
+                c[j, i] = coeff
+            # Σ c_ji·v^j·u^i = V_y · C · V_xᵀ
+            return (np.vander(v, self.order + 1, increasing=True) @ c
+                    @ np.vander(u, self.order + 1, increasing=True).T).astype(dtype)
+        box = RBF_EVAL_BOX
+        ny, nx = math.ceil(h / box), math.ceil(w / box)
+        centers = np.arange(max(ny, nx)) * box + (box - 1) / 2
+        grid = self(centers[:ny, None], centers[None, :nx]).astype(np.float32)
+        return upsample_grid(grid, (h, w), box).astype(dtype, copy=False)
+
+    def amplitude_pct(self):
+        """Variación pico a pico del modelo en el frame, en % de su mediana."""
+        s = self.surface()
+        med = float(np.median(s))
+        return 100.0 * float(s.max() - s.min()) / med if med else float("nan")
+
+
+def _solve_poly(u, v, f, order):
+    design = np.stack([u ** i * v ** j for i, j in _poly_terms(order)], axis=1)
+    coeffs, *_ = np.linalg.lstsq(design, f, rcond=None)
+    return coeffs, design @ coeffs
+
+
+def _solve_rbf(u, v, f, smoothing):
+    n = len(f)
+    centers = np.stack([u, v], axis=1)
+    k = _tps_kernel((u[:, None] - u) ** 2 + (v[:, None] - v) ** 2)
+    p = np.stack([np.ones(n), u, v], axis=1)
+    scale = np.abs(k).mean() or 1.0
+    system = np.zeros((n + 3, n + 3))
+    system[:n, :n] = k + smoothing * scale * np.eye(n)
+    system[:n, n:] = p
+    system[n:, :n] = p.T
+    coeffs = np.linalg.solve(system, np.concatenate([f, np.zeros(3)]))
+    return coeffs, centers, k @ coeffs[:n] + p @ coeffs[n:]
+
+
+def fit_gradient(image, method="poly", order=POLY_ORDER, box=GRADIENT_BOX, sigma=CLIP_SIGMA,
+                 step=SAMPLE_STEP, smoothing=RBF_SMOOTHING, reject_sigma=REJECT_SIGMA):
+    """
+    Ajusta un `GradientModel` al fondo de `image` (`method` en
+    `GRADIENT_METHODS`). Las cajas atípicas se rechazan de forma iterativa
+    con σ = 1,4826·MAD de los residuos.
+    """
+    if method not in GRADIENT_METHODS:
+        raise ValueError(f"Método desconocido: {method!r} (opciones: {list(GRADIENT_METHODS)})")
+    shape = np.shape(image)
+    yc, xc, values = sample_background(image, box, sigma, step)
+    model = GradientModel(method, shape, [], order)
+    u, v = model._normalize(*np.meshgrid(yc, xc, indexing="ij"))
+    u, v, f = u.ravel(), v.ravel(), values.ravel().astype(np.float64)
+    keep = np.isfinite(f)
+    n_cells = int(keep.sum())
+    needed = max(MIN_CELLS, len(_poly_terms(order)) if method == "poly" else 4)
+    if n_cells < needed:
+        raise ValueError(f"Sólo {n_cells} cajas con fondo válido (mínimo {needed})")
+
+    for _ in range(REJECT_ITERS + 1):
+        if method == "poly":
+            coeffs, fitted = _solve_poly(u[keep], v[keep], f[keep], order)
+            centers = None
+        else:
+            coeffs, centers, fitted = _solve_rbf(u[keep], v[keep], f[keep], smoothing)
+        resid = f[keep] - fitted
+        spread = 1.4826 * np.median(np.abs(resid - np.median(resid)))
+        bad = np.abs(resid) > reject_sigma * spread if spread > 0 else np.zeros(resid.shape, bool)
+        if not bad.any() or keep.sum() - bad.sum() < needed:
+            break
+        keep[np.flatnonzero(keep)[bad]] = False
+
+    return GradientModel(method, shape, coeffs, order, centers, n_cells, n_cells - int(keep.sum()))
+
+
+def subtract_gradient(image, model=None, **fit_kwargs):
+    """
+    Resta el gradiente de `image` conservando la mediana del modelo como
+    pedestal. Devuelve `(corregida float32, modelo)`.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    model = model or fit_gradient(image, **fit_kwargs)
+    surface = model.surface()
+    pedestal = np.float32(np.median(surface))
+    surface -= pedestal
+    return image - surface, model
+
+
+# ----------------------------------------------------------
+# PERFIL P11
+# ----------------------------------------------------------
+def profile_points(shape, angle_step=PROFILE_ANGLE_STEP, radius_step=PROFILE_RADIUS_STEP):
+    """`(ángulos, radios, y, x)` del perfil: cada radio múltiplo de `radius_step` que cae dentro del frame."""
+    h, w = shape
+    cy, cx = (h - 1) / 2, (w - 1) / 2
+    angles = np.arange(0, 360, angle_step)
+    radii = np.arange(radius_step, math.hypot(h, w) / 2 + 1, radius_step)
+    a, r = np.meshgrid(angles, radii, indexing="ij")
+    y = cy - r * np.sin(np.radians(a))
+    x = cx + r * np.cos(np.radians(a))
+    inside = (y >= 0) & (y <= h - 1) & (x >= 0) & (x <= w - 1)
+    return a[inside], r[inside], y[inside], x[inside]
+
+
+def gradient_profile(model, angle_step=PROFILE_ANGLE_STEP, radius_step=PROFILE_RADIUS_STEP):
+    """Fondo del modelo en los puntos del perfil, `(ángulos, radios, fondo)`."""
+    a, r, y, x = profile_points(model.shape, angle_step, radius_step)
+    return a, r, model(y, x)
+
+
+def _sub_profile(path, kwargs, angle_step, radius_step):
+    model = fit_gradient(FrameSource.open(path).read(), **kwargs)
+    return model, gradient_profile(model, angle_step, radius_step)
+
+
+def night_profile(subs, threads=None, angle_step=PROFILE_ANGLE_STEP, radius_step=PROFILE_RADIUS_STEP,
+                  **fit_kwargs):
+    """
+    Ajusta el gradiente de cada sub (pool de hilos) y devuelve
+    `(filas P11 con la mediana por punto, modelos)`. Todos los subs deben
+    tener el mismo tamaño.
+    """
+    subs = [Path(p) for p in subs]
+    threads = threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda p: _sub_profile(p, fit_kwargs, angle_step, radius_step), subs))
+    models = [m for m, _ in results]
+    if len({m.shape for m in models}) > 1:
+        raise ValueError("Los subs de la noche tienen tamaños distintos")
+    angles, radii, _ = results[0][1]
+    background = np.median(np.stack([p[2] for _, p in results]), axis=0)
+    rows = [{"angle_deg": int(a), "radius_pix": int(r), "background_ADU": round(float(b), 1)}
+            for a, r, b in zip(angles, radii, background)]
+    return rows, models
+
+
+def write_p11_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P11_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, TABLE_FIELDS, csv_path)
+    print(f"✅ Tabla P11: {csv_path}")
+    return csv_path
+
+
+def _demo_subs(n_subs, seed=42):
+    from orionlab_frames import synthetic_session
+
+    root = Path(tempfile.mkdtemp(prefix="orionlab_p11_demo_"))
+    session = synthetic_session(root, n_lights=n_subs, shape=(1024, 1024), n_bias=0, n_darks=0,
+                                n_flats=0, seed=seed)
+    return session["lights"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modelado del gradiente de fondo y perfil P11.")
+    parser.add_argument("subs", nargs="*", type=Path, help="Subs o apilado (.npy/.fits).")
+    parser.add_argument("--method", choices=GRADIENT_METHODS, default="poly")
+    parser.add_argument("--order", type=int, default=POLY_ORDER, help="Orden del polinomio.")
+    parser.add_argument("--box", type=int, default=GRADIENT_BOX, help="Lado de las cajas de fondo (px).")
+    parser.add_argument("--step", type=int, default=SAMPLE_STEP, help="Submuestreo dentro de las cajas.")
+    parser.add_argument("--sigma", type=float, default=CLIP_SIGMA)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--out", type=Path, help="Con un solo frame: guarda el frame corregido.")
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Escribe la tabla P11 (por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--demo", type=int, metavar="N", help="N subs sintéticos con viñeteo.")
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        args.subs = _demo_subs(args.demo)
+    elif not args.subs:
+        parser.error("indique los subs o use --demo")
+    fit_kwargs = dict(method=args.method, order=args.order, box=args.box, sigma=args.sigma, step=args.step)
+
+    if args.out:
+        if len(args.subs) != 1:
+            parser.error("--out requiere un solo frame")
+        corrected, model = subtract_gradient(FrameSource.open(args.subs[0]).read(), **fit_kwargs)
+        save_frame(args.out, corrected)
+        print(f"✅ Gradiente {model.amplitude_pct():.1f} % ({model.n_rejected}/{model.n_cells} cajas "
+              f"rechazadas) → {args.out}")
+        return 0
+
+    print(f"🚀 Gradiente ({args.method}) en {len(args.subs)} subs")
+    rows, models = night_profile(args.subs, args.threads, **fit_kwargs)
+    for path, model in zip(args.subs, models):
+        print(f"  ✅ {Path(path).name}: gradiente {model.amplitude_pct():5.1f} %  "
+              f"({model.n_rejected}/{model.n_cells} cajas rechazadas)")
+    if args.table is not None:
+        write_p11_table(rows, args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
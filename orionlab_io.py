@@ -0,0 +1,251 @@
+"""
+orionlab_io.py
+
+Capa común de lectura/escritura para las tablas `data/` de los estudios pXX.
+
+Cada tabla se sigue escribiendo como CSV (formato versionado en Git) y, si
+`pyarrow` está instalado, también como Parquet al lado del CSV
+(`tabla.csv` → `tabla.parquet`). En el Parquet las columnas categóricas
+(`camera`, `filter`, `cielo`, ...) quedan codificadas como diccionario.
+
+Los lectores aceptan proyección de columnas y filtros; con Parquet los filtros
+se empujan al lector (sólo se decodifican los row groups y columnas pedidos),
+con CSV se aplican después de leer únicamente las columnas necesarias.
+
+Uso:
+    from orionlab_io import write_table, read_table
+    write_table(df, DATA_DIR / "p06_thermal_noise_experiments.csv", categorical=["cielo"])
+    df = read_table(path, columns=["frames", "snr"], filters=[("cielo", "==", "Elqui")])
+"""
+
+import csv
+import functools
+import importlib.util
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# pyarrow es opcional (sin él sólo se escribe/lee CSV) y se importa dentro de
+# las funciones que lo usan, como pandas: importarlo cuesta ~150 ms.
+
+# Tamaño de row group: suficientemente chico para que los filtros salten bloques
+ROW_GROUP_SIZE = 64_000
+
+_OPS = {
+    "==": lambda s, v: s == v,
+    "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v,
+    "<=": lambda s, v: s <= v,
+    ">": lambda s, v: s > v,
+    ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(list(v)),
+    "not in": lambda s, v: ~s.isin(list(v)),
+}
+
+
+def study_dir(*names):
+    """
+    Carpeta de un estudio pXX en el repo.
+
+    Los generadores originales usan nombres en inglés y `fix_orionlab_names.py`
+    los renombra; se devuelve la primera de `names` que exista (o la primera
+    si ninguna existe todavía).
+    """
+    for name in names:
+        if (ROOT / name).exists():
+            return ROOT / name
+    return ROOT / names[0]
+
+
+@functools.lru_cache(maxsize=None)
+def has_parquet():
+    """Indica si el backend columnar (pyarrow) está instalado, sin importarlo."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parquet_path(csv_path):
+    """Ruta del Parquet hermano de un CSV."""
+    return Path(csv_path).with_suffix(".parquet")
+
+
+def _auto_categorical(df):
+    """Columnas de texto con pocos valores distintos (candidatas a diccionario)."""
+    cols = []
+    for col in df.columns:
+        if df[col].dtype == object or str(df[col].dtype) in ("string", "str"):
+            if df[col].nunique(dropna=True) <= max(1, len(df) // 2):
+                cols.append(col)
+    return cols
+
+
+# ----------------------------------------------------------
+# ESCRITURA
+# ----------------------------------------------------------
+def write_table(df, csv_path, categorical=None, parquet=True):
+    """
+    Escribe un DataFrame como CSV y, si es posible, como Parquet tipado.
+
+    `categorical`: columnas a codificar como diccionario; por defecto se
+    detectan las columnas de texto de baja cardinalidad.
+    Devuelve la ruta del Parquet escrito, o None si sólo se escribió CSV.
+    """
+    csv_path = Path(csv_path)
+    df.to_csv(csv_path, index=False)
+
+    if not (parquet and has_parquet()):
+        return None
+
+    if categorical is None:
+        categorical = _auto_categorical(df)
+    typed = df.copy()
+    for col in categorical:
+        typed[col] = typed[col].astype("category")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    out = parquet_path(csv_path)
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    pq.write_table(table, out, row_group_size=ROW_GROUP_SIZE)
+    return out
+
+
+def write_rows(rows, fieldnames, csv_path, categorical=None, parquet=True):
+    """
+    Variante sin pandas de `write_table` para listas de dicts (`csv.DictWriter`).
+
+    Pensada para los scripts que sólo generan tablas chicas y no deben pagar el
+    costo de importar pandas.
+    """
+    csv_path = Path(csv_path)
+    with csv_path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    if not (parquet and has_parquet()):
+        return None
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = {name: [row.get(name) for row in rows] for name in fieldnames}
+    table = pa.table(columns)
+    if categorical is None:
+        categorical = [
+            name for name in fieldnames
+            if pa.types.is_string(table.schema.field(name).type)
+            and len(set(columns[name])) <= max(1, len(rows) // 2)
+        ]
+    for name in categorical:
+        idx = table.schema.get_field_index(name)
+        table = table.set_column(idx, name, table.column(name).dictionary_encode())
+
+    out = parquet_path(csv_path)
+    pq.write_table(table, out, row_group_size=ROW_GROUP_SIZE)
+    return out
+
+
+class TableWriter:
+    """
+    Escritor incremental CSV + Parquet para tablas generadas por chunks.
+
+    Uso:
+        with TableWriter(path, categorical=["camera"]) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, csv_path, categorical=(), parquet=True):
+        self.csv_path = Path(csv_path)
+        self.categorical = list(categorical)
+        self.parquet = parquet and has_parquet()
+        self.n_rows = 0
+        self._csv = None
+        self._pq = None
+        self._schema = None
+
+    def __enter__(self):
+        self._csv = self.csv_path.open("w", newline="", encoding="utf-8")
+        return self
+
+    def write(self, df):
+        df.to_csv(self._csv, header=(self.n_rows == 0), index=False)
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._schema is None:
+                # Esquema fijo para todos los chunks: diccionario int32 → string
+                fields = [
+                    pa.field(f.name, pa.dictionary(pa.int32(), pa.string()))
+                    if f.name in self.categorical else f
+                    for f in table.schema
+                ]
+                self._schema = pa.schema(fields)
+                self._pq = pq.ParquetWriter(parquet_path(self.csv_path), self._schema)
+            self._pq.write_table(table.cast(self._schema), row_group_size=ROW_GROUP_SIZE)
+        self.n_rows += len(df)
+
+    def __exit__(self, *exc):
+        if self._csv is not None:
+            self._csv.close()
+        if self._pq is not None:
+            self._pq.close()
+        return False
+
+
+# ----------------------------------------------------------
+# LECTURA
+# ----------------------------------------------------------
+def _use_parquet(csv_path):
+    """Usa el Parquet sólo si existe y no es más antiguo que el CSV."""
+    pq_file = parquet_path(csv_path)
+    if not (has_parquet() and pq_file.exists()):
+        return False
+    csv_path = Path(csv_path)
+    return not csv_path.exists() or pq_file.stat().st_mtime >= csv_path.stat().st_mtime
+
+
+def _apply_filters(df, filters):
+    mask = None
+    for col, op, value in filters:
+        cond = _OPS[op](df[col], value)
+        mask = cond if mask is None else (mask & cond)
+    return df if mask is None else df[mask]
+
+
+def read_table(csv_path, columns=None, filters=None):
+    """
+    Lee una tabla `data/` con proyección de columnas y filtros.
+
+    `filters`: lista de tuplas `(columna, operador, valor)` combinadas con AND,
+    con operadores `==, !=, <, <=, >, >=, in, not in`.
+    Si existe un Parquet vigente se lee con pushdown; si no, se lee el CSV
+    restringido a las columnas necesarias.
+    """
+    import pandas as pd
+
+    filters = list(filters or [])
+    for _, op, _ in filters:
+        if op not in _OPS:
+            raise ValueError(f"Operador de filtro no soportado: {op!r}")
+
+    if _use_parquet(csv_path):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(parquet_path(csv_path), columns=columns,
+                              filters=filters or None)
+        return table.to_pandas()
+
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+    # Sólo "" es nulo: valores como "None" (filtro de P05) deben leerse como texto,
+    # igual que desde Parquet.
+    df = pd.read_csv(csv_path, usecols=usecols, keep_default_na=False, na_values=[""])
+    df = _apply_filters(df, filters).reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
@@ -0,0 +1,400 @@
+"""
+orionlab_photometry.py
+
+Fotometría de apertura vectorizada para el estudio P08 (cúmulos abiertos:
+NGC 4755, NGC 2516, IC 2602 y NGC 3532).
+
+Para miles de estrellas a la vez, sin un ciclo de Python por estrella:
+
+1. Posiciones de `orionlab_register.detect_stars` en el frame V (o las que
+   se entreguen). El frame B se mide en las mismas posiciones, llevadas con
+   la transformación entre ambos si no están alineados (`--align`).
+2. FWHM por estrella: ventana de (2·`FWHM_RADIUS`+1)² px, cielo con la
+   mediana del borde de la ventana y ajuste gaussiano circular linealizado
+   (ln I = a - r²/2σ², mínimos cuadrados pesados por I²), resuelto en forma
+   cerrada para todas las estrellas.
+3. Apertura de radio `APERTURE_FWHM`·FWHM (mediana del campo) y anillo de
+   cielo entre `ANNULUS_FWHM` FWHM. Las máscaras de apertura con peso
+   sub-píxel (fracción de cada píxel dentro del círculo, supermuestreo
+   `SUBPIXEL`²) se precalculan para `PHASES`×`PHASES` posiciones
+   fraccionarias del centro; cada estrella usa la de su fase. Las ventanas
+   de todas las estrellas se recogen con una sola indexación avanzada
+   `(N, B, B)` por bloque y el cielo es la mediana del anillo (σ por MAD).
+
+SNR con la ecuación del CCD: F / √(F/g + n_ap·σ² + n_ap²·σ²/n_anillo).
+Magnitudes instrumentales m = ZP - 2,5·log10(F / t_exp).
+
+Uso:
+    python orionlab_photometry.py --cluster "NGC 3532" --v ngc3532_V.fits --b ngc3532_B.fits --table
+    python orionlab_photometry.py --cluster "IC 2602" --v V.fits --b B.fits --align --zp-v 24.1 --zp-b 23.7
+    python orionlab_photometry.py --cluster "NGC 3532" --v V.fits --b B.fits --psf moffat --table
+    python orionlab_photometry.py --demo "NGC 4755" --table /tmp/p08.csv
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource, read_header
+from orionlab_register import detect_stars, match_stars
+
+TABLE_FIELDS = ["cluster", "star_id", "mag_V", "mag_B", "snr", "fwhm_pix"]
+
+# Estudio P08 (nombre actual y nombre del generador batch)
+P08_DIRS = ["p08_fotometria_cumulos_abiertos", "p08_photometry_open_clusters"]
+TABLE_NAME = "photometry_open_clusters.csv"
+P08_CLUSTERS = ("NGC 4755", "NGC 2516", "IC 2602", "NGC 3532")
+_P08_TYPES = {"star_id": int, "mag_V": float, "mag_B": float, "snr": float, "fwhm_pix": float}
+
+# Detección
+DETECT_SIGMA = 5.0
+MAX_STARS = 5000
+
+# FWHM
+FWHM_RADIUS = 6
+FWHM_MIN, FWHM_MAX = 0.8, 15.0
+
+# Apertura y anillo, en unidades de la FWHM mediana del campo
+APERTURE_FWHM = 1.5
+ANNULUS_FWHM = (3.0, 5.0)
+SUBPIXEL = 5
+PHASES = 8
+
+# Cámara y calibración
+GAIN_E_ADU = 1.0
+ZERO_POINT = 25.0
+SATURATION_ADU = 65000
+
+STAR_BLOCK = 2048
+
+
+# ----------------------------------------------------------
+# MÁSCARAS DE APERTURA
+# ----------------------------------------------------------
+@lru_cache(maxsize=16)
+def aperture_masks(radius, half, phases=PHASES, oversample=SUBPIXEL):
+    """
+    Pesos `(fases, fases, 2·half+1, 2·half+1)`: fracción de cada píxel dentro
+    de un círculo de `radius` px cuyo centro está desplazado
+    `(k + 0,5)/fases - 0,5` px (fase k) del píxel central.
+    """
+    offsets = np.arange(-half, half + 1)
+    sub = (np.arange(oversample) + 0.5) / oversample - 0.5
+    shift = (np.arange(phases) + 0.5) / phases - 0.5
+    # (fase, píxel, sub-píxel): distancia al centro en un eje
+    a = (offsets[None, :, None] + sub[None, None, :]) - shift[:, None, None]
+    a2 = a * a
+    inside = (a2[:, :, :, None, None, None] + a2[None, None, None, :, :, :]) <= radius * radius
+    masks = inside.mean(axis=(2, 5))                      # (fy, py, fx, px)
+    return np.ascontiguousarray(masks.transpose(0, 2, 1, 3), dtype=np.float32)
+
+
+def _ring(half, r_in, r_out):
+    """Píxeles (índices planos) del anillo [r_in, r_out] en una ventana de lado 2·half+1."""
+    off = np.arange(-half, half + 1)
+    r = np.hypot(off[:, None], off[None, :])
+    return np.flatnonzero((r >= r_in) & (r <= r_out))
+
+
+def _gather(image, yx, half):
+    """
+    Ventanas `(N, 2·half+1, 2·half+1)` centradas en el píxel más cercano a
+    cada estrella, la fase sub-píxel `(N, 2)` y la máscara de estrellas cuya
+    ventana cabe en el frame.
+    """
+    h, w = image.shape
+    center = np.floor(yx + 0.5).astype(np.int64)
+    frac = yx - center
+    inside = ((center[:, 0] >= half) & (center[:, 0] < h - half)
+              & (center[:, 1] >= half) & (center[:, 1] < w - half))
+    off = np.arange(-half, half + 1)
+    rows = np.clip(center[:, 0], half, h - half - 1)[:, None, None] + off[None, :, None]
+    cols = np.clip(center[:, 1], half, w - half - 1)[:, None, None] + off[None, None, :]
+    return np.asarray(image[rows, cols], dtype=np.float32), frac, inside
+
+
+# ----------------------------------------------------------
+# FWHM
+# ----------------------------------------------------------
+def fit_fwhm(image, yx, radius=FWHM_RADIUS):
+    """
+    FWHM (px) por estrella con un ajuste gaussiano circular linealizado.
+    NaN si la ventana sale del frame o el ajuste no converge a un perfil.
+    """
+    patches, frac, inside = _gather(image, np.asarray(yx, dtype=np.float64), radius)
+    n = len(patches)
+    edge = np.ones((2 * radius + 1,) * 2, dtype=bool)
+    edge[1:-1, 1:-1] = False
+    sky = np.median(patches[:, edge], axis=1)
+    values = patches - sky[:, None, None]
+
+    off = np.arange(-radius, radius + 1)
+    dy = off[None, :, None] - frac[:, 0, None, None]
+    dx = off[None, None, :] - frac[:, 1, None, None]
+    r2 = dy * dy + dx * dx
+    use = (values > 0) & (r2 <= (radius - 1) ** 2)
+    # Perfiles saturados (meseta) sesgan la FWHM: se omite el núcleo plano
+    use &= patches < SATURATION_ADU
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_i = np.where(use, np.log(np.where(use, values, 1)), 0)
+    wgt = np.where(use, values * values, 0).reshape(n, -1).astype(np.float64)
+    r2, log_i = r2.reshape(n, -1), log_i.reshape(n, -1)
+    s0, s1, s2 = wgt.sum(1), (wgt * r2).sum(1), (wgt * r2 * r2).sum(1)
+    t0, t1 = (wgt * log_i).sum(1), (wgt * r2 * log_i).sum(1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (s0 * t1 - s1 * t0) / (s0 * s2 - s1 * s1)
+        fwhm = 2 * math.sqrt(2 * math.log(2)) * np.sqrt(-1 / (2 * slope))
+    ok = inside & (use.reshape(n, -1).sum(1) >= 5) & (fwhm >= FWHM_MIN) & (fwhm <= FWHM_MAX)
+    return np.where(ok, fwhm, np.nan)
+
+
+# ----------------------------------------------------------
+# FOTOMETRÍA DE APERTURA
+# ----------------------------------------------------------
+def _measure_block(image, yx, aperture, annulus, gain):
+    half = int(math.ceil(annulus[1])) + 1
+    patches, frac, inside = _gather(image, yx, half)
+    n = len(patches)
+    phase = np.clip(np.floor((frac + 0.5) * PHASES).astype(np.int64), 0, PHASES - 1)
+    weights = aperture_masks(float(aperture), half)[phase[:, 0], phase[:, 1]]   # (N, B, B)
+
+    ring = patches.reshape(n, -1)[:, _ring(half, *annulus)]
+    sky = np.median(ring, axis=1)
+    sky_sigma = 1.4826 * np.median(np.abs(ring - sky[:, None]), axis=1)
+    area = weights.sum(axis=(1, 2))
+    flux = np.einsum("nij,nij->n", weights, patches) - area * sky
+    saturated = ((patches >= SATURATION_ADU) & (weights > 0)).any(axis=(1, 2))
+
+    var = np.maximum(flux, 0) / gain + area * sky_sigma ** 2 + area ** 2 * sky_sigma ** 2 / ring.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr = flux / np.sqrt(var)
+    return {
+        "flux": np.where(inside, flux, np.nan),
+        "flux_err": np.where(inside, np.sqrt(var), np.nan),
+        "sky": sky,
+        "sky_sigma": sky_sigma,
+        "snr": np.where(inside, snr, np.nan),
+        "saturated": saturated,
+    }
+
+
+def aperture_photometry(image, yx, aperture, annulus, gain=GAIN_E_ADU, threads=None, block=STAR_BLOCK):
+    """
+    Flujo (ADU sobre el cielo), error, cielo, σ del cielo, SNR y saturación
+    por estrella; bloques de `block` estrellas en un pool de hilos.
+    """
+    yx = np.asarray(yx, dtype=np.float64).reshape(-1, 2)
+    if aperture >= annulus[0] or annulus[0] >= annulus[1]:
+        raise ValueError(f"Se requiere apertura < anillo interior < exterior ({aperture}, {annulus})")
+    starts = range(0, len(yx), block)
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+        parts = list(pool.map(lambda s: _measure_block(image, yx[s:s + block], aperture, annulus, gain),
+                              starts))
+    if not parts:
+        return {k: np.empty(0) for k in ("flux", "flux_err", "sky", "sky_sigma", "snr", "saturated")}
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def instrumental_mag(flux, exptime=1.0, zero_point=ZERO_POINT):
+    """m = ZP - 2,5·log10(F / t_exp); NaN si el flujo no es positivo."""
+    flux = np.asarray(flux, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(flux > 0, zero_point - 2.5 * np.log10(flux / exptime), np.nan)
+
+
+def _exptime(path):
+    header = read_header(path) if path is not None else {}
+    return float(header.get("EXPTIME", header.get("EXPOSURE", 1.0)))
+
+
+def measure_cluster(v_image, b_image, cluster, v_exptime=1.0, b_exptime=1.0, zp_v=ZERO_POINT,
+                    zp_b=ZERO_POINT, align=False, aperture=None, gain=GAIN_E_ADU, sigma=DETECT_SIGMA,
+                    max_stars=MAX_STARS, threads=None, psf=None):
+    """
+    Fotometría V y B de un campo de cúmulo. Devuelve filas P08 (ordenadas
+    por mag_V, con star_id correlativo) y un resumen con tiempos y
+    radios usados. Con `psf` ("gaussian" o "moffat") se mide por ajuste de
+    PSF (`orionlab_psf`) en vez de apertura, para campos densos.
+    """
+    t0 = time.perf_counter()
+    stars = detect_stars(v_image, sigma=sigma, max_stars=max_stars)
+    yx_v = stars[:, :2]
+    to_b = None
+    if align:
+        transform = match_stars(stars[:200], detect_stars(b_image, sigma=sigma, max_stars=200))
+        if transform is None:
+            raise ValueError("No se pudo alinear el frame B con el V (pocas estrellas en común)")
+        to_b = transform.inverse()
+    t_detect = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fwhm = fit_fwhm(v_image, yx_v)
+    # FWHM del campo con el cuarto más brillante: en las débiles el ruido la infla
+    bright = fwhm[:max(10, len(fwhm) // 4)]
+    field_fwhm = float(np.nanmedian(bright)) if np.isfinite(bright).any() else 3.0
+    if psf:
+        from orionlab_psf import MIN_SEPARATION_FWHM, psf_photometry
+
+        # Campo denso: se vuelve a detectar sin descartar vecinas cercanas
+        yx_v = detect_stars(v_image, sigma=sigma, max_stars=max_stars,
+                            min_separation=MIN_SEPARATION_FWHM * field_fwhm)[:, :2]
+        yx_b = to_b.apply(yx_v) if to_b else yx_v
+        v = psf_photometry(v_image, yx_v, psf, field_fwhm, gain=gain, exptime=v_exptime, zero_point=zp_v,
+                           threads=threads)
+        b = psf_photometry(b_image, yx_b, psf, field_fwhm, gain=gain, exptime=b_exptime, zero_point=zp_b,
+                           threads=threads)
+        mag_v, mag_b, fwhm = v["mag"], b["mag"], v["fwhm"]
+        # Los píxeles saturados no entran al ajuste: las estrellas saturadas se miden por las alas
+        v["saturated"] = b["saturated"] = np.zeros(len(yx_v), dtype=bool)
+        aperture = annulus = None
+    else:
+        yx_b = to_b.apply(yx_v) if to_b else yx_v
+        aperture = aperture or APERTURE_FWHM * field_fwhm
+        annulus = (max(ANNULUS_FWHM[0] * field_fwhm, aperture + 1),
+                   max(ANNULUS_FWHM[1] * field_fwhm, aperture + 3))
+        v = aperture_photometry(v_image, yx_v, aperture, annulus, gain, threads)
+        b = aperture_photometry(b_image, yx_b, aperture, annulus, gain, threads)
+        mag_v = instrumental_mag(v["flux"], v_exptime, zp_v)
+        mag_b = instrumental_mag(b["flux"], b_exptime, zp_b)
+    t_measure = time.perf_counter() - t0
+
+    ok = np.isfinite(mag_v) & np.isfinite(mag_b) & np.isfinite(fwhm) & ~v["saturated"] & ~b["saturated"]
+    order = np.flatnonzero(ok)[np.argsort(mag_v[ok])]
+    rows = [{
+        "cluster": cluster,
+        "star_id": i,
+        "mag_V": round(float(mag_v[k]), 3),
+        "mag_B": round(float(mag_b[k]), 3),
+        "snr": round(float(v["snr"][k]), 1),
+        "fwhm_pix": round(float(fwhm[k]), 2),
+    } for i, k in enumerate(order, 1)]
+    summary = {
+        "yx": yx_v[order],
+        "detected": len(yx_v), "measured": len(rows), "saturated": int((v["saturated"] | b["saturated"]).sum()),
+        "fwhm_pix": field_fwhm, "aperture_px": aperture, "annulus_px": annulus,
+        "detect_s": t_detect, "measure_s": t_measure,
+    }
+    return rows, summary
+
+
+def write_p08_table(rows, csv_path=None):
+    """
+    Escribe la tabla P08 reemplazando sólo los cúmulos presentes en `rows`;
+    las filas de los demás cúmulos se conservan.
+    """
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P08_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    clusters = {r["cluster"] for r in rows}
+    kept = []
+    if csv_path.exists():
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            kept = [{k: _P08_TYPES.get(k, str)(v) for k, v in r.items()}
+                    for r in csv.DictReader(f) if r["cluster"] not in clusters]
+    write_rows(kept + list(rows), TABLE_FIELDS, csv_path, categorical=["cluster"])
+    print(f"✅ Tabla P08: {csv_path}")
+    return csv_path
+
+
+def synthetic_cluster(shape=(3008, 3008), n_stars=3000, fwhm=3.0, sky=500.0, exptime=2.0,
+                      zero_point=ZERO_POINT, seed=42):
+    """
+    Campo sintético de cúmulo en V y B (ADU, con ruido de Poisson y lectura).
+    Devuelve `(V, B, verdad)` con `verdad` = `(N, 4)`: y, x, V, B.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    mag_v = np.clip(19.0 - rng.exponential(2.0, n_stars), 9.0, None)
+    mag_b = mag_v + np.clip(0.2 + 0.12 * (mag_v - 10) + rng.normal(0, 0.1, n_stars), -0.3, 2.0)
+    y, x = rng.uniform(0, h, n_stars), rng.uniform(0, w, n_stars)
+    sigma = fwhm / (2 * math.sqrt(2 * math.log(2)))
+    r = int(math.ceil(4 * sigma))
+    off = np.arange(-r, r + 1)
+    iy, ix = np.floor(y).astype(int), np.floor(x).astype(int)
+    rows = iy[:, None, None] + off[None, :, None]
+    cols = ix[:, None, None] + off[None, None, :]
+    g = np.exp(-((rows + 0.5 - y[:, None, None]) ** 2 + (cols + 0.5 - x[:, None, None]) ** 2) / (2 * sigma ** 2))
+    g /= 2 * np.pi * sigma ** 2
+    rows, cols = np.broadcast_arrays(rows, cols)
+    keep = (rows >= 0) & (rows < h) & (cols >= 0) & (cols < w)
+
+    frames = []
+    for mag in (mag_v, mag_b):
+        flux = 10 ** (-0.4 * (mag - zero_point)) * exptime
+        img = np.full(shape, sky, dtype=np.float64)
+        np.add.at(img, (rows[keep], cols[keep]), (flux[:, None, None] * g)[keep])
+        img = rng.poisson(img) + rng.normal(0, 3.5, shape)
+        frames.append(np.clip(img, 0, 65535).astype(np.float32))
+    # Las posiciones de verdad usan centros de píxel en coordenadas enteras
+    return frames[0], frames[1], np.column_stack([y - 0.5, x - 0.5, mag_v, mag_b])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fotometría de apertura de cúmulos abiertos (P08).")
+    parser.add_argument("--cluster", help=f"Nombre del cúmulo (P08: {', '.join(P08_CLUSTERS)}).")
+    parser.add_argument("--v", type=Path, help="Frame (apilado) en V.")
+    parser.add_argument("--b", type=Path, help="Frame (apilado) en B.")
+    parser.add_argument("--align", action="store_true", help="Alinea B con V por estrellas.")
+    parser.add_argument("--zp-v", type=float, default=ZERO_POINT, help="Punto cero V (mag).")
+    parser.add_argument("--zp-b", type=float, default=ZERO_POINT, help="Punto cero B (mag).")
+    parser.add_argument("--aperture", type=float, help=f"Radio de apertura (px; por defecto {APERTURE_FWHM}·FWHM).")
+    parser.add_argument("--psf", choices=("gaussian", "moffat"),
+                        help="Ajuste de PSF en vez de apertura (campos densos, ver orionlab_psf.py).")
+    parser.add_argument("--gain", type=float, default=GAIN_E_ADU, help="Ganancia (e-/ADU).")
+    parser.add_argument("--sigma", type=float, default=DETECT_SIGMA)
+    parser.add_argument("--max-stars", type=int, default=MAX_STARS)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Escribe la tabla P08 (por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--demo", metavar="CLUSTER", help="Campo sintético de 3008×3008 con ese nombre.")
+    args = parser.parse_args(argv)
+
+    truth = None
+    if args.demo:
+        cluster = args.demo
+        v_image, b_image, truth = synthetic_cluster(seed=sum(map(ord, cluster)))
+        v_exptime = b_exptime = 2.0
+    elif args.cluster and args.v and args.b:
+        cluster = args.cluster
+        v_image, b_image = FrameSource.open(args.v).read(), FrameSource.open(args.b).read()
+        v_exptime, b_exptime = _exptime(args.v), _exptime(args.b)
+    else:
+        parser.error("indique --cluster, --v y --b, o use --demo")
+
+    rows, s = measure_cluster(v_image, b_image, cluster, v_exptime, b_exptime, args.zp_v, args.zp_b,
+                              args.align, args.aperture, args.gain, args.sigma, args.max_stars, args.threads,
+                              args.psf)
+    print(f"✅ {cluster}: {s['measured']} estrellas medidas de {s['detected']} detectadas "
+          f"({s['saturated']} saturadas)")
+    if args.psf:
+        print(f"  FWHM {s['fwhm_pix']:.2f} px · ajuste de PSF {args.psf}")
+    else:
+        print(f"  FWHM {s['fwhm_pix']:.2f} px · apertura {s['aperture_px']:.1f} px · "
+              f"anillo {s['annulus_px'][0]:.1f}-{s['annulus_px'][1]:.1f} px")
+    print(f"  Detección {s['detect_s']:.2f} s · fotometría V+B {s['measure_s']:.2f} s")
+    if truth is not None and rows:
+        # Estrellas medidas vs. verdad (la más cercana a menos de 1 px)
+        yx = s["yx"][:500]
+        d = np.hypot(yx[:, None, 0] - truth[None, :, 0], yx[:, None, 1] - truth[None, :, 1])
+        nearest = d.argmin(axis=1)
+        hit = d[np.arange(len(yx)), nearest] < 1.0
+        measured = np.array([[r["mag_V"], r["mag_B"]] for r in rows[:500]])[hit]
+        err = measured - truth[nearest[hit], 2:]
+        print(f"  Verdad ({hit.sum()} estrellas): ΔV {np.median(err[:, 0]):+.3f} ± {err[:, 0].std():.3f}, "
+              f"ΔB {np.median(err[:, 1]):+.3f} ± {err[:, 1].std():.3f} mag")
+    if args.table is not None:
+        write_p08_table(rows, args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+orionlab_plot.py
+
+Servicio de renderizado de figuras sin pantalla para los scripts de estudios.
+
+- Fuerza el backend Agg y dibuja con `Figure` + `FigureCanvasAgg`, sin pasar
+  por el gestor de ventanas de pyplot.
+- Reutiliza una figura por proceso (y por tamaño/dpi): cada gráfico limpia la
+  figura en vez de crear una nueva.
+- `render_many` dibuja figuras independientes en procesos worker cuando hay
+  suficientes para compensar el costo del pool.
+- Puede guardar además SVG (`formats=("png", "svg")`) y, para tablas grandes
+  como la grilla P05, diezmar nubes de puntos a una por celda de pantalla
+  (`decimate_indices`) antes de dibujarlas.
+
+Las funciones de dibujo reciben `(fig, ax, *args, **kwargs)` y sólo dibujan;
+títulos, ejes y guardado quedan a cargo del servicio o de la propia función.
+
+Uso:
+    from orionlab_plot import plot_figure
+
+    def draw(fig, ax, df):
+        ax.scatter(df["frames"], df["snr"])
+
+    plot_figure(draw, IMG_DIR / "p06_snr_vs_frames.png", df, figsize=(8, 5))
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Con menos figuras que esto, el pool de procesos cuesta más de lo que ahorra
+PARALLEL_MIN_FIGURES = 4
+
+# Una figura reutilizable por (figsize, dpi) en cada proceso
+_FIGURES = {}
+
+
+def _figure(figsize, dpi):
+    key = (tuple(figsize), dpi)
+    fig = _FIGURES.get(key)
+    if fig is None:
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        _FIGURES[key] = fig
+    else:
+        fig.clf()
+    return fig
+
+
+def plot_figure(draw, out_path, *args, figsize=(6.4, 4.8), dpi=100, formats=None,
+                tight=True, bbox_inches=None, **kwargs):
+    """
+    Dibuja `draw(fig, ax, *args, **kwargs)` en la figura compartida y la guarda.
+
+    `formats`: extensiones a escribir (por defecto sólo la de `out_path`);
+    p. ej. `("png", "svg")` agrega una versión vectorial junto al PNG.
+    Devuelve la lista de archivos escritos.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    fig = _figure(figsize, dpi)
+    ax = fig.add_subplot()
+    draw(fig, ax, *args, **kwargs)
+    if tight and bbox_inches is None:
+        fig.tight_layout()
+
+    written = []
+    for ext in formats or (out_path.suffix.lstrip("."),):
+        target = out_path.with_suffix(f".{ext}")
+        fig.savefig(target, bbox_inches=bbox_inches)
+        written.append(target)
+    return written
+
+
+def _render_job(job):
+    draw, out_path, args, kwargs = job
+    return plot_figure(draw, out_path, *args, **kwargs)
+
+
+def render_many(jobs, processes=None):
+    """
+    Renderiza varias figuras independientes.
+
+    `jobs`: lista de tuplas `(draw, out_path, args, kwargs)`. Las funciones de
+    dibujo deben ser de nivel de módulo (picklables) para usar workers.
+    `processes=None` usa un worker por núcleo sólo si hay al menos
+    `PARALLEL_MIN_FIGURES` figuras; `processes=1` fuerza modo serial.
+    Devuelve la lista de archivos escritos, en el orden de `jobs`.
+    """
+    jobs = [(draw, out, tuple(args), dict(kwargs)) for draw, out, args, kwargs in jobs]
+    if processes is None:
+        processes = (os.cpu_count() or 1) if len(jobs) >= PARALLEL_MIN_FIGURES else 1
+    processes = min(processes, len(jobs)) or 1
+
+    if processes == 1:
+        results = [_render_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_render_job, jobs))
+    return [path for paths in results for path in paths]
+
+
+def decimate_indices(x, y, max_points=20_000, bins=(800, 600)):
+    """
+    Índices de un subconjunto de puntos que se ve igual en un scatter.
+
+    Si hay más de `max_points`, divide el rango de datos en una grilla de
+    `bins` (≈ píxeles de la figura) y conserva el primer punto de cada celda
+    ocupada. Es determinista y preserva outliers, a diferencia de un muestreo
+    aleatorio. Útil para la grilla P05 o cualquier tabla de millones de filas.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+
+    def _cell(values, n):
+        lo, hi = np.nanmin(values), np.nanmax(values)
+        span = hi - lo if hi > lo else 1.0
+        return np.clip(((values - lo) / span * (n - 1)).astype(np.int64), 0, n - 1)
+
+    cells = _cell(x, bins[0]) * bins[1] + _cell(y, bins[1])
+    _, first = np.unique(cells, return_index=True)
+    return np.sort(first)
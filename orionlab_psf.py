@@ -0,0 +1,465 @@
+"""
+orionlab_psf.py
+
+Fotometría por ajuste de PSF para campos densos (NGC 3532 de P08, Omega
+Centauri de P07), donde las aperturas de `orionlab_photometry` se mezclan.
+
+1. Agrupamiento: estrellas a menos de `GROUP_FWHM`·FWHM quedan en el mismo
+   grupo (componentes conexas). Los grupos de más de `MAX_GROUP` estrellas
+   se vuelven a partir con un radio menor.
+2. Cada grupo se ajusta en un recorte cuadrado que lo contiene (lado
+   redondeado a múltiplos de `BOX_STEP`) con fondo constante, una anchura de
+   PSF común y amplitud y posición por estrella. Modelos:
+   - gaussian  A·exp(-r²/2s²)
+   - moffat    A·(1 + r²/α²)^-β, con β fijo (`MOFFAT_BETA`)
+3. Levenberg–Marquardt en lote: los grupos con igual número de estrellas y
+   lado de recorte se apilan y se resuelven juntos (Jacobianos analíticos
+   `(grupos, píxeles, parámetros)` y `np.linalg.solve` sobre el lote, con
+   un λ por grupo). Los lotes se reparten en un pool de hilos.
+
+Las incertidumbres salen de la covarianza (JᵀWJ)⁻¹ escalada por el χ²
+reducido: flujo, magnitud (σ_m = 1,0857·σ_F/F), SNR = F/σ_F y FWHM.
+
+Uso:
+    python orionlab_psf.py ngc3532_V.fits --model moffat --catalog ngc3532_psf.csv
+    python orionlab_photometry.py --cluster "NGC 3532" --v V.fits --b B.fits --psf moffat --table
+    python orionlab_psf.py --demo
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource
+from orionlab_register import detect_stars
+from orionlab_stack import background_noise
+
+PSF_MODELS = ("gaussian", "moffat")
+CATALOG_FIELDS = ["star_id", "y", "x", "mag", "mag_err", "snr", "fwhm_pix", "fwhm_err", "group_size"]
+
+# Detección y agrupamiento
+MIN_SEPARATION_FWHM = 1.0
+GROUP_FWHM = 2.0
+FIT_FWHM = 2.0          # margen del recorte alrededor de las estrellas, en FWHM
+MAX_GROUP = 12
+BOX_STEP = 8
+
+# Levenberg–Marquardt
+MAX_ITERS = 40
+LAMBDA0 = 1e-3
+TOL = 1e-6             # mejora relativa de χ² para dar por convergido
+LAMBDA_MAX = 1e4
+
+# Anchura fija para grupos débiles
+FIXED_WIDTH_SNR = 30.0
+FIELD_FWHM_SNR = 50.0
+MOFFAT_BETA = 3.0
+WIDTH_LIMITS = (0.3, 3.0)      # respecto de la anchura inicial
+MAX_SHIFT_FWHM = 1.0           # desplazamiento máximo de cada estrella, en FWHM
+
+GAIN_E_ADU = 1.0
+ZERO_POINT = 25.0
+SATURATION_ADU = 65000
+FWHM_GUESS = 3.0
+
+# Memoria de trabajo por lote (Jacobiano float64)
+BATCH_MB = 64
+
+_SIGMA_TO_FWHM = 2 * math.sqrt(2 * math.log(2))
+
+
+# ----------------------------------------------------------
+# GRUPOS
+# ----------------------------------------------------------
+def _pairs(yx, radius):
+    """Pares (i, j), i < j, de estrellas a menos de `radius` px (ventanas ordenadas por fila)."""
+    n = len(yx)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    by_y = np.argsort(yx[:, 0], kind="stable")
+    ys = yx[by_y, 0]
+    hi = np.searchsorted(ys, ys + radius, side="right")
+    width = int((hi - np.arange(n)).max())
+    idx = np.arange(n)[:, None] + np.arange(1, max(width, 1))
+    valid = idx < hi[:, None]
+    other = by_y[np.minimum(idx, n - 1)]
+    d = np.hypot(yx[other, 0] - yx[by_y, None, 0], yx[other, 1] - yx[by_y, None, 1])
+    near = valid & (d < radius)
+    i, j = np.broadcast_to(by_y[:, None], near.shape)[near], other[near]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+def _components(n, i, j):
+    """Etiqueta de componente conexa (mínimo índice) por propagación vectorizada."""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        new = labels.copy()
+        np.minimum.at(new, i, low)
+        np.minimum.at(new, j, low)
+        new = new[new]                      # salto de punteros
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def group_stars(yx, radius, max_size=MAX_GROUP):
+    """
+    Etiquetas de grupo `(N,)` (0..G-1). Los grupos que superan `max_size`
+    se reagrupan con un radio 0,7 veces menor hasta caber.
+    """
+    yx = np.asarray(yx, dtype=np.float64)
+    labels = np.full(len(yx), -1, dtype=np.int64)
+    pending, r, next_label = np.arange(len(yx)), radius, 0
+    while len(pending):
+        comp = _components(len(pending), *_pairs(yx[pending], r))
+        _, inverse, counts = np.unique(comp, return_inverse=True, return_counts=True)
+        small = counts[inverse] <= max_size
+        if r < 1.0:
+            small[:] = True
+        _, local = np.unique(inverse[small], return_inverse=True)
+        labels[pending[small]] = next_label + local
+        next_label += int(local.max()) + 1 if small.any() else 0
+        pending, r = pending[~small], r * 0.7
+    return labels
+
+
+# ----------------------------------------------------------
+# MODELOS DE PSF
+# ----------------------------------------------------------
+def _profile(model, r2, width, beta):
+    """Perfil unitario y sus derivadas respecto de r² y de la anchura."""
+    if model == "gaussian":
+        inv = 1 / (2 * width * width)
+        g = np.exp(-r2 * inv)
+        return g, -g * inv, g * r2 / width ** 3
+    u = 1 + r2 / (width * width)
+    m = u ** -beta
+    d_r2 = -beta * m / u / (width * width)
+    return m, d_r2, -d_r2 * 2 * r2 / width
+
+
+def fwhm_of(model, width, beta=MOFFAT_BETA):
+    """FWHM (px) a partir de la anchura s (gaussiana) o α (Moffat)."""
+    if model == "gaussian":
+        return _SIGMA_TO_FWHM * width
+    return 2 * width * math.sqrt(2 ** (1 / beta) - 1)
+
+
+def width_of(model, fwhm, beta=MOFFAT_BETA):
+    return fwhm / fwhm_of(model, 1.0, beta)
+
+
+def _flux_factor(model, width, beta):
+    """Flujo total / amplitud y su derivada respecto de la anchura."""
+    if model == "gaussian":
+        return 2 * np.pi * width ** 2, 4 * np.pi * width
+    return np.pi * width ** 2 / (beta - 1), 2 * np.pi * width / (beta - 1)
+
+
+def _model(params, yy, xx, k, model, beta, fixed_width=False):
+    """
+    Modelo `(G, P)` y Jacobiano `(G, P, 3k+2)` para parámetros
+    `[A_1..A_k, y_1..y_k, x_1..x_k, fondo, anchura]`.
+    """
+    amp, y0, x0 = params[:, :k], params[:, k:2 * k], params[:, 2 * k:3 * k]
+    bg, width = params[:, 3 * k], params[:, 3 * k + 1]
+    dy = yy[:, None, :] - y0[:, :, None]                 # (G, k, P)
+    dx = xx[:, None, :] - x0[:, :, None]
+    w = width[:, None, None]
+    prof, d_r2, d_w = _profile(model, dy * dy + dx * dx, w, beta)
+    a = amp[:, :, None]
+    f = (a * prof).sum(axis=1) + bg[:, None]
+    jac = np.empty(f.shape + (3 * k + 2,))
+    jac[..., :k] = prof.transpose(0, 2, 1)
+    jac[..., k:2 * k] = (-2 * a * dy * d_r2).transpose(0, 2, 1)
+    jac[..., 2 * k:3 * k] = (-2 * a * dx * d_r2).transpose(0, 2, 1)
+    jac[..., 3 * k] = 1.0
+    jac[..., 3 * k + 1] = 0.0 if fixed_width else (a * d_w).sum(axis=1)
+    return f, jac
+
+
+def _normal_equations(jac, weight, resid):
+    jw = (jac * weight[..., None]).transpose(0, 2, 1)
+    return jw @ jac, (jw @ resid[..., None])[..., 0]
+
+
+def _lm(data, weight, yy, xx, params, k, model, beta, fixed_width=False, max_shift=np.inf):
+    """
+    Levenberg–Marquardt en lote; devuelve parámetros, covarianza, χ²
+    reducido y convergencia. Cada iteración trabaja sólo con los grupos que
+    aún no convergen. Con `fixed_width` la columna de la anchura del
+    Jacobiano se anula y la anchura no cambia. Las posiciones no se alejan
+    más de `max_shift` px de las iniciales y la anchura queda entre
+    `WIDTH_LIMITS` veces la inicial.
+    """
+    g_count, n_par = params.shape
+    params = params.copy()
+    pos0 = params[:, k:3 * k].copy()
+    width_lo, width_hi = params[:, -1] * WIDTH_LIMITS[0], params[:, -1] * WIDTH_LIMITS[1]
+    lam = np.full(g_count, LAMBDA0)
+    f, jac = _model(params, yy, xx, k, model, beta, fixed_width)
+    chi2 = (weight * (data - f) ** 2).sum(axis=1)
+    done = np.zeros(g_count, dtype=bool)
+    eye = np.eye(n_par)
+    for _ in range(MAX_ITERS):
+        act = np.flatnonzero(~done)
+        if not len(act):
+            break
+        w, d, a_f, a_jac = weight[act], data[act], f[act], jac[act]
+        hess, grad = _normal_equations(a_jac, w, d - a_f)
+        diag = np.diagonal(hess, axis1=1, axis2=2)
+        damped = hess + (lam[act, None] * diag + 1e-12)[:, :, None] * eye
+        trial = params[act] + np.linalg.solve(damped, grad[..., None])[..., 0]
+        trial[:, -1] = np.clip(trial[:, -1], width_lo[act], width_hi[act])
+        trial[:, k:3 * k] = np.clip(trial[:, k:3 * k], pos0[act] - max_shift, pos0[act] + max_shift)
+        f_new, jac_new = _model(trial, yy[act], xx[act], k, model, beta, fixed_width)
+        chi2_new = (w * (d - f_new) ** 2).sum(axis=1)
+        better = chi2_new <= chi2[act]
+        acc = act[better]
+        params[acc], f[acc], jac[acc] = trial[better], f_new[better], jac_new[better]
+        converged = better & (chi2[act] - chi2_new <= TOL * chi2[act])
+        chi2[acc] = chi2_new[better]
+        lam[act] = np.where(better, lam[act] / 10, lam[act] * 10)
+        done[act] = converged | (lam[act] >= LAMBDA_MAX)
+    hess, _ = _normal_equations(jac, weight, data - f)
+    dof = np.maximum((weight > 0).sum(axis=1) - n_par, 1)
+    red = chi2 / dof
+    cov = np.linalg.pinv(hess) * red[:, None, None]
+    return params, cov, red, done
+
+
+# ----------------------------------------------------------
+# AJUSTE POR GRUPOS
+# ----------------------------------------------------------
+def _fit_batch(image, yx, members, side, model, width0, beta, gain, noise, fixed_width=False):
+    """
+    Ajusta un lote de grupos (`members` (G, k) índices de estrellas) con
+    recortes de `side` px; con `fixed_width` la anchura queda en `width0`.
+    """
+    h, w = image.shape
+    g_count, k = members.shape
+    pos = yx[members]                                          # (G, k, 2)
+    center = (pos.min(axis=1) + pos.max(axis=1)) / 2
+    origin = np.floor(center - (side - 1) / 2).astype(np.int64)
+    off = np.arange(side)
+    rows = origin[:, 0, None] + off                            # (G, S)
+    cols = origin[:, 1, None] + off
+    inside = ((rows >= 0) & (rows < h))[:, :, None] & ((cols >= 0) & (cols < w))[:, None, :]
+    data = np.asarray(image[np.clip(rows, 0, h - 1)[:, :, None], np.clip(cols, 0, w - 1)[:, None, :]],
+                      dtype=np.float64).reshape(g_count, -1)
+    inside = inside.reshape(g_count, -1)
+    yy = np.broadcast_to(rows[:, :, None], (g_count, side, side)).reshape(g_count, -1).astype(np.float64)
+    xx = np.broadcast_to(cols[:, None, :], (g_count, side, side)).reshape(g_count, -1).astype(np.float64)
+
+    bg0 = np.nan_to_num(np.nanmedian(np.where(inside, data, np.nan), axis=1))
+    var = noise ** 2 + np.maximum(data - bg0[:, None], 0) / gain
+    # Los píxeles saturados no entran al ajuste: el flujo sale de las alas
+    weight = np.where(inside & (data < SATURATION_ADU), 1 / var, 0.0)
+    ci = np.clip(np.floor(pos + 0.5).astype(np.int64), 0, [h - 1, w - 1])
+    peak = np.asarray(image[ci[..., 0], ci[..., 1]], dtype=np.float64) - bg0[:, None]
+    params = np.concatenate([np.maximum(peak, noise), pos[..., 0], pos[..., 1], bg0[:, None],
+                             np.full((g_count, 1), width0)], axis=1)
+    max_shift = MAX_SHIFT_FWHM * fwhm_of(model, width0, beta)
+    fit = _lm(data, weight, yy, xx, params, k, model, beta, fixed_width, max_shift)
+    # Ajustes que quedan en los límites (posición o anchura) o sin flujo no son válidos
+    p = fit[0]
+    shift = np.maximum(np.abs(p[:, k:2 * k] - pos[..., 0]), np.abs(p[:, 2 * k:3 * k] - pos[..., 1]))
+    width_ok = (p[:, -1] > 1.001 * WIDTH_LIMITS[0] * width0) & (p[:, -1] < 0.999 * WIDTH_LIMITS[1] * width0)
+    valid = (shift < 0.999 * max_shift) & width_ok[:, None] & (p[:, :k] > 0)
+    return fit + (valid,)
+
+
+def _batches(yx, labels, margin):
+    """
+    Lotes `(miembros (G, k), lado)`: grupos con igual cantidad de estrellas
+    y lado de recorte, partidos para no pasar de `BATCH_MB` de Jacobiano.
+    """
+    order = np.argsort(labels, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(labels[order]) != 0])
+    sizes = np.diff(np.r_[starts, len(order)])
+    pos = yx[order]
+    extent = np.maximum(np.maximum.reduceat(pos[:, 0], starts) - np.minimum.reduceat(pos[:, 0], starts),
+                        np.maximum.reduceat(pos[:, 1], starts) - np.minimum.reduceat(pos[:, 1], starts))
+    sides = (BOX_STEP * np.ceil((extent + 2 * margin + 1) / BOX_STEP)).astype(np.int64)
+    jobs = []
+    for k, side in sorted(set(zip(sizes.tolist(), sides.tolist()))):
+        sel = starts[(sizes == k) & (sides == side)]
+        members = order[sel[:, None] + np.arange(k)]
+        chunk = max(1, int(BATCH_MB * 2**20 // (side * side * (3 * k + 2) * 8 * 4)))
+        jobs += [(members[s:s + chunk], side) for s in range(0, len(members), chunk)]
+    return jobs
+
+
+def _store(out, mem, fit, model, beta, fixed):
+    params, cov, red, done, valid = fit
+    k = mem.shape[1]
+    width = params[:, -1]
+    factor, d_factor = _flux_factor(model, width, beta)
+    amp = params[:, :k]
+    var_amp = np.diagonal(cov, axis1=1, axis2=2)[:, :k]
+    cov_amp_w = cov[:, :k, -1]
+    var_w = cov[:, -1, -1]
+    # F = A·c(w): σ_F² = c²σ_A² + (A·c')²σ_w² + 2·c·A·c'·cov(A, w)
+    flux_var = (factor[:, None] ** 2 * var_amp + (amp * d_factor[:, None]) ** 2 * var_w[:, None]
+                + 2 * factor[:, None] * amp * d_factor[:, None] * cov_amp_w)
+    fw = fwhm_of(model, 1.0, beta)
+    out["y"][mem] = params[:, k:2 * k]
+    out["x"][mem] = params[:, 2 * k:3 * k]
+    out["flux"][mem] = np.where(valid & (flux_var > 0), amp * factor[:, None], np.nan)
+    out["flux_err"][mem] = np.where(valid & (flux_var > 0), np.sqrt(np.maximum(flux_var, 0)), np.nan)
+    out["fwhm"][mem] = (width * fw)[:, None]
+    out["fwhm_err"][mem] = np.nan if fixed else (np.sqrt(np.maximum(var_w, 0)) * fw)[:, None]
+    out["chi2"][mem] = red[:, None]
+    out["group_size"][mem] = k
+    out["converged"][mem] = done[:, None]
+    out["fixed_width"][mem] = fixed
+
+
+def psf_photometry(image, yx, model="gaussian", fwhm=None, beta=MOFFAT_BETA, gain=GAIN_E_ADU,
+                   exptime=1.0, zero_point=ZERO_POINT, threads=None, max_group=MAX_GROUP,
+                   fixed_width_snr=FIXED_WIDTH_SNR):
+    """
+    Ajuste de PSF de todas las estrellas `yx` (N, 2). Devuelve un dict de
+    arreglos por estrella (en el orden de `yx`): y, x, flux, flux_err, mag,
+    mag_err, snr, fwhm, fwhm_err, group_size, converged, fixed_width.
+
+    Los grupos cuya estrella más brillante queda bajo `fixed_width_snr` se
+    reajustan con la anchura fija en la FWHM del campo (mediana de las
+    estrellas con SNR > `FIELD_FWHM_SNR`): en ellas el ruido no deja medir
+    la anchura y una anchura libre sesga el flujo. Su `fwhm_err` es NaN.
+    """
+    if model not in PSF_MODELS:
+        raise ValueError(f"Modelo desconocido: {model!r} (opciones: {list(PSF_MODELS)})")
+    image = np.asarray(image)
+    yx = np.asarray(yx, dtype=np.float64).reshape(-1, 2)
+    n = len(yx)
+    fwhm = fwhm or FWHM_GUESS
+    noise = background_noise(image)
+    labels = group_stars(yx, GROUP_FWHM * fwhm, max_group)
+
+    out = {key: np.full(n, np.nan) for key in ("y", "x", "flux", "flux_err", "fwhm", "fwhm_err", "chi2")}
+    out["group_size"] = np.zeros(n, dtype=np.int64)
+    out["converged"] = np.zeros(n, dtype=bool)
+    out["fixed_width"] = np.zeros(n, dtype=bool)
+
+    def _run_pass(jobs, width0, fixed):
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+            fits = pool.map(lambda job: _fit_batch(image, yx, job[0], job[1], model, width0, beta, gain,
+                                                   noise, fixed), jobs)
+            for (mem, _), fit in zip(jobs, fits):
+                _store(out, mem, fit, model, beta, fixed)
+
+    if n:
+        _run_pass(_batches(yx, labels, FIT_FWHM * fwhm), width_of(model, fwhm, beta), False)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            snr = out["flux"] / out["flux_err"]
+        good = out["converged"] & (snr > FIELD_FWHM_SNR)
+        if good.any() and fixed_width_snr:
+            field_fwhm = float(np.median(out["fwhm"][good]))
+            group_snr = np.full(labels.max() + 1, -np.inf)
+            np.maximum.at(group_snr, labels, np.nan_to_num(snr, nan=-np.inf))
+            faint = group_snr[labels] < fixed_width_snr
+            if faint.any():
+                _, faint_labels = np.unique(labels[faint], return_inverse=True)
+                jobs = [(np.flatnonzero(faint)[mem], side)
+                        for mem, side in _batches(yx[faint], faint_labels, FIT_FWHM * field_fwhm)]
+                _run_pass(jobs, width_of(model, field_fwhm, beta), True)
+
+    flux, err = out["flux"], out["flux_err"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["mag"] = np.where(flux > 0, zero_point - 2.5 * np.log10(flux / exptime), np.nan)
+        out["mag_err"] = np.where(flux > 0, 2.5 / math.log(10) * err / flux, np.nan)
+        out["snr"] = flux / err
+    return out
+
+
+def write_catalog(result, path):
+    """Catálogo por estrella con incertidumbres (orden por magnitud)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ok = np.flatnonzero(np.isfinite(result["mag"]))
+    ok = ok[np.argsort(result["mag"][ok])]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        for i, s in enumerate(ok, 1):
+            writer.writerow({
+                "star_id": i,
+                "y": round(float(result["y"][s]), 2),
+                "x": round(float(result["x"][s]), 2),
+                "mag": round(float(result["mag"][s]), 3),
+                "mag_err": round(float(result["mag_err"][s]), 3),
+                "snr": round(float(result["snr"][s]), 1),
+                "fwhm_pix": round(float(result["fwhm"][s]), 2),
+                "fwhm_err": round(float(result["fwhm_err"][s]), 2),
+                "group_size": int(result["group_size"][s]),
+            })
+    print(f"✅ Catálogo PSF: {path} ({len(ok)} estrellas)")
+    return path
+
+
+def main(argv=None):
+    from orionlab_photometry import DETECT_SIGMA, MAX_STARS, fit_fwhm, synthetic_cluster
+
+    parser = argparse.ArgumentParser(description="Fotometría por ajuste de PSF en campos densos.")
+    parser.add_argument("image", nargs="?", type=Path, help="Frame (.npy/.fits).")
+    parser.add_argument("--model", choices=PSF_MODELS, default="gaussian")
+    parser.add_argument("--beta", type=float, default=MOFFAT_BETA, help="β de la Moffat.")
+    parser.add_argument("--fwhm", type=float, help="FWHM inicial (px; por defecto se estima).")
+    parser.add_argument("--gain", type=float, default=GAIN_E_ADU)
+    parser.add_argument("--zp", type=float, default=ZERO_POINT)
+    parser.add_argument("--exptime", type=float, default=1.0)
+    parser.add_argument("--sigma", type=float, default=DETECT_SIGMA)
+    parser.add_argument("--max-stars", type=int, default=MAX_STARS)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--catalog", type=Path, help="CSV por estrella con incertidumbres.")
+    parser.add_argument("--demo", action="store_true", help="Campo sintético denso (1024×1024).")
+    args = parser.parse_args(argv)
+
+    truth = None
+    if args.demo:
+        image, _, truth = synthetic_cluster((1024, 1024), n_stars=8000, seed=7)
+        args.exptime = 2.0
+    elif args.image:
+        image = FrameSource.open(args.image).read()
+    else:
+        parser.error("indique un frame o use --demo")
+
+    stars = detect_stars(image, sigma=args.sigma, max_stars=args.max_stars)
+    fwhm = args.fwhm or float(np.nanmedian(fit_fwhm(image, stars[:max(10, len(stars) // 4), :2])))
+    stars = detect_stars(image, sigma=args.sigma, max_stars=args.max_stars,
+                         min_separation=MIN_SEPARATION_FWHM * fwhm)
+    t0 = time.perf_counter()
+    result = psf_photometry(image, stars[:, :2], args.model, fwhm, args.beta, args.gain, args.exptime,
+                            args.zp, args.threads)
+    dt = time.perf_counter() - t0
+    sizes = result["group_size"]
+    print(f"✅ {len(stars)} estrellas ({args.model}, FWHM {np.nanmedian(result['fwhm']):.2f} px) "
+          f"en {dt:.2f} s · {int((sizes > 1).sum())} en grupos (máx. {int(sizes.max(initial=0))}) · "
+          f"{int(result['converged'].sum())} convergidas")
+
+    if truth is not None:
+        d = np.hypot(result["y"][:, None] - truth[None, :, 0], result["x"][:, None] - truth[None, :, 1])
+        nearest = d.argmin(axis=1)
+        hit = (d[np.arange(len(d)), nearest] < 1.0) & np.isfinite(result["mag"])
+        err = result["mag"][hit] - truth[nearest[hit], 2]
+        pull = err / result["mag_err"][hit]
+        bright = result["snr"][hit] > 50
+        print(f"  Verdad ({hit.sum()} estrellas): ΔV {np.median(err):+.3f} ± {np.std(err):.3f} mag "
+              f"(SNR > 50: ± {np.std(err[bright]):.3f}), "
+              f"pull σ {1.4826 * np.median(np.abs(pull - np.median(pull))):.2f}")
+    if args.catalog:
+        write_catalog(result, args.catalog)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
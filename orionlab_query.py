@@ -0,0 +1,134 @@
+"""
+orionlab_query.py
+
+Consultas indexadas sobre la tabla SNR de P05.
+
+En vez de recorrer la tabla completa con una cadena de máscaras booleanas por
+cada gráfico, `SNRQuery` construye una sola vez:
+
+- un índice hash (clave completa → posiciones de fila) para consultas puntuales, y
+- un MultiIndex ordenado sobre (camera, bortle_class, filter, iso_gain, exposure_s)
+  para consultas parciales o por rango (búsqueda binaria en vez de escaneo).
+
+Los subconjuntos consultados recientemente quedan en un caché LRU.
+
+Uso:
+    from orionlab_query import SNRQuery
+    q = SNRQuery.from_table(DATA_DIR / "p05_snr_simulation_data.csv")
+    sub = q.get(camera="Nikon D7500", bortle_class=5, iso_gain=1600,
+                filter="Optolong L-Quad Enhance")
+    rango = q.get(camera="ZWO ASI533MC Pro", exposure_s=slice(120, 240))
+"""
+
+from collections import OrderedDict
+
+import pandas as pd
+
+from orionlab_io import read_table
+
+KEY = ("camera", "bortle_class", "filter", "iso_gain", "exposure_s")
+
+
+def _freeze(value):
+    """Convierte un criterio de búsqueda en algo hasheable para el caché."""
+    if isinstance(value, slice):
+        return ("slice", value.start, value.stop, value.step)
+    if isinstance(value, (list, tuple, set)):
+        return ("list",) + tuple(sorted(value))
+    return value
+
+
+class SNRQuery:
+    """Índice de consulta sobre el dataset SNR de P05 (ver docstring del módulo)."""
+
+    def __init__(self, df, cache_size=256):
+        missing = [k for k in KEY if k not in df.columns]
+        if missing:
+            raise ValueError(f"Faltan columnas de índice: {missing}")
+
+        # Las categorías de Parquet se pasan a valores planos para que las claves
+        # del índice hash sean los mismos escalares que usa quien consulta.
+        df = df.copy()
+        for col in KEY:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(df[col].cat.categories.dtype)
+
+        self._flat = df.sort_values(list(KEY), kind="stable").reset_index(drop=True)
+        self._index = pd.MultiIndex.from_frame(self._flat[list(KEY)])
+        self._points = self._flat.groupby(list(KEY), sort=False).indices
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_table(cls, csv_path, columns=None, filters=None, cache_size=256):
+        """Carga la tabla con `orionlab_io.read_table` y construye el índice."""
+        if columns is not None:
+            columns = list(dict.fromkeys(list(KEY) + list(columns)))
+        return cls(read_table(csv_path, columns=columns, filters=filters),
+                   cache_size=cache_size)
+
+    def __len__(self):
+        return len(self._flat)
+
+    def get(self, camera=None, bortle_class=None, filter=None, iso_gain=None,
+            exposure_s=None, columns=None):
+        """
+        Subconjunto de filas que cumple los criterios dados.
+
+        Cada criterio puede ser un escalar, una lista de valores o un `slice`
+        (rango inclusivo sobre el MultiIndex ordenado); `None` no filtra.
+        Las filas vuelven ordenadas por la clave del índice. El DataFrame
+        devuelto se comparte con el caché: no modificarlo en sitio.
+        """
+        criteria = (camera, bortle_class, filter, iso_gain, exposure_s)
+        cache_key = (tuple(_freeze(c) for c in criteria),
+                     None if columns is None else tuple(columns))
+
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            self._cache.move_to_end(cache_key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        result = self._lookup(criteria)
+        if columns is not None:
+            result = result[list(columns)]
+
+        self._cache[cache_key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _lookup(self, criteria):
+        # Clave completa de escalares: índice hash, O(1)
+        if not any(c is None or isinstance(c, (slice, list, tuple, set)) for c in criteria):
+            rows = self._points.get(tuple(criteria))
+            if rows is None:
+                return self._flat.iloc[0:0]
+            return self._flat.iloc[rows].reset_index(drop=True)
+
+        # Consulta parcial o por rango: búsqueda binaria sobre el MultiIndex ordenado
+        # Las listas se reducen a los valores presentes en su nivel (semántica isin):
+        # get_locs lanza KeyError ante un solo valor ausente
+        selector = []
+        for level, c in zip(self._index.levels, criteria):
+            if isinstance(c, (list, tuple, set)):
+                c = sorted(v for v in c if v in level)
+                if not c:
+                    return self._flat.iloc[0:0]
+            selector.append(slice(None) if c is None else c)
+        selector = tuple(selector)
+        try:
+            rows = self._index.get_locs(selector)
+        except KeyError:
+            return self._flat.iloc[0:0]
+        return self._flat.iloc[rows].reset_index(drop=True)
+
+    def clear_cache(self):
+        """Vacía el caché de subconjuntos."""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,355 @@
+"""
+orionlab_reduction.py
+
+Pipeline de reducción fuera de memoria para el estudio P10: ejecuta de verdad
+las cinco etapas de `reduction_pipeline_stages.csv` sobre subs FITS o NumPy.
+
+    1. bias_sub    light - master bias        (raw uint16 → pila de trabajo float32)
+    2. dark_sub    - master dark · escala      (escala = exposición light / dark)
+    3. flat_field  / master flat normalizado
+    4. register    alineación por estrellas contra el primer light (`orionlab_register`;
+                   respaldo por correlación de fase)
+    5. stack       apilado por tiles con `orionlab_stack` (mean, median, sigma_clip, ...)
+
+Los lights nunca se cargan juntos: la pila de trabajo vive en disco
+(`orionlab_frames.FrameStack`) y cada etapa la recorre frame a frame; los
+masters y el apilado final se calculan por bandas de filas cuyo tamaño se
+ajusta a `max_memory_mb`. Una noche de 200 subs ASI533 (3008×3008, 16 bit)
+se reduce con unos cientos de MB de RAM (más ~7 GB de disco temporal).
+
+Cada etapa se cronometra y se mide su SNR mediano, y se escribe la tabla P10
+(`order, stage, time_seconds, median_snr, frames_processed`) con datos reales.
+
+Uso:
+    python orionlab_reduction.py lights/*.fits --bias bias/*.fits --darks darks/*.fits \\
+        --flats flats/*.fits --dark-scale 1.0 --out-stack stacked.fits
+    python orionlab_reduction.py lights/*.fits --camera "ZWO ASI533MC Pro" --gain 100 \
+        --exposure 180 --sensor-temp -10 --filter "Optolong L-Quad Enhance"   # masters de la biblioteca
+    python orionlab_reduction.py lights/*.fits --debayer vng --bayer RGGB --out-stack rgb.npy
+    python orionlab_reduction.py --demo 40      # sesión sintética de prueba
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_debayer import (BAYER_PATTERNS, DEBAYER_METHODS, bayer_pattern, debayer,
+                              normalize_cfa_flat, save_rgb)
+from orionlab_frames import FrameStack, frame_snr, open_frame, save_frame
+from orionlab_register import StarCache, align_stack, register_frames
+from orionlab_stack import ALGORITHMS, stack
+from orionlab_trails import TrailMask, detect_trails
+
+STAGES = ["bias_sub", "dark_sub", "flat_field", "register", "stack"]
+TABLE_FIELDS = ["order", "stage", "time_seconds", "median_snr", "frames_processed"]
+
+# Carpeta del estudio (nombre actual y nombre original del generador batch)
+P10_DIRS = ["p10_pipeline_reduccion", "p10_python_reduction_pipeline"]
+TABLE_NAME = "reduction_pipeline_stages.csv"
+
+# Píxeles de flat por debajo de esto (normalizado) se consideran sin señal
+FLAT_MIN = 0.05
+# Un master flat ya calculado debe venir normalizado (mediana ≈ 1)
+FLAT_MEDIAN_TOL = 0.1
+
+# Fracción de `max_memory_mb` para los tiles de apilado: el resto queda para
+# los masters y el frame en curso.
+BAND_FRACTION = 0.35
+
+
+# ----------------------------------------------------------
+# MASTERS
+# ----------------------------------------------------------
+COMBINE_METHODS = ("median", "mean", "sigma_clip", "winsorized")
+
+
+def master_frame(paths, method="median", subtract=None, normalize=False, sigma=3.0,
+                 max_memory_mb=256):
+    """
+    Combina frames de calibración en un master con `orionlab_stack.stack`
+    (por tiles, sin cargar todos los frames).
+
+    `method`: uno de `COMBINE_METHODS`.
+    `subtract`: master (p. ej. bias) que se resta al resultado; equivale a
+    restarlo a cada frame porque todos los combinadores son invariantes a
+    un desplazamiento por píxel.
+    `normalize`: divide el resultado por su mediana (masters de flat).
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("master_frame necesita al menos un frame")
+    if method not in COMBINE_METHODS:
+        raise ValueError(f"Método de combinación desconocido: {method!r} "
+                         f"(opciones: {list(COMBINE_METHODS)})")
+
+    master = stack(paths, algo=method, sigma=sigma, max_memory_mb=max_memory_mb * BAND_FRACTION)
+    if subtract is not None:
+        master -= subtract
+    if normalize:
+        master /= np.median(master[::8, ::8])
+    return master
+
+
+def _is_normalized(frame):
+    """Mediana ≈ 1: el frame ya es un master flat normalizado."""
+    return abs(float(np.nanmedian(np.asarray(frame)[::8, ::8])) - 1) <= FLAT_MEDIAN_TOL
+
+
+def _as_master(value, **kwargs):
+    """
+    Acepta un master ya calculado, una ruta a un master o una lista de frames.
+    Siempre devuelve una copia float32 (las etapas la modifican).
+
+    A un master ya calculado no se le resta `subtract` ni se normaliza: con
+    `normalize=True` (flats) se exige que ya venga normalizado, porque un
+    flat crudo dividiría cada light por ~20000 ADU.
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        master = np.array(value, dtype=np.float32)
+    elif isinstance(value, (str, Path)):
+        master = np.array(open_frame(value), dtype=np.float32)
+    else:
+        return master_frame(value, **kwargs)
+    if kwargs.get("normalize") and not _is_normalized(master):
+        median = float(np.nanmedian(master[::8, ::8]))
+        raise ValueError(f"El master flat tiene mediana {median:.4g} y se esperaba ≈1 "
+                         f"(restado el bias y normalizado); para un flat crudo pase "
+                         f"la lista de frames")
+    return master
+
+
+# ----------------------------------------------------------
+# ETAPAS
+# ----------------------------------------------------------
+def reduce_session(lights, bias=None, darks=None, flats=None, dark_scale=1.0,
+                   stack_method="mean", register=True, workdir=None, max_memory_mb=256,
+                   threads=None, star_cache=None, cfa_pattern=None, reject_trails=False):
+    """
+    Ejecuta las cinco etapas sobre `lights` (lista de rutas `.npy`/`.fits`).
+
+    `bias`, `darks`, `flats`: master ya calculado (arreglo o ruta; el flat
+    con mediana ≈ 1) o lista de frames para construirlo; `None` omite esa
+    corrección (la etapa igual se registra, con 0 frames procesados). El
+    tiempo de construir un master se cuenta en su etapa.
+
+    `star_cache`: `StarCache` para las estrellas detectadas en el registro
+    (clave: ruta del light original).
+
+    `cfa_pattern` (p. ej. "RGGB"): los lights son CFA sin debayerizar. El
+    flat se normaliza por canal y el registro sólo mueve en pasos pares de
+    píxel, así el apilado sigue siendo CFA y se debayeriza una sola vez.
+
+    `reject_trails`: antes de apilar se detectan trazas satelitales en cada
+    sub registrado (`orionlab_trails`) y sus píxeles se excluyen del apilado.
+
+    Devuelve `(apilado, etapas, transformaciones)` con `etapas` en el formato
+    de la tabla P10 y una `orionlab_register.Transform` por light.
+    """
+    lights = [Path(p) for p in lights]
+    if not lights:
+        raise ValueError("reduce_session necesita al menos un light")
+    shape = open_frame(lights[0]).shape
+    stages = []
+    transforms = []
+
+    def _record(stage, start, snrs, n_frames):
+        stages.append({
+            "order": len(stages) + 1,
+            "stage": stage,
+            "time_seconds": round(time.perf_counter() - start, 2),
+            "median_snr": round(float(np.nanmedian(snrs)), 1) if snrs else float("nan"),
+            "frames_processed": n_frames,
+        })
+        print(f"  ✅ {stage:<10} {stages[-1]['time_seconds']:8.2f} s  "
+              f"SNR {stages[-1]['median_snr']:6.1f}  ({n_frames} frames)")
+
+    with tempfile.TemporaryDirectory(prefix="orionlab_p10_", dir=workdir) as tmp:
+        work = FrameStack.create(Path(tmp) / "work.npy", (len(lights), *shape))
+
+        # 1. bias_sub: además convierte cada sub a float32 en la pila de trabajo
+        start = time.perf_counter()
+        master_bias = _as_master(bias, max_memory_mb=max_memory_mb)
+        snrs = []
+        for i, path in enumerate(lights):
+            frame = np.asarray(open_frame(path), dtype=np.float32)
+            if master_bias is not None:
+                frame -= master_bias
+            work.write(i, frame)
+            snrs.append(frame_snr(frame))
+        _record("bias_sub", start, snrs, len(lights) if master_bias is not None else 0)
+
+        # 2. dark_sub
+        start = time.perf_counter()
+        master_dark = _as_master(darks, subtract=master_bias, max_memory_mb=max_memory_mb)
+        snrs = []
+        if master_dark is not None:
+            master_dark *= dark_scale
+            for i in range(len(lights)):
+                frame = work.read(i)
+                frame -= master_dark
+                work.write(i, frame)
+                snrs.append(frame_snr(frame))
+        _record("dark_sub", start, snrs, len(snrs))
+
+        # 3. flat_field
+        start = time.perf_counter()
+        master_flat = _as_master(flats, subtract=master_bias, normalize=True,
+                                 max_memory_mb=max_memory_mb)
+        snrs = []
+        if master_flat is not None:
+            if cfa_pattern:
+                normalize_cfa_flat(master_flat, cfa_pattern)
+            master_flat[master_flat < FLAT_MIN] = np.nan
+            for i in range(len(lights)):
+                frame = work.read(i)
+                frame /= master_flat
+                work.write(i, frame)
+                snrs.append(frame_snr(frame))
+        _record("flat_field", start, snrs, len(snrs))
+
+        # 4. register
+        start = time.perf_counter()
+        snrs = []
+        if register and len(lights) > 1:
+            # Las estrellas se detectan sobre los subs calibrados: la etiqueta las
+            # separa en el caché de las detecciones sobre los lights crudos
+            transforms = register_frames(work, threads=threads, cache=star_cache, keys=lights,
+                                         tag="p10_calibrated")
+            if cfa_pattern:
+                transforms = [t.rounded(step=2) for t in transforms]
+            align_stack(work, transforms, threads=threads)
+            snrs = [frame_snr(work.read(i)) for i in range(1, len(lights))]
+        _record("register", start, snrs, len(snrs))
+
+        # 5. stack
+        start = time.perf_counter()
+        masks = None
+        if reject_trails:
+            masks = [TrailMask(shape, detect_trails(work.read(i))) for i in range(len(lights))]
+            print(f"  ↷ trazas enmascaradas: {sum(len(m.trails) for m in masks)}")
+        stacked = stack(work, algo=stack_method, max_memory_mb=max_memory_mb * BAND_FRACTION,
+                        masks=masks)
+        _record("stack", start, [frame_snr(stacked)], len(lights))
+
+        del work
+    return stacked, stages, transforms
+
+
+def write_stage_table(stages, csv_path=None):
+    """Escribe la tabla de etapas P10 (CSV y Parquet si hay pyarrow)."""
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P10_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(stages, TABLE_FIELDS, csv_path, categorical=["stage"])
+    print(f"✅ Tabla de etapas: {csv_path}")
+    return csv_path
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline de reducción P10 (fuera de memoria).")
+    parser.add_argument("lights", nargs="*", type=Path, help="Subs light (.npy/.fits).")
+    parser.add_argument("--bias", nargs="+", type=Path, help="Frames bias o un master.")
+    parser.add_argument("--darks", nargs="+", type=Path, help="Frames dark o un master.")
+    parser.add_argument("--flats", nargs="+", type=Path, help="Frames flat o un master.")
+    parser.add_argument("--dark-scale", type=float, default=1.0,
+                        help="Exposición light / exposición dark.")
+    parser.add_argument("--stack", choices=ALGORITHMS, default="mean")
+    parser.add_argument("--no-register", action="store_true")
+    parser.add_argument("--reject-trails", action="store_true",
+                        help="Detecta trazas satelitales y las excluye del apilado.")
+    parser.add_argument("--threads", type=int, help="Hilos para el registro.")
+    parser.add_argument("--no-star-cache", action="store_true",
+                        help="No usa el caché de estrellas del registro.")
+    parser.add_argument("--max-memory-mb", type=float, default=256)
+    parser.add_argument("--workdir", type=Path, help="Directorio para la pila temporal.")
+    parser.add_argument("--out-stack", type=Path, help="Guarda el apilado (.npy/.fits).")
+    parser.add_argument("--debayer", choices=DEBAYER_METHODS,
+                        help="Lights OSC: reduce la CFA y debayeriza sólo el apilado final.")
+    parser.add_argument("--bayer", choices=BAYER_PATTERNS,
+                        help="Matriz Bayer de los lights (por defecto BAYERPAT del FITS o RGGB).")
+    parser.add_argument("--table", type=Path, help=f"Tabla de etapas (por defecto {TABLE_NAME} de P10).")
+    parser.add_argument("--demo", type=int, metavar="N", help="Reduce N lights sintéticos.")
+    library = parser.add_argument_group("biblioteca de calibración (orionlab_calib)")
+    library.add_argument("--camera", help="Toma los masters de la biblioteca para esta cámara.")
+    library.add_argument("--gain")
+    library.add_argument("--exposure", type=float, help="Exposición de los lights (s).")
+    library.add_argument("--sensor-temp", type=float)
+    library.add_argument("--filter")
+    library.add_argument("--library", type=Path, help="Directorio de la biblioteca.")
+    args = parser.parse_args(argv)
+
+    def _single(paths, flat=False):
+        # Una sola ruta se trata como master ya calculado; un flat sólo si ya
+        # está normalizado (si no, es un flat crudo y se procesa como lista)
+        if not paths or len(paths) != 1:
+            return paths
+        if flat and not _is_normalized(open_frame(paths[0])):
+            return paths
+        return paths[0]
+
+    if args.demo:
+        from orionlab_frames import synthetic_session
+
+        demo_dir = tempfile.mkdtemp(prefix="orionlab_p10_demo_")
+        session = synthetic_session(demo_dir, n_lights=args.demo)
+        args.lights, args.bias = session["lights"], session["bias"]
+        args.darks, args.flats = session["darks"], session["flats"]
+    elif not args.lights:
+        parser.error("indique los lights o use --demo")
+
+    masters = {"bias": _single(args.bias), "darks": _single(args.darks),
+               "flats": _single(args.flats, flat=True)}
+    if args.camera:
+        from orionlab_calib import CalibrationLibrary
+
+        if args.gain is None or args.exposure is None or args.exposure <= 0:
+            parser.error("--camera requiere --gain y --exposure > 0")
+        if not args.darks and args.dark_scale != 1.0:
+            # dark_for ya escala el dark de la biblioteca a la exposición y temperatura
+            parser.error("--dark-scale no se combina con darks de la biblioteca (ya vienen escalados)")
+        found = CalibrationLibrary(args.library).masters_for(
+            args.camera, args.gain, args.exposure, args.sensor_temp, args.filter)
+        # Los frames dados explícitamente tienen prioridad sobre la biblioteca
+        masters = {k: v if v is not None else found[k] for k, v in masters.items()}
+
+    if args.debayer and not args.bayer:
+        args.bayer = bayer_pattern(args.lights[0])
+
+    print(f"🚀 Reduciendo {len(args.lights)} lights")
+    stacked, stages, _ = reduce_session(
+        args.lights, **masters, dark_scale=args.dark_scale, stack_method=args.stack,
+        register=not args.no_register, workdir=args.workdir, max_memory_mb=args.max_memory_mb,
+        threads=args.threads, star_cache=None if args.no_star_cache else StarCache(),
+        cfa_pattern=args.bayer if args.debayer else None, reject_trails=args.reject_trails,
+    )
+    if args.debayer:
+        stacked = debayer(stacked, args.debayer, args.bayer)
+    if args.out_stack:
+        (save_rgb if args.debayer else save_frame)(args.out_stack, stacked)
+        print(f"✅ Apilado: {args.out_stack}")
+    write_stage_table(stages, args.table)
+
+    peak = _peak_rss_mb()
+    if peak is not None:
+        print(f"  Memoria pico (RSS): {peak:.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,591 @@
+"""
+orionlab_register.py
+
+Registro de subs para la etapa `register` de P10 y el estudio de dithering
+P15: cada sub se alinea con un sub de referencia estimando traslación y
+rotación.
+
+1. Detección de estrellas vectorizada: fondo por malla de medianas
+   (interpolado bilineal), picos locales del residuo suavizado por sobre
+   `DETECT_SIGMA`·σ y centroides ponderados en una ventana 7×7. Los píxeles
+   calientes y rayos cósmicos (picos de un solo píxel) se descartan por
+   su nitidez.
+2. Emparejamiento por triángulos: con las estrellas más brillantes se forman
+   todos los triángulos y se describen por sus razones de lados (invariantes
+   a traslación y rotación). Cada par de triángulos parecidos propone una
+   transformación rígida; gana la que alinea más estrellas y se refina por
+   mínimos cuadrados con todas ellas.
+3. Si no hay estrellas suficientes (nubes, desenfoque) se recurre a la
+   correlación de fase por FFT sobre el recorte central (sólo traslación,
+   con precisión subpíxel).
+
+Los subs se registran en paralelo (pool de hilos) y la lista de estrellas de
+cada sub se guarda en un caché en disco (`StarCache`, por defecto en
+`$ORIONLAB_STARS_DIR` o `~/.orionlab/stars`), así al re-ejecutar se salta la
+detección. La clave incluye ruta, tamaño, fecha de modificación y parámetros
+de detección, de modo que un sub reescrito se vuelve a detectar.
+
+La transformación `Transform(dy, dx, angle_deg)` lleva coordenadas del sub a
+la referencia: p_ref = R(ángulo)·p + (dx, dy).
+
+Uso:
+    python orionlab_register.py subs/*.fits                 # tabla de transformaciones
+    python orionlab_register.py subs/*.fits --out-dir alineados/
+    python orionlab_register.py --demo 20 --rotation 0.5
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import save_frame
+from orionlab_stack import as_sources, background_noise
+
+# Detección: umbral (σ del residuo suavizado 3×3) y tamaño de la malla de fondo
+DETECT_SIGMA = 5.0
+BACKGROUND_BOX = 64
+CENTROID_RADIUS = 3
+
+# Picos con valor central > SHARP_MAX veces la media 3×3 son de un solo píxel
+# (calientes o rayos cósmicos); una estrella con FWHM ≥ 2 px queda bajo ~3
+SHARP_MAX = 5.0
+
+# Emparejamiento: estrellas usadas, tolerancias y mínimo de coincidencias
+MAX_STARS = 60
+TRIANGLE_STARS = 15
+MIN_SIDE_PX = 10.0
+TRIANGLE_TOL = 0.01
+SCALE_TOL = 0.02
+MATCH_RADIUS_PX = 2.0
+MIN_MATCHES = 4
+MAX_CANDIDATES = 100
+
+# Lado del recorte central usado para la correlación de fase
+REGISTER_CROP = 1024
+
+# Filas por banda al remuestrear (acota la memoria de `warp_frame`)
+WARP_BAND_ROWS = 256
+
+
+def default_cache_dir():
+    return Path(os.environ.get("ORIONLAB_STARS_DIR", Path.home() / ".orionlab" / "stars"))
+
+
+# ----------------------------------------------------------
+# TRANSFORMACIONES
+# ----------------------------------------------------------
+class Transform:
+    """Transformación rígida sub → referencia (traslación en px, rotación en grados)."""
+
+    def __init__(self, dy=0.0, dx=0.0, angle_deg=0.0, method="stars", n_matches=0):
+        self.dy, self.dx, self.angle_deg = float(dy), float(dx), float(angle_deg)
+        self.method = method
+        self.n_matches = n_matches
+
+    def __repr__(self):
+        return (f"Transform(dy={self.dy:.2f}, dx={self.dx:.2f}, angle_deg={self.angle_deg:.3f}, "
+                f"method={self.method!r}, n_matches={self.n_matches})")
+
+    @property
+    def integer_shift(self):
+        """`(dy, dx)` enteros si la transformación es una traslación entera; si no, None."""
+        if self.angle_deg == 0 and self.dy.is_integer() and self.dx.is_integer():
+            return int(self.dy), int(self.dx)
+        return None
+
+    def rounded(self, step=1):
+        """
+        Traslación redondeada a múltiplos de `step` px y sin rotación. Con
+        `step=2` el sub se mueve sin romper la fase de la matriz Bayer.
+        """
+        return Transform(step * round(self.dy / step), step * round(self.dx / step), 0.0,
+                         self.method, self.n_matches)
+
+    def inverse(self):
+        """Transformación referencia → sub."""
+        t = Transform(angle_deg=-self.angle_deg, method=self.method, n_matches=self.n_matches)
+        moved = t.apply([[self.dy, self.dx]])[0]
+        t.dy, t.dx = -float(moved[0]), -float(moved[1])
+        return t
+
+    def apply(self, yx):
+        """Lleva puntos `(N, 2)` en (y, x) del sub a la referencia."""
+        yx = np.asarray(yx, dtype=np.float64)
+        a = math.radians(self.angle_deg)
+        c, s = math.cos(a), math.sin(a)
+        y, x = yx[:, 0], yx[:, 1]
+        return np.column_stack([s * x + c * y + self.dy, c * x - s * y + self.dx])
+
+
+def _fit_rigid(src, dst):
+    """Rotación + traslación de mínimos cuadrados (Kabsch 2D) que lleva `src` a `dst` (y, x)."""
+    sc, dc = src.mean(axis=0), dst.mean(axis=0)
+    ps, pd = src - sc, dst - dc
+    # En (x, y): θ = atan2(Σ px·qy - py·qx, Σ px·qx + py·qy)
+    num = np.sum(ps[:, 1] * pd[:, 0] - ps[:, 0] * pd[:, 1])
+    den = np.sum(ps[:, 1] * pd[:, 1] + ps[:, 0] * pd[:, 0])
+    t = Transform(angle_deg=math.degrees(math.atan2(num, den)))
+    moved = t.apply(sc[None, :])[0]
+    t.dy, t.dx = float(dc[0] - moved[0]), float(dc[1] - moved[1])
+    return t
+
+
+# ----------------------------------------------------------
+# DETECCIÓN DE ESTRELLAS
+# ----------------------------------------------------------
+def background_map(image, box=BACKGROUND_BOX):
+    """Fondo suave: mediana por celdas de `box`×`box` interpolada bilinealmente."""
+    img = np.asarray(image, dtype=np.float32)
+    h, w = img.shape
+    ny, nx = math.ceil(h / box), math.ceil(w / box)
+    padded = np.full((ny * box, nx * box), np.nan, dtype=np.float32)
+    padded[:h, :w] = img
+    cells = padded.reshape(ny, box, nx, box).transpose(0, 2, 1, 3).reshape(ny, nx, box * box)
+    with warnings.catch_warnings():
+        # Celdas sin datos (bordes en NaN tras registrar) dan "All-NaN slice"
+        warnings.simplefilter("ignore", RuntimeWarning)
+        grid = np.nanmedian(cells, axis=-1)
+        fill = np.nanmedian(grid) if np.isfinite(grid).any() else 0.0
+    grid = np.where(np.isfinite(grid), grid, fill).astype(np.float32)
+    return upsample_grid(grid, (h, w), box)
+
+
+def upsample_grid(grid, shape, box):
+    """
+    Interpola bilinealmente una grilla de celdas de `box` px (valor en el
+    centro de cada celda) a un frame `shape`; fuera de los centros extremos
+    se extiende el borde.
+    """
+    h, w = shape
+    ny, nx = grid.shape
+
+    def _axis(n, cells_n):
+        pos = np.clip((np.arange(n) + 0.5) / box - 0.5, 0, cells_n - 1)
+        i0 = np.minimum(pos.astype(int), max(cells_n - 2, 0))
+        return i0, np.minimum(i0 + 1, cells_n - 1), (pos - i0).astype(np.float32)
+
+    y0, y1, ty = _axis(h, ny)
+    x0, x1, tx = _axis(w, nx)
+    top = grid[y0][:, x0] * (1 - tx) + grid[y0][:, x1] * tx
+    bottom = grid[y1][:, x0] * (1 - tx) + grid[y1][:, x1] * tx
+    return top * (1 - ty)[:, None] + bottom * ty[:, None]
+
+
+def detect_stars(image, sigma=DETECT_SIGMA, max_stars=MAX_STARS, box=BACKGROUND_BOX, min_separation=None):
+    """
+    Estrellas de `image` como arreglo `(N, 3)` con columnas `y, x, flujo`,
+    ordenadas de más a menos brillante. De dos picos a menos de
+    `min_separation` px (por defecto 2·CENTROID_RADIUS) queda el más
+    brillante; en campos densos conviene bajarlo.
+    """
+    img = np.asarray(image, dtype=np.float32)
+    h, w = img.shape
+    residual = np.nan_to_num(img - background_map(img, box))
+    noise = background_noise(residual)
+    if not noise > 0:
+        return np.empty((0, 3))
+
+    # Suavizado 3×3 (media) y máximos locales en su vecindad 8
+    smooth = _smooth3(residual)
+    r = CENTROID_RADIUS
+    core = smooth[r:h - r, r:w - r]
+    peak = core > sigma * noise / 3
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                peak &= core >= smooth[r + dy:h - r + dy, r + dx:w - r + dx]
+    ys, xs = np.nonzero(peak)
+    ys, xs = ys + r, xs + r
+    sharp = residual[ys, xs] / np.maximum(smooth[ys, xs], 1e-6)
+    keep = sharp < SHARP_MAX
+    ys, xs = ys[keep], xs[keep]
+    if ys.size == 0:
+        return np.empty((0, 3))
+    order = np.argsort(smooth[ys, xs])[::-1][:4 * max_stars]
+    ys, xs = ys[order], xs[order]
+
+    # Centroides en ventanas (2r+1)² recogidas de una vez
+    off = np.arange(-r, r + 1)
+    win = residual[ys[:, None, None] + off[None, :, None], xs[:, None, None] + off[None, None, :]]
+    weight = np.clip(win, 0, None)
+    total = weight.sum(axis=(1, 2))
+    ok = total > 0
+    cy = ys + (weight * off[None, :, None]).sum(axis=(1, 2)) / np.where(ok, total, 1)
+    cx = xs + (weight * off[None, None, :]).sum(axis=(1, 2)) / np.where(ok, total, 1)
+    stars = np.column_stack([cy, cx, win.sum(axis=(1, 2))])[ok]
+    stars = stars[np.argsort(stars[:, 2])[::-1]]
+
+    # Mesetas (estrellas saturadas) dan varios picos: se queda el más brillante
+    return stars[~_brighter_neighbour(stars, min_separation or 2 * r)][:max_stars]
+
+
+def _brighter_neighbour(stars, radius):
+    """
+    Máscara de las estrellas (ordenadas por brillo) con otra más brillante a
+    menos de `radius` px. Se ordena por fila y sólo se comparan las vecinas
+    dentro de ±`radius` filas, así no hace falta la matriz N×N de distancias.
+    """
+    by_y = np.argsort(stars[:, 0], kind="stable")
+    ys = stars[by_y, 0]
+    lo = np.searchsorted(ys, ys - radius)
+    hi = np.searchsorted(ys, ys + radius, side="right")
+    if not len(stars):
+        return np.zeros(0, dtype=bool)
+    idx = lo[:, None] + np.arange((hi - lo).max())
+    valid = idx < hi[:, None]
+    other = by_y[np.minimum(idx, len(stars) - 1)]
+    d = np.hypot(stars[other, 0] - stars[by_y, None, 0], stars[other, 1] - stars[by_y, None, 1])
+    dup = np.zeros(len(stars), dtype=bool)
+    dup[by_y] = (valid & (d < radius) & (other < by_y[:, None])).any(axis=1)
+    return dup
+
+
+# ----------------------------------------------------------
+# EMPAREJAMIENTO POR TRIÁNGULOS
+# ----------------------------------------------------------
+def _triangles(stars, n=TRIANGLE_STARS):
+    """
+    Triángulos de las `n` estrellas más brillantes: (invariantes, vértices)
+    con vértices ordenados por el largo del lado opuesto y los invariantes
+    (a/c, b/c) para lados a ≤ b ≤ c.
+    """
+    pts = stars[:n, :2]
+    if len(pts) < 3:
+        return np.empty((0, 2)), np.empty((0, 3), dtype=int), np.empty(0)
+    idx = np.array(list(itertools.combinations(range(len(pts)), 3)))
+    p = pts[idx]
+    sides = np.stack([np.hypot(*(p[:, 1] - p[:, 2]).T), np.hypot(*(p[:, 0] - p[:, 2]).T),
+                      np.hypot(*(p[:, 0] - p[:, 1]).T)], axis=1)
+    order = np.argsort(sides, axis=1)
+    sides = np.take_along_axis(sides, order, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    keep = sides[:, 0] > MIN_SIDE_PX
+    features = sides[keep, :2] / sides[keep, 2:]
+    return features, idx[keep], sides[keep, 2]
+
+
+def _count_matches(t, ref, stars):
+    """Pares (i_sub, i_ref) a menos de MATCH_RADIUS_PX tras aplicar `t` (vecino más cercano mutuo)."""
+    moved = t.apply(stars[:, :2])
+    d = np.hypot(moved[:, None, 0] - ref[None, :, 0], moved[:, None, 1] - ref[None, :, 1])
+    nearest = d.argmin(axis=1)
+    mutual = d.argmin(axis=0)[nearest] == np.arange(len(stars))
+    ok = mutual & (d[np.arange(len(stars)), nearest] < MATCH_RADIUS_PX)
+    return np.nonzero(ok)[0], nearest[ok]
+
+
+def match_stars(ref, stars):
+    """
+    Transformación que lleva `stars` sobre `ref` (ambas de `detect_stars`),
+    o None si no se encuentran al menos MIN_MATCHES estrellas en común.
+    """
+    f_ref, v_ref, c_ref = _triangles(ref)
+    f_sub, v_sub, c_sub = _triangles(stars)
+    if not len(f_ref) or not len(f_sub):
+        return None
+
+    d = np.hypot(f_ref[:, None, 0] - f_sub[None, :, 0], f_ref[:, None, 1] - f_sub[None, :, 1])
+    i_ref, i_sub = np.nonzero(d < TRIANGLE_TOL)
+    scale_ok = np.abs(c_sub[i_sub] / c_ref[i_ref] - 1) < SCALE_TOL
+    i_ref, i_sub = i_ref[scale_ok], i_sub[scale_ok]
+    order = np.argsort(d[i_ref, i_sub])[:MAX_CANDIDATES]
+
+    best, best_pairs = None, ((), ())
+    for k in order:
+        t = _fit_rigid(stars[v_sub[i_sub[k]], :2], ref[v_ref[i_ref[k]], :2])
+        pairs = _count_matches(t, ref[:, :2], stars)
+        if len(pairs[0]) > len(best_pairs[0]):
+            best, best_pairs = t, pairs
+            if len(pairs[0]) >= 0.8 * min(len(ref), len(stars)):
+                break
+    if best is None or len(best_pairs[0]) < MIN_MATCHES:
+        return None
+
+    # Refinamiento con todas las estrellas emparejadas
+    for _ in range(3):
+        best = _fit_rigid(stars[best_pairs[0], :2], ref[best_pairs[1], :2])
+        pairs = _count_matches(best, ref[:, :2], stars)
+        if np.array_equal(pairs[0], best_pairs[0]):
+            break
+        best_pairs = pairs
+    best.n_matches = len(best_pairs[0])
+    return best
+
+
+# ----------------------------------------------------------
+# CORRELACIÓN DE FASE (RESPALDO)
+# ----------------------------------------------------------
+def _center_crop(frame, size):
+    h, w = frame.shape
+    size = min(size, h, w)
+    r0, c0 = (h - size) // 2, (w - size) // 2
+    return np.nan_to_num(np.asarray(frame[r0:r0 + size, c0:c0 + size], dtype=np.float32))
+
+
+def _smooth3(image):
+    """Media 3×3 (bordes en 0)."""
+    h, w = image.shape
+    out = np.zeros_like(image)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            out[1:-1, 1:-1] += image[1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx]
+    return out / 9
+
+
+def _median3(image):
+    """Mediana 3×3 (bordes en 0)."""
+    h, w = image.shape
+    out = np.zeros_like(image)
+    shifted = np.stack([image[1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx]
+                        for dy in (-1, 0, 1) for dx in (-1, 0, 1)])
+    out[1:-1, 1:-1] = np.median(shifted, axis=0)
+    return out
+
+
+def _crop_fft(crop):
+    """
+    FFT del recorte sin fondo y con mediana 3×3: la mediana borra los píxeles
+    calientes, que son fijos en el sensor y si no arrastran el pico de la
+    correlación a (0, 0) en subs sin calibrar.
+    """
+    residual = _median3(crop - background_map(crop))
+    window = np.outer(np.hanning(crop.shape[0]), np.hanning(crop.shape[1])).astype(np.float32)
+    return np.fft.rfft2(np.clip(residual, 0, None) * window)
+
+
+def _parabola_peak(c_minus, c0, c_plus):
+    den = c_minus - 2 * c0 + c_plus
+    return 0.0 if den == 0 else float(0.5 * (c_minus - c_plus) / den)
+
+
+def phase_shift(ref_fft, frame, crop=REGISTER_CROP, subpixel=True):
+    """
+    Desplazamiento `(dy, dx)` que alinea `frame` con la referencia
+    (correlación de fase sobre el recorte central). Con `subpixel`, el
+    pico se refina con una parábola en cada eje.
+    """
+    f = _crop_fft(_center_crop(frame, crop))
+    cross = ref_fft * np.conj(f)
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    corr = np.fft.irfft2(cross, s=(f.shape[0], (f.shape[1] - 1) * 2))
+    py, px = np.unravel_index(np.argmax(corr), corr.shape)
+    h, w = corr.shape
+    dy, dx = (py - h if py > h // 2 else py), (px - w if px > w // 2 else px)
+    if not subpixel:
+        return int(dy), int(dx)
+    fy = _parabola_peak(corr[(py - 1) % h, px], corr[py, px], corr[(py + 1) % h, px])
+    fx = _parabola_peak(corr[py, (px - 1) % w], corr[py, px], corr[py, (px + 1) % w])
+    return float(dy + fy), float(dx + fx)
+
+
+# ----------------------------------------------------------
+# REMUESTREO
+# ----------------------------------------------------------
+def shift_frame(frame, dy, dx):
+    """Desplaza un frame en píxeles enteros; los bordes descubiertos quedan en NaN."""
+    if dy == 0 and dx == 0:
+        return frame
+    out = np.full_like(frame, np.nan)
+    h, w = frame.shape
+    ys, yd = (slice(0, h - dy), slice(dy, h)) if dy >= 0 else (slice(-dy, h), slice(0, h + dy))
+    xs, xd = (slice(0, w - dx), slice(dx, w)) if dx >= 0 else (slice(-dx, w), slice(0, w + dx))
+    out[yd, xd] = frame[ys, xs]
+    return out
+
+
+def warp_frame(frame, transform, band_rows=WARP_BAND_ROWS):
+    """
+    Lleva `frame` al sistema de la referencia. Las traslaciones enteras se
+    copian tal cual; el resto se interpola bilinealmente por bandas de filas.
+    Lo que cae fuera del sub queda en NaN.
+    """
+    frame = np.asarray(frame, dtype=np.float32)
+    shift = transform.integer_shift
+    if shift is not None:
+        return shift_frame(frame, *shift)
+
+    h, w = frame.shape
+    flat = frame.ravel()
+    a = math.radians(transform.angle_deg)
+    c, s = math.cos(a), math.sin(a)
+    out = np.empty((h, w), dtype=np.float32)
+    xq = np.arange(w, dtype=np.float64)[None, :] - transform.dx
+    for r0 in range(0, h, band_rows):
+        r1 = min(h, r0 + band_rows)
+        yq = np.arange(r0, r1, dtype=np.float64)[:, None] - transform.dy
+        # Inversa: p = Rᵀ·(q - t)
+        px = c * xq + s * yq
+        py = c * yq - s * xq
+        x0, y0 = np.floor(px), np.floor(py)
+        fx, fy = (px - x0).astype(np.float32), (py - y0).astype(np.float32)
+        valid = (x0 >= 0) & (x0 < w - 1) & (y0 >= 0) & (y0 < h - 1)
+        i = (np.clip(y0, 0, h - 2) * w + np.clip(x0, 0, w - 2)).astype(np.intp)
+        top = flat.take(i) * (1 - fx) + flat.take(i + 1) * fx
+        bottom = flat.take(i + w) * (1 - fx) + flat.take(i + w + 1) * fx
+        out[r0:r1] = np.where(valid, top * (1 - fy) + bottom * fy, np.nan)
+    return out
+
+
+# ----------------------------------------------------------
+# CACHÉ DE ESTRELLAS
+# ----------------------------------------------------------
+class StarCache:
+    """Listas de estrellas por sub en disco (`<clave>.npy`)."""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else default_cache_dir()
+
+    def _path(self, key_path, params):
+        key_path = Path(key_path).resolve()
+        st = key_path.stat()
+        text = json.dumps([str(key_path), st.st_size, st.st_mtime_ns, params], sort_keys=True)
+        return self.root / f"{hashlib.sha256(text.encode('utf-8')).hexdigest()[:24]}.npy"
+
+    def get(self, key_path, **params):
+        path = self._path(key_path, params)
+        return np.load(path) if path.exists() else None
+
+    def put(self, key_path, stars, **params):
+        path = self._path(key_path, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Escritura atómica: varios hilos pueden registrar a la vez
+        tmp = path.with_suffix(f".{os.getpid()}.{id(stars)}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, stars)
+        os.replace(tmp, path)
+        return path
+
+
+# ----------------------------------------------------------
+# REGISTRO DE UNA SERIE
+# ----------------------------------------------------------
+def register_frames(frames, reference=0, threads=None, cache=None, keys=None,
+                    sigma=DETECT_SIGMA, max_stars=MAX_STARS, crop=REGISTER_CROP, tag=None):
+    """
+    Transformaciones que alinean cada frame con `frames[reference]`.
+
+    `frames`: rutas, `FrameSource`, `FrameStack` o arreglo (N, alto, ancho).
+    `cache`: `StarCache` (o None para no cachear); `keys`: rutas que
+    identifican cada frame en el caché (por defecto, las de `frames` si son
+    rutas). `tag` distingue detecciones del mismo archivo hechas sobre datos
+    distintos (p. ej. subs ya calibrados).
+    """
+    sources = as_sources(frames)
+    if not sources:
+        raise ValueError("register_frames necesita al menos un frame")
+    if keys is None and isinstance(frames, (list, tuple)) and all(
+            isinstance(f, (str, Path)) for f in frames):
+        keys = list(frames)
+    params = {"sigma": sigma, "max_stars": max_stars, "tag": tag}
+
+    def _stars(i, image=None):
+        key = keys[i] if cache is not None and keys is not None else None
+        if key is not None:
+            cached = cache.get(key, **params)
+            if cached is not None:
+                return cached
+        image = sources[i].read() if image is None else image
+        stars = detect_stars(image, sigma=sigma, max_stars=max_stars)
+        if key is not None:
+            cache.put(key, stars, **params)
+        return stars
+
+    ref_image = sources[reference].read()
+    ref_stars = _stars(reference, ref_image)
+    ref_fft = _crop_fft(_center_crop(ref_image, crop))
+    del ref_image
+
+    def _register(i):
+        if i == reference:
+            return Transform(method="reference", n_matches=len(ref_stars))
+        t = match_stars(ref_stars, _stars(i))
+        if t is None:
+            t = Transform(*phase_shift(ref_fft, sources[i].read(), crop), method="phase")
+        return t
+
+    threads = threads or min(4, os.cpu_count() or 1)
+    if threads == 1:
+        return [_register(i) for i in range(len(sources))]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(_register, range(len(sources))))
+
+
+def align_stack(work, transforms, threads=None):
+    """Aplica `transforms` en su lugar a una `FrameStack` (en paralelo, un frame por tarea)."""
+    def _align(i):
+        t = transforms[i]
+        if t.integer_shift == (0, 0):
+            return
+        work.write(i, warp_frame(work.read(i), t))
+
+    threads = threads or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(_align, range(len(work))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Registro de subs por estrellas (respaldo: correlación de fase).")
+    parser.add_argument("subs", nargs="*", type=Path, help="Subs (.npy/.fits).")
+    parser.add_argument("--reference", type=int, default=0, help="Índice del sub de referencia.")
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--sigma", type=float, default=DETECT_SIGMA, help="Umbral de detección (σ).")
+    parser.add_argument("--cache-dir", type=Path, help="Caché de estrellas (por defecto ~/.orionlab/stars).")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--out-dir", type=Path, help="Guarda los subs alineados (.npy).")
+    parser.add_argument("--demo", type=int, metavar="N", help="Registra N subs sintéticos.")
+    parser.add_argument("--rotation", type=float, default=0.0,
+                        help="Con --demo: rotación máxima de campo (grados).")
+    args = parser.parse_args(argv)
+
+    truth = None
+    if args.demo:
+        from orionlab_frames import synthetic_session
+
+        session_shape = (512, 512)
+        session = synthetic_session(tempfile.mkdtemp(prefix="orionlab_reg_demo_"), n_lights=args.demo,
+                                    n_bias=0, n_darks=0, n_flats=0, shape=session_shape,
+                                    max_rotation_deg=args.rotation)
+        args.subs = session["lights"]
+        # Transformación real sub → referencia: inversa del desplazamiento y
+        # la rotación (en torno al centro) aplicados al generar cada sub
+        center = np.array([[session_shape[0] / 2, session_shape[1] / 2]])
+        truth = []
+        for (sy, sx), rot in zip(session["shifts"], session["rotations"]):
+            t = Transform(angle_deg=-rot)
+            moved = t.apply(center + [sy, sx])[0]
+            t.dy, t.dx = center[0, 0] - moved[0], center[0, 1] - moved[1]
+            truth.append(t)
+    elif not args.subs:
+        parser.error("indique los subs o use --demo")
+
+    cache = None if args.no_cache else StarCache(args.cache_dir)
+    transforms = register_frames(args.subs, reference=args.reference, threads=args.threads,
+                                 cache=cache, sigma=args.sigma)
+    for i, (path, t) in enumerate(zip(args.subs, transforms)):
+        line = (f"  {'✅' if t.method != 'phase' else '↷'} {Path(path).name:<24} "
+                f"dy {t.dy:8.2f}  dx {t.dx:8.2f}  rot {t.angle_deg:7.3f}°  "
+                f"{t.method:<9} {t.n_matches:>3} estrellas")
+        if truth:
+            line += f"   (real: {truth[i].dy:+.2f}, {truth[i].dx:+.2f}, {truth[i].angle_deg:+.3f}°)"
+        print(line)
+
+    if args.out_dir:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        for source, path, t in zip(as_sources(args.subs), args.subs, transforms):
+            save_frame(args.out_dir / f"{Path(path).stem}_reg.npy", warp_frame(source.read(), t))
+        print(f"✅ Subs alineados: {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+orionlab_snr.py
+
+Motor vectorizado del modelo SNR de P05 (exposición larga vs SNR).
+
+Construye la grilla completa cámara × exposición × ISO/gain × Bortle × filtro ×
+temperatura de cielo × temperatura de sensor como arreglos NumPy (índice
+cartesiano) y calcula señal, ruidos, SNR y `recommended_subs` en una sola
+pasada, sin loops anidados ni un dict por fila.
+
+Con la misma semilla entrega exactamente las mismas columnas y valores que el
+loop original de `setup_p05_long_exposure_snr.generate_snr_dataset`.
+
+Para planificación en terreno, `expected_snr` y `recommended_subs` evalúan el
+mismo modelo de forma analítica para valores fuera de la grilla, sin generar
+tabla (escalares o arreglos en lote).
+
+Uso:
+    from orionlab_snr import snr_grid, expected_snr, recommended_subs
+    df = snr_grid(seed=42)
+    snr = expected_snr("ZWO ASI533MC Pro", 150, 4.5, "Optolong L-Quad Enhance", -5)
+    subs = recommended_subs("Nikon D7500", 120, 5, "None", 18, target_snr=80)
+"""
+
+import datetime as dt
+import math
+
+import numpy as np
+
+# pandas y orionlab_io (pyarrow) se importan dentro de las funciones que arman
+# tablas, para que las consultas puntuales (`orionlab.py plan`) partan rápido.
+
+# ----------------------------------------------------------
+# EJES POR DEFECTO DEL ESTUDIO P05
+# ----------------------------------------------------------
+CAMERAS = [
+    {"name": "Nikon D7500", "type": "DSLR", "read_noise": 5.0, "dark_current": 0.02},
+    {"name": "ZWO ASI533MC Pro", "type": "Cooled", "read_noise": 1.5, "dark_current": 0.003},
+]
+
+EXPOSURES = [30, 60, 120, 180, 240, 300]  # segundos
+ISOS = [800, 1600, 3200]
+BORTLE_CLASSES = [3, 4, 5, 6]  # 3 = bueno, 6 = ciudad mejorada
+BORTLE_RANGE = (2, 9)          # dominio del modelo: el ruido de cielo usa √(bortle - 2)
+FILTERS = ["None", "Optolong L-Enhance", "Optolong L-Quad Enhance"]
+SKY_TEMPS = [0, 5, 10, 15]  # °C
+SENSOR_TEMPS = [-10, 0, 5, 10]  # °C para la ASI; DSLR ~ambiente
+
+TARGET_SNR = 100
+
+COLUMNS = [
+    "camera", "camera_type", "exposure_s", "iso_gain", "bortle_class", "filter",
+    "sky_temp_c", "sensor_temp_c", "read_noise_e", "dark_current_e_s", "signal_e",
+    "total_noise_e", "snr_single_sub", "target_snr", "recommended_subs", "scenario_date",
+]
+
+# Columnas que se guardan codificadas como diccionario en Parquet
+CATEGORICAL = ["camera", "camera_type", "filter", "scenario_date"]
+
+
+def grid_shape(cameras=CAMERAS, exposures=EXPOSURES, isos=ISOS,
+               bortle_classes=BORTLE_CLASSES, filters=FILTERS,
+               sky_temps=SKY_TEMPS, sensor_temps=SENSOR_TEMPS):
+    """Tamaño de cada eje, en el mismo orden de anidación que el loop original."""
+    return (len(cameras), len(exposures), len(isos), len(bortle_classes),
+            len(filters), len(sky_temps), len(sensor_temps))
+
+
+def _legacy_draws(rng, is_dslr):
+    """
+    Sortea offset térmico y factor de señal respetando el orden del loop original:
+    por cada fila DSLR un `normal(3, 1)` seguido de un `uniform(0.9, 1.1)`, y por
+    cada fila refrigerada sólo el `uniform`.
+
+    Los tramos refrigerados se sortean en bloque (mismo flujo que llamadas
+    escalares); sólo los tramos DSLR, que intercalan dos distribuciones,
+    necesitan recorrerse por pares.
+    """
+    n = len(is_dslr)
+    temp_offset = np.zeros(n)
+    gain = np.empty(n)
+
+    # Tramos consecutivos con el mismo tipo de cámara
+    edges = np.flatnonzero(np.diff(is_dslr.astype(np.int8))) + 1
+    starts = np.concatenate(([0], edges))
+    stops = np.concatenate((edges, [n]))
+
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if is_dslr[start]:
+            for i in range(start, stop):
+                temp_offset[i] = rng.normal(3, 1)
+                gain[i] = rng.uniform(0.9, 1.1)
+        else:
+            gain[start:stop] = rng.uniform(0.9, 1.1, size=stop - start)
+
+    return temp_offset, gain
+
+
+def _round(values, ndigits):
+    """Redondeo idéntico al `round()` de Python (NumPy puede diferir en casos límite)."""
+    rounded = np.round(values, ndigits)
+    # np.round escala por 10**n antes de redondear; se corrigen los pocos casos
+    # en que eso cambia el resultado respecto del redondeo decimal exacto.
+    check = np.abs(values - rounded) * 10 ** ndigits
+    suspect = np.flatnonzero(np.abs(check - 0.5) < 1e-9)
+    for i in suspect.tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+# Operaciones para evaluar el modelo sobre arreglos o, más rápido, sobre escalares
+_ARRAY_OPS = (np.sqrt, np.where, np.maximum)
+_SCALAR_OPS = (math.sqrt, lambda cond, a, b: a if cond else b, max)
+
+
+def _noise_model(exp, bortle, filtered, sensor_temp, read_noise, dark_current_ref,
+                 ops=_ARRAY_OPS):
+    """
+    Física del modelo P05, común a la grilla y a las consultas puntuales.
+
+    Devuelve (señal base sin dispersión, dark current efectiva, ruido total),
+    todo en electrones. Con `_ARRAY_OPS` acepta arreglos que hagan broadcast;
+    con `_SCALAR_OPS` sólo escalares Python, sin overhead de NumPy.
+    """
+    sqrt, where, maximum = ops
+
+    # Señal simulada (electrones) según exposición, filtro y Bortle
+    base_signal = 500 * (exp / 60)
+    base_signal = base_signal * where(filtered, 1.2, 1.0)
+    base_signal = base_signal * maximum(0.4, 1.0 - 0.08 * (bortle - 3))  # cielo peor, menos señal útil
+
+    # Ruido: lectura, dark current, sky background (peor Bortle -> más ruido).
+    # La recta de dark current cruza 0 bajo ~-24 °C: se acota en 0.
+    dark_current = maximum(0.0, dark_current_ref * (1 + 0.07 * (sensor_temp + 10)))
+    dark_noise = sqrt(dark_current * exp)
+    sky_noise = sqrt(100 * (bortle - 2) * (exp / 60))
+
+    total_noise = sqrt(read_noise**2 + dark_noise**2 + sky_noise**2)
+    return base_signal, dark_current, total_noise
+
+
+def _required_subs(snr, target_snr):
+    """Subs necesarios para llegar a `target_snr` apilando (SNR ∝ √N)."""
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        required = np.floor((target_snr / snr) ** 2)
+    return np.where(snr > 0, np.maximum(1, required), 999).astype(np.int64)
+
+
+def _axes(cameras, exposures, isos, bortle_classes, filters, sky_temps, sensor_temps):
+    """Convierte las listas de ejes en arreglos NumPy indexables."""
+    return {
+        "cam_name": np.array([c["name"] for c in cameras], dtype=object),
+        "cam_type": np.array([c["type"] for c in cameras], dtype=object),
+        "cam_read": np.array([c["read_noise"] for c in cameras], dtype=float),
+        "cam_dark": np.array([c["dark_current"] for c in cameras], dtype=float),
+        "exposure": np.asarray(exposures),
+        "iso": np.asarray(isos),
+        "bortle": np.asarray(bortle_classes),
+        "filter": np.array(filters, dtype=object),
+        "sky_temp": np.asarray(sky_temps),
+        "sensor_temp": np.asarray(sensor_temps),
+    }
+
+
+def _evaluate(flat, shape, axes, temp_offset, gain, target_snr, scenario_date):
+    """
+    Evalúa el modelo de ruido para las filas `flat` (índices planos de la grilla)
+    dados el offset térmico DSLR y el factor de señal ya sorteados.
+    """
+    import pandas as pd
+
+    i_cam, i_exp, i_iso, i_bortle, i_filt, i_sky, i_sensor = np.unravel_index(flat, shape)
+
+    exp = axes["exposure"][i_exp]
+    bortle = axes["bortle"][i_bortle]
+    sky_t = axes["sky_temp"][i_sky]
+    is_dslr = (axes["cam_type"] == "DSLR")[i_cam]
+
+    # Ajuste simple: DSLR más caliente, ASI se mantiene más fría
+    sensor_temp_eff = np.where(is_dslr, sky_t + temp_offset, axes["sensor_temp"][i_sensor])
+
+    read_noise = axes["cam_read"][i_cam]
+    base_signal, dark_current, total_noise = _noise_model(
+        exp, bortle, (axes["filter"] != "None")[i_filt], sensor_temp_eff,
+        read_noise, axes["cam_dark"][i_cam],
+    )
+    signal_e = base_signal * gain
+    snr = signal_e / (total_noise + 1e-6)
+    required_subs = _required_subs(snr, target_snr)
+
+    return pd.DataFrame({
+        "camera": axes["cam_name"][i_cam],
+        "camera_type": axes["cam_type"][i_cam],
+        "exposure_s": exp,
+        "iso_gain": axes["iso"][i_iso],
+        "bortle_class": bortle,
+        "filter": axes["filter"][i_filt],
+        "sky_temp_c": sky_t,
+        "sensor_temp_c": _round(sensor_temp_eff.astype(float), 1),
+        "read_noise_e": _round(read_noise, 2),
+        "dark_current_e_s": _round(dark_current, 4),
+        "signal_e": _round(signal_e, 1),
+        "total_noise_e": _round(total_noise, 2),
+        "snr_single_sub": _round(snr, 1),
+        "target_snr": target_snr,
+        "recommended_subs": required_subs,
+        "scenario_date": scenario_date,
+    }, columns=COLUMNS)
+
+
+def snr_grid(cameras=CAMERAS, exposures=EXPOSURES, isos=ISOS,
+             bortle_classes=BORTLE_CLASSES, filters=FILTERS,
+             sky_temps=SKY_TEMPS, sensor_temps=SENSOR_TEMPS,
+             seed=42, target_snr=TARGET_SNR, scenario_date=None):
+    """
+    Calcula la grilla SNR completa de P05 como arreglos broadcast.
+
+    Devuelve un DataFrame con las columnas de `COLUMNS`, una fila por
+    combinación, en el mismo orden que los loops anidados originales.
+    """
+    if scenario_date is None:
+        scenario_date = dt.datetime.now().date().isoformat()
+
+    shape = grid_shape(cameras, exposures, isos, bortle_classes, filters,
+                       sky_temps, sensor_temps)
+    axes = _axes(cameras, exposures, isos, bortle_classes, filters, sky_temps, sensor_temps)
+    flat = np.arange(int(np.prod(shape)), dtype=np.intp)
+
+    is_dslr = (axes["cam_type"] == "DSLR")[np.unravel_index(flat, shape)[0]]
+    rng = np.random.default_rng(seed)
+    temp_offset, gain = _legacy_draws(rng, is_dslr)
+
+    return _evaluate(flat, shape, axes, temp_offset, gain, target_snr, scenario_date)
+
+
+# ----------------------------------------------------------
+# MODO STREAMING (grillas que no caben en RAM)
+# ----------------------------------------------------------
+DRAWS_PER_ROW = 3  # factor de señal + dos uniformes para el offset DSLR (Box-Muller)
+
+
+def _stream_draws(seed, start, stop):
+    """
+    Sorteos de las filas [start, stop) de un flujo PCG64 indexado por fila.
+
+    Cada fila consume siempre `DRAWS_PER_ROW` dobles, así que basta con
+    avanzar el generador hasta `start` para obtener exactamente los mismos
+    valores sin importar cómo se corte la grilla en chunks.
+    """
+    bit_gen = np.random.PCG64(seed)
+    bit_gen.advance(DRAWS_PER_ROW * start)
+    u = np.random.Generator(bit_gen).random((stop - start, DRAWS_PER_ROW))
+
+    gain = 0.9 + 0.2 * u[:, 0]
+    # normal(3, 1) vía Box-Muller: consumo fijo de dos uniformes por fila
+    temp_offset = 3 + np.sqrt(-2.0 * np.log1p(-u[:, 1])) * np.cos(2.0 * np.pi * u[:, 2])
+    return temp_offset, gain
+
+
+def iter_snr_chunks(chunk_rows=1_000_000, cameras=CAMERAS, exposures=EXPOSURES,
+                    isos=ISOS, bortle_classes=BORTLE_CLASSES, filters=FILTERS,
+                    sky_temps=SKY_TEMPS, sensor_temps=SENSOR_TEMPS,
+                    seed=42, target_snr=TARGET_SNR, scenario_date=None):
+    """
+    Genera la grilla SNR en DataFrames de a lo más `chunk_rows` filas.
+
+    Sólo se materializa un chunk a la vez. Los sorteos salen de un flujo
+    indexado por fila (ver `_stream_draws`), por lo que el resultado concatenado
+    no depende de `chunk_rows`. Ese flujo es distinto al del loop original:
+    para reproducir el CSV histórico de P05 usar `snr_grid`.
+    """
+    if scenario_date is None:
+        scenario_date = dt.datetime.now().date().isoformat()
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows debe ser >= 1")
+
+    shape = grid_shape(cameras, exposures, isos, bortle_classes, filters,
+                       sky_temps, sensor_temps)
+    axes = _axes(cameras, exposures, isos, bortle_classes, filters, sky_temps, sensor_temps)
+    n_rows = int(np.prod(shape))
+
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        temp_offset, gain = _stream_draws(seed, start, stop)
+        flat = np.arange(start, stop, dtype=np.intp)
+        yield _evaluate(flat, shape, axes, temp_offset, gain, target_snr, scenario_date)
+
+
+def write_snr_table(path, chunk_rows=1_000_000, **grid_kwargs):
+    """
+    Escribe la grilla SNR en `path` (CSV + Parquet hermano) chunk a chunk.
+
+    El peak de memoria queda acotado por `chunk_rows`, no por el tamaño de la
+    grilla. Devuelve el número total de filas escritas.
+    """
+    from orionlab_io import TableWriter
+
+    with TableWriter(path, categorical=CATEGORICAL) as writer:
+        for chunk in iter_snr_chunks(chunk_rows=chunk_rows, **grid_kwargs):
+            writer.write(chunk)
+    return writer.n_rows
+
+
+# ----------------------------------------------------------
+# CONSULTAS PUNTUALES (planificación en terreno)
+# ----------------------------------------------------------
+_CAMERA_INDEX = {c["name"]: c for c in CAMERAS}
+
+
+def _camera_params(camera):
+    """Ruido de lectura y dark current de referencia para uno o varios nombres de cámara."""
+    if isinstance(camera, dict):
+        return camera["read_noise"], camera["dark_current"]
+    names = np.asarray(camera, dtype=object)
+    try:
+        if names.ndim == 0:
+            cam = _CAMERA_INDEX[names.item()]
+            return cam["read_noise"], cam["dark_current"]
+        read = np.array([_CAMERA_INDEX[n]["read_noise"] for n in names.ravel()]).reshape(names.shape)
+        dark = np.array([_CAMERA_INDEX[n]["dark_current"] for n in names.ravel()]).reshape(names.shape)
+    except KeyError as exc:
+        raise ValueError(f"Cámara desconocida: {exc.args[0]!r} (opciones: {list(_CAMERA_INDEX)})")
+    return read, dark
+
+
+def _check_domain(exposure_s, bortle_class):
+    """Mismo ValueError por la vía escalar y la de arreglos fuera del dominio del modelo."""
+    lo, hi = BORTLE_RANGE
+    if isinstance(exposure_s, (int, float)) and isinstance(bortle_class, (int, float)):
+        exposure_ok = exposure_s > 0
+        bortle_ok = lo <= bortle_class <= hi
+    else:
+        exposure = np.asarray(exposure_s, dtype=float)
+        bortle = np.asarray(bortle_class, dtype=float)
+        exposure_ok = bool(np.all(exposure > 0))
+        bortle_ok = bool(np.all((bortle >= lo) & (bortle <= hi)))
+    if not exposure_ok:
+        raise ValueError(f"La exposición debe ser > 0 s: {exposure_s!r}")
+    if not bortle_ok:
+        raise ValueError(f"Bortle fuera del rango del modelo P05 ({lo}–{hi}): {bortle_class!r}")
+
+
+def expected_snr(camera, exposure_s, bortle_class, filter, sensor_temp_c):
+    """
+    SNR esperado por sub evaluando el modelo de P05 directamente (sin tabla).
+
+    Acepta valores fuera de la grilla (p. ej. 95 s, Bortle 4.5, -3 °C) y
+    arreglos que hagan broadcast para consultas en lote. `camera` es un nombre
+    de `CAMERAS` (o un arreglo de nombres) o un dict con `read_noise` y
+    `dark_current`. `filter` es el nombre del filtro o "None". Para la DSLR la
+    temperatura del sensor suele ser la del cielo + ~3 °C.
+
+    Es el valor medio del modelo: no incluye la dispersión ±10 % de la señal
+    que `snr_grid` sortea por fila. Una exposición ≤ 0 o un Bortle fuera de
+    `BORTLE_RANGE` lanza ValueError, igual por la vía escalar y por la de
+    arreglos; a temperaturas muy bajas la dark current queda acotada en 0.
+    """
+    _check_domain(exposure_s, bortle_class)
+    read_noise, dark_ref = _camera_params(camera)
+
+    if all(isinstance(v, (int, float)) for v in (exposure_s, bortle_class, sensor_temp_c)) \
+            and isinstance(filter, str) and isinstance(read_noise, float):
+        # Consulta individual: aritmética escalar pura
+        base_signal, _, total_noise = _noise_model(
+            exposure_s, bortle_class, filter != "None", sensor_temp_c,
+            read_noise, dark_ref, ops=_SCALAR_OPS,
+        )
+        return base_signal / (total_noise + 1e-6)
+
+    filtered = np.asarray(filter, dtype=object) != "None"
+    base_signal, _, total_noise = _noise_model(
+        np.asarray(exposure_s, dtype=float), np.asarray(bortle_class, dtype=float),
+        filtered, np.asarray(sensor_temp_c, dtype=float), read_noise, dark_ref,
+    )
+    snr = base_signal / (total_noise + 1e-6)
+    return snr if snr.ndim else float(snr)
+
+
+def recommended_subs(camera, exposure_s, bortle_class, filter, sensor_temp_c,
+                     target_snr=TARGET_SNR):
+    """
+    Invierte el modelo: subs necesarios para alcanzar `target_snr` apilando.
+
+    Usa la misma regla que la columna `recommended_subs` de la grilla
+    (SNR_total ≈ SNR_sub × √N), a partir de `expected_snr`.
+    """
+    snr = expected_snr(camera, exposure_s, bortle_class, filter, sensor_temp_c)
+    if isinstance(snr, float):
+        if snr <= 0:
+            return 999
+        return max(1, int((target_snr / snr) ** 2))
+    return _required_subs(snr, target_snr)
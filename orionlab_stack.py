@@ -0,0 +1,693 @@
+"""
+orionlab_stack.py
+
+Motor de apilado por tiles para el estudio P14 (algoritmos de apilado OSC).
+
+Algoritmos (`ALGORITHMS`), todos sobre un cubo (N, filas, columnas) que
+ignora NaN (bordes sin datos tras registrar):
+
+- mean             media simple
+- median           mediana
+- sigma_clip       media con rechazo iterativo a k·σ de la mediana
+- winsorized       sigma clipping winsorizado: σ robusta estimada sobre los
+                   valores recortados a los límites, rechazo sobre los originales
+- linear_fit_clip  ajuste lineal a los valores ordenados de cada píxel y
+                   rechazo por desviación respecto de la recta (útil con
+                   gradientes que cambian durante la noche)
+
+La imagen se divide en tiles que se procesan en un pool de hilos (NumPy
+libera el GIL en las reducciones). Cada tile se lee bajo demanda desde los
+subs mapeados en memoria (`orionlab_frames.FrameSource`); su tamaño se ajusta
+para que N subs × tile × hilos quepan en `max_memory_mb`, así la memoria no
+depende del número de subs.
+
+`OnlineStacker` apila en línea durante la captura: cada sub actualiza
+estadísticas por píxel (Welford, sigma clipping y mediana aproximada) y el
+apilado, el mapa de ruido y el SNR se pueden consultar en cualquier momento.
+
+La comparación de algoritmos se escribe con el esquema de la tabla P14:
+`algo, n_subs, snr_result, background_noise_adu`.
+
+Uso:
+    python orionlab_stack.py subs/*.fits --algo winsorized --out stacked.fits
+    python orionlab_stack.py subs/*.fits --table        # compara algoritmos (P14)
+    python orionlab_stack.py --demo 40 --table /tmp/p14.csv
+    python orionlab_stack.py --demo 20 --online         # SNR sub a sub
+"""
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource, FrameStack, save_frame
+
+ALGORITHMS = ("mean", "median", "sigma_clip", "winsorized", "linear_fit_clip")
+TABLE_FIELDS = ["algo", "n_subs", "snr_result", "background_noise_adu"]
+
+# Estudio P14 (nombre actual y nombre del generador batch)
+P14_DIRS = ["p14_algoritmos_apilado", "p14_stacking_algorithms_osc"]
+TABLE_NAME = "stacking_algorithms_osc.csv"
+P14_SUBS = (10, 20, 40, 80, 120)
+
+# Copias del cubo que hace cada algoritmo (para dimensionar los tiles)
+_WORK_COPIES = {"mean": 1.5, "median": 2.5, "sigma_clip": 7.0, "winsorized": 7.0,
+                "linear_fit_clip": 7.0}
+
+# Con menos valores que esto en un píxel no se rechaza nada
+MIN_KEEP = 3
+
+
+# ----------------------------------------------------------
+# COMBINACIÓN DE UN CUBO
+# ----------------------------------------------------------
+def _nanmean_inplace(cube):
+    """Media ignorando NaN sin las copias de `np.nanmean` (modifica `cube`)."""
+    nan = np.isnan(cube)
+    count = cube.shape[0] - nan.sum(axis=0)
+    cube[nan] = 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cube.sum(axis=0) / count
+
+
+# Los algoritmos con rechazo trabajan sobre los valores de cada píxel ordenados
+# en el eje contiguo (N al final): ordenar así es ~10x más rápido que
+# `np.median(axis=0)`. Como el rechazo por k·σ sólo quita extremos, los valores
+# aceptados son siempre una ventana [lo, hi) de la lista ordenada; con sumas
+# prefijas y búsqueda binaria cada iteración cuesta O(píxeles · log N).
+def _sorted_pixels(cube):
+    """(valores ordenados (filas, columnas, N) con NaN al final, n válidos)."""
+    values = np.ascontiguousarray(np.moveaxis(cube, 0, -1))
+    values.sort(axis=-1)
+    return values, (~np.isnan(values)).sum(axis=-1)
+
+
+def _take(values, idx):
+    """`values[..., idx]` por píxel (más rápido que `take_along_axis` sobre el arreglo plano)."""
+    n = values.shape[-1]
+    flat = idx.reshape(-1) + np.arange(0, idx.size * n, n)
+    return values.reshape(-1).take(flat).reshape(idx.shape)
+
+
+def _prefix_sums(values, n):
+    """Sumas prefijas (float64) de valores y cuadrados, con 0 al inicio."""
+    valid = np.arange(values.shape[-1]) < n[..., None]
+    v = np.where(valid, values, 0).astype(np.float64)
+    shape = values.shape[:-1] + (values.shape[-1] + 1,)
+    cs1 = np.zeros(shape)
+    cs2 = np.zeros(shape)
+    np.cumsum(v, axis=-1, out=cs1[..., 1:])
+    v *= v
+    np.cumsum(v, axis=-1, out=cs2[..., 1:])
+    return cs1, cs2
+
+
+def _window_median(values, lo, hi):
+    a = _take(values, np.maximum((lo + hi - 1) // 2, 0))
+    b = _take(values, np.minimum((lo + hi) // 2, values.shape[-1] - 1))
+    return np.where(hi > lo, (a + b) / 2, np.nan)
+
+
+def _window_sums(cs1, cs2, lo, hi):
+    return _take(cs1, hi) - _take(cs1, lo), _take(cs2, hi) - _take(cs2, lo)
+
+
+def _mean_std(s1, s2, count):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s1 / count
+        return mean, np.sqrt(np.maximum(s2 / count - mean * mean, 0))
+
+
+def _search(values, x, n, right=False):
+    """
+    Búsqueda binaria vectorizada: por píxel, cantidad de valores válidos
+    `< x` (o `<= x` con `right=True`).
+    """
+    lo = np.zeros_like(n)
+    hi = n.copy()
+    for _ in range(int(values.shape[-1]).bit_length()):
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        v = _take(values, np.minimum(mid, values.shape[-1] - 1))
+        with np.errstate(invalid="ignore"):
+            go_right = (v <= x) if right else (v < x)
+        lo = np.where(active & go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+    return lo
+
+
+def _clip_window(values, n, lo, hi, lower, upper):
+    """Nueva ventana con los valores en [lower, upper], sin bajar de MIN_KEEP por píxel."""
+    new_lo = np.maximum(lo, _search(values, lower, n))
+    new_hi = np.minimum(hi, _search(values, upper, n, right=True))
+    ok = (new_hi - new_lo) >= MIN_KEEP
+    return np.where(ok, new_lo, lo), np.where(ok, new_hi, hi)
+
+
+def combine_mean(cube, sigma=3.0):
+    return _nanmean_inplace(cube)
+
+
+def combine_median(cube, sigma=3.0):
+    values, n = _sorted_pixels(cube)
+    return _window_median(values, np.zeros_like(n), n)
+
+
+def _direct_sums(values, lo, hi):
+    """Σx y Σx² (float64) de la ventana [lo, hi) de cada fila, sin sumas prefijas."""
+    x = values.astype(np.float64)
+    if lo.any() or (hi < values.shape[-1]).any():
+        pos = np.arange(values.shape[-1])
+        x[(pos < lo[..., None]) | (pos >= hi[..., None])] = 0
+    return x.sum(axis=-1), np.einsum("...i,...i->...", x, x)
+
+
+def _sigma_clip_sums(values, n, sigma, iters):
+    """
+    Sumas (Σx, Σx², cantidad) de los valores aceptados por sigma clipping.
+
+    Cada iteración trabaja sólo con los píxeles cuya ventana cambió en la
+    anterior (una ventana que no cambia ya es un punto fijo): tras la primera
+    pasada queda activo menos del 10 % del frame. Las sumas de la ventana se
+    recalculan directamente (en float64) sólo para esos píxeles.
+    """
+    shape = n.shape
+    values = values.reshape(-1, values.shape[-1])
+    n = n.reshape(-1)
+    lo, hi = np.zeros_like(n), n.copy()
+    s1, s2 = _direct_sums(values, lo, hi)
+    active = np.arange(n.size)
+    for _ in range(iters):
+        v, a, b = values[active], lo[active], hi[active]
+        center = _window_median(v, a, b)
+        _, spread = _mean_std(s1[active], s2[active], b - a)
+        new_lo, new_hi = _clip_window(v, n[active], a, b, center - sigma * spread,
+                                      center + sigma * spread)
+        changed = (new_lo != a) | (new_hi != b)
+        if not changed.any():
+            break
+        active = active[changed]
+        lo[active], hi[active] = new_lo[changed], new_hi[changed]
+        s1[active], s2[active] = _direct_sums(values[active], lo[active], hi[active])
+    return s1.reshape(shape), s2.reshape(shape), (hi - lo).reshape(shape)
+
+
+def combine_sigma_clip(cube, sigma=3.0, iters=5):
+    """Media con rechazo iterativo a `sigma` desviaciones de la mediana."""
+    values, n = _sorted_pixels(cube)
+    return _mean_std(*_sigma_clip_sums(values, n, sigma, iters))[0]
+
+
+def combine_winsorized(cube, sigma=3.0, iters=10, tol=5e-3):
+    """
+    Sigma clipping winsorizado: se recortan los valores a center ± 1.5·σ y se
+    reestima σ (×1.134, corrección de la varianza winsorizada) hasta que
+    converge; luego se rechazan los valores originales a más de `sigma`·σ.
+
+    Los valores recortados no se materializan: la suma recortada es la de la
+    ventana interior más `a·lower + (n-b)·upper`. La convergencia es por
+    píxel (cada uno se congela al converger), así el resultado no depende de
+    cómo `tile_grid` partió el frame.
+    """
+    values, n = _sorted_pixels(cube)
+    cs1, cs2 = _prefix_sums(values, n)
+    zero = np.zeros_like(n)
+    median = _window_median(values, zero, n)
+    center = median
+    spread = 1.134 * _mean_std(*_window_sums(cs1, cs2, zero, n), n)[1]
+    active = np.ones(n.shape, dtype=bool)
+    for _ in range(iters):
+        lower, upper = center - 1.5 * spread, center + 1.5 * spread
+        a = _search(values, lower, n)
+        b = _search(values, upper, n, right=True)
+        s1, s2 = _window_sums(cs1, cs2, a, b)
+        n_low, n_high = a, n - b
+        s1 = s1 + n_low * lower + n_high * upper
+        s2 = s2 + n_low * lower * lower + n_high * upper * upper
+        # Recortar es monótono: la mediana recortada es la mediana recortada a los límites
+        new_center = np.clip(median, lower, upper)
+        new_spread = 1.134 * _mean_std(s1, s2, n)[1]
+        with np.errstate(invalid="ignore"):
+            converged = np.abs(new_spread - spread) <= tol * np.maximum(spread, 1e-12)
+        center = np.where(active, new_center, center)
+        spread = np.where(active, new_spread, spread)
+        active &= ~converged
+        if not active.any():
+            break
+    lo, hi = _clip_window(values, n, zero, n, center - sigma * spread, center + sigma * spread)
+    return _mean_std(*_window_sums(cs1, cs2, lo, hi), hi - lo)[0]
+
+
+def combine_linear_fit_clip(cube, sigma=3.0, iters=5):
+    """
+    Rechazo por ajuste lineal: por píxel se ordenan los valores, se ajusta una
+    recta valor = a + b·rango y se rechazan los que se alejan más de
+    `sigma` veces la desviación media absoluta del ajuste.
+    """
+    values, n = _sorted_pixels(cube)
+    valid = np.arange(values.shape[-1]) < n[..., None]
+    values[~valid] = 0
+    rank = np.arange(values.shape[-1], dtype=np.float32)
+
+    for _ in range(iters):
+        # Reducciones por píxel sobre el último eje (no `@`: BLAS redondea
+        # distinto según la forma del bloque y el resultado dependería del tile)
+        w = valid.astype(np.float32)
+        wy = values * w
+        count = w.sum(axis=-1)
+        sx = (w * rank).sum(axis=-1)
+        sy = wy.sum(axis=-1)
+        sxx = (w * (rank * rank)).sum(axis=-1)
+        sxy = (wy * rank).sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            den = count * sxx - sx * sx
+            slope = np.where(den != 0, (count * sxy - sx * sy) / den, 0)
+            intercept = (sy - slope * sx) / count
+            dev = np.abs(values - (intercept[..., None] + slope[..., None] * rank))
+            mad = (dev * w).sum(axis=-1) / count
+            reject = valid & (dev > sigma * mad[..., None])
+        # Como en `_clip_window`: no bajar de MIN_KEEP valores por píxel
+        reject &= ((count - reject.sum(axis=-1)) >= MIN_KEEP)[..., None]
+        if not reject.any():
+            break
+        valid &= ~reject
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (values * valid).sum(axis=-1) / valid.sum(axis=-1)
+
+
+COMBINERS = {
+    "mean": combine_mean,
+    "median": combine_median,
+    "sigma_clip": combine_sigma_clip,
+    "winsorized": combine_winsorized,
+    "linear_fit_clip": combine_linear_fit_clip,
+}
+
+
+# ----------------------------------------------------------
+# FUENTES Y TILES
+# ----------------------------------------------------------
+class _ArraySource:
+    """Frame de un arreglo (N, alto, ancho) ya en memoria o memmap."""
+
+    def __init__(self, array, i):
+        self.array, self.i = array, i
+        self.shape = array.shape[1:]
+
+    def read(self, rows=slice(None), cols=slice(None), dtype=np.float32):
+        return np.array(self.array[self.i, rows, cols], dtype=dtype)
+
+
+def as_sources(subs):
+    """Normaliza rutas, `FrameSource`, un `FrameStack` o un arreglo 3D a una lista de fuentes."""
+    if isinstance(subs, FrameStack):
+        return subs.sources()
+    if isinstance(subs, np.ndarray):
+        if subs.ndim != 3:
+            raise ValueError("Se esperaba un arreglo (N, alto, ancho)")
+        return [_ArraySource(subs, i) for i in range(subs.shape[0])]
+    return [s if hasattr(s, "read") else FrameSource.open(s) for s in subs]
+
+
+def tile_grid(shape, n_subs, algo, threads, max_memory_mb):
+    """
+    Tiles `(filas, columnas)` como slices. Se prefieren bandas de ancho
+    completo (lecturas contiguas en el memmap); si ni una fila cabe, se
+    parten también las columnas.
+    """
+    h, w = shape
+    budget = max_memory_mb * 2**20 / max(1, threads) / _WORK_COPIES[algo]
+    pixels = max(1, int(budget // (4 * n_subs)))
+    if pixels >= w:
+        rows, cols = pixels // w, w
+        # Al menos ~4 tiles por hilo para repartir la carga
+        rows = max(1, min(rows, math.ceil(h / (4 * max(1, threads)))))
+    else:
+        rows, cols = 1, pixels
+    return [(slice(r0, min(h, r0 + rows)), slice(c0, min(w, c0 + cols)))
+            for r0 in range(0, h, rows) for c0 in range(0, w, cols)]
+
+
+def stack(subs, algo="sigma_clip", sigma=3.0, threads=None, max_memory_mb=256, masks=None):
+    """
+    Apila `subs` (rutas `.npy`/`.fits`, `FrameSource`, `FrameStack` o arreglo
+    (N, alto, ancho)) con el algoritmo `algo`. Devuelve la imagen float32.
+
+    `masks`: una máscara por sub (o None) con los píxeles a rechazar: arreglo
+    booleano del tamaño del frame u objeto con `tile(filas, columnas)`, como
+    `orionlab_trails.TrailMask`.
+    """
+    if algo not in COMBINERS:
+        raise ValueError(f"Algoritmo desconocido: {algo!r} (opciones: {list(ALGORITHMS)})")
+    sources = as_sources(subs)
+    if not sources:
+        raise ValueError("stack necesita al menos un sub")
+    shape = sources[0].shape
+    threads = threads or os.cpu_count() or 1
+    combine = COMBINERS[algo]
+    result = np.empty(shape, dtype=np.float32)
+
+    def _process(tile):
+        rows, cols = tile
+        cube = np.empty((len(sources), rows.stop - rows.start, cols.stop - cols.start),
+                        dtype=np.float32)
+        for i, source in enumerate(sources):
+            cube[i] = source.read(rows, cols)
+            mask = masks[i] if masks is not None else None
+            if mask is not None:
+                cube[i][mask.tile(rows, cols) if hasattr(mask, "tile") else mask[rows, cols]] = np.nan
+        result[rows, cols] = combine(cube, sigma)
+
+    tiles = tile_grid(shape, len(sources), algo, threads, max_memory_mb)
+    if threads == 1:
+        for tile in tiles:
+            _process(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(_process, tiles))
+    return result
+
+
+# ----------------------------------------------------------
+# APILADO EN LÍNEA
+# ----------------------------------------------------------
+ONLINE_KINDS = ("mean", "median", "sigma_clip")
+
+# Paso óptimo de la mediana estocástica para ruido gaussiano: 1/(2·f(m)) = √(π/2)·σ
+_MEDIAN_GAIN = math.sqrt(math.pi / 2)
+
+
+class OnlineStacker:
+    """
+    Apilado incremental para ver crecer la integración durante la sesión
+    (flujo ASIAIR de P06/P07): cada sub nuevo se incorpora en O(píxeles) y
+    nunca se vuelven a leer los anteriores.
+
+    Estado por píxel (float32):
+
+    - media y varianza de todos los valores (Welford)
+    - media y varianza de los valores aceptados a `sigma`·σ de la mediana
+      (sigma clipping en línea)
+    - mediana aproximada por aproximación estocástica (Robbins-Monro),
+      con paso √(π/2)·σ / n
+
+    Los primeros `warmup` subs se guardan en memoria para sembrar mediana y
+    σ robusta (MAD); así una traza en los primeros subs no entra al
+    apilado. Después se liberan y la memoria queda fija en ~7 arreglos del
+    tamaño del frame. Los subs deben venir calibrados y registrados.
+    """
+
+    def __init__(self, shape, sigma=3.0, warmup=5, band_pixels=2**20):
+        if warmup < MIN_KEEP:
+            raise ValueError(f"warmup debe ser al menos {MIN_KEEP}")
+        self.shape = tuple(shape)
+        self.sigma = sigma
+        self.warmup = warmup
+        self.count = 0
+        h, w = self.shape
+        self._bands = [slice(r0, min(h, r0 + max(1, band_pixels // w)))
+                       for r0 in range(0, h, max(1, band_pixels // w))]
+        self._n = np.zeros(self.shape, dtype=np.int32)
+        self._mean = np.zeros(self.shape, dtype=np.float32)
+        self._m2 = np.zeros(self.shape, dtype=np.float32)
+        self._buffer = np.empty((warmup,) + self.shape, dtype=np.float32)
+        self._clip_n = self._clip_mean = self._clip_m2 = self._median = None
+
+    # -------------------- actualización --------------------
+    def add(self, sub):
+        """Incorpora un sub (arreglo 2D, ruta `.npy`/`.fits` o `FrameSource`)."""
+        if isinstance(sub, np.ndarray):
+            if sub.shape != self.shape:
+                raise ValueError(f"Sub de forma {sub.shape}, se esperaba {self.shape}")
+            read = lambda rows: np.array(sub[rows], dtype=np.float32)  # noqa: E731
+        else:
+            source = sub if hasattr(sub, "read") else FrameSource.open(sub)
+            if tuple(source.shape) != self.shape:
+                raise ValueError(f"Sub de forma {tuple(source.shape)}, se esperaba {self.shape}")
+            read = source.read
+
+        for rows in self._bands:
+            x = read(rows)
+            self._update_all(rows, x)
+            if self._buffer is not None:
+                self._buffer[self.count, rows] = x
+            else:
+                self._update_clip(rows, x)
+        self.count += 1
+        if self._buffer is not None and self.count == self.warmup:
+            self._seed()
+        return self
+
+    def _update_all(self, rows, x):
+        valid = np.isfinite(x)
+        n = self._n[rows]
+        mean = self._mean[rows]
+        n += valid
+        xf = np.where(valid, x, mean)
+        delta = xf - mean
+        mean += delta / np.maximum(n, 1)
+        self._m2[rows] += delta * (xf - mean)
+
+    def _scale(self, rows):
+        """
+        σ para el rechazo: la de los aceptados, con piso en √0.8·σ de todos.
+        Sin el piso la σ truncada se realimenta (cada rechazo achica la σ
+        siguiente) y se terminan rechazando valores buenos.
+        Devuelve también la σ de los aceptados sin piso, que da el paso de la
+        mediana: la de todos incluye las trazas y haría saltar la mediana.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            clip_var = self._clip_m2[rows] / (self._clip_n[rows] - 1)
+            all_var = self._m2[rows] / (self._n[rows] - 1)
+        clip_var = np.nan_to_num(np.where(self._clip_n[rows] >= 2, clip_var, all_var))
+        return np.sqrt(np.maximum(clip_var, 0.8 * np.nan_to_num(all_var))), np.sqrt(clip_var)
+
+    def _update_clip(self, rows, x):
+        valid = np.isfinite(x)
+        median = self._median[rows]
+        scale, clip_scale = self._scale(rows)
+        n = self._clip_n[rows]
+        mean = self._clip_mean[rows]
+        with np.errstate(invalid="ignore"):
+            accept = valid & (np.abs(x - mean) <= self.sigma * scale)
+
+        n += accept
+        xc = np.where(accept, x, mean)
+        delta = xc - mean
+        mean += delta / np.maximum(n, 1)
+        self._clip_m2[rows] += delta * (xc - mean)
+
+        # Robbins-Monro: m += √(π/2)·σ/n · signo(x - m)
+        step = _MEDIAN_GAIN * clip_scale / np.maximum(self._n[rows], 1)
+        median += np.where(valid, step * np.sign(np.where(valid, x, median) - median), 0)
+
+    def _seed(self):
+        """
+        Siembra mediana y sigma clipping con los subs del calentamiento y los
+        libera. Con pocos subs la σ simple no sirve para rechazar (un valor
+        atípico entre N queda a lo más a (N-1)/√N σ), así que el centro es la
+        mediana y la escala 1.4826·MAD.
+        """
+        self._median = np.empty(self.shape, dtype=np.float32)
+        self._clip_n = np.empty(self.shape, dtype=np.int32)
+        self._clip_mean = np.empty(self.shape, dtype=np.float32)
+        self._clip_m2 = np.empty(self.shape, dtype=np.float32)
+        for rows in self._bands:
+            values, n = _sorted_pixels(self._buffer[:, rows])
+            zero = np.zeros_like(n)
+            median = _window_median(values, zero, n)
+            deviation, _ = _sorted_pixels(np.abs(self._buffer[:, rows] - median))
+            robust = 1.4826 * _window_median(deviation, zero, n)
+            with np.errstate(invalid="ignore"):
+                accept = np.abs(self._buffer[:, rows] - median) <= self.sigma * robust
+            x = np.where(accept, self._buffer[:, rows], 0).astype(np.float64)
+            count = accept.sum(axis=0)
+            s1, s2 = x.sum(axis=0), (x * x).sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = s1 / count
+            self._median[rows] = np.nan_to_num(median)
+            self._clip_n[rows] = count
+            self._clip_mean[rows] = np.where(count > 0, mean, 0)
+            self._clip_m2[rows] = np.where(count > 0, np.maximum(s2 - s1 * mean, 0), 0)
+        self._buffer = None
+
+    # -------------------- consulta --------------------
+    def _check_kind(self, kind):
+        if kind not in ONLINE_KINDS:
+            raise ValueError(f"Tipo desconocido: {kind!r} (opciones: {list(ONLINE_KINDS)})")
+        if self.count == 0:
+            raise ValueError("OnlineStacker sin subs")
+
+    def image(self, kind="sigma_clip"):
+        """Apilado actual (float32, NaN donde ningún sub aportó datos)."""
+        self._check_kind(kind)
+        if kind == "mean":
+            return np.where(self._n > 0, self._mean, np.nan).astype(np.float32)
+        if self._buffer is not None:
+            return stack(self._buffer[:self.count], algo=kind, sigma=self.sigma, threads=1)
+        if kind == "median":
+            return np.where(self._n > 0, self._median, np.nan).astype(np.float32)
+        return np.where(self._clip_n > 0, self._clip_mean, np.nan).astype(np.float32)
+
+    def noise_map(self, kind="sigma_clip"):
+        """
+        Error estándar por píxel del apilado: σ/√n (σ de los aceptados en
+        sigma_clip; la mediana suma el factor √(π/2) de su eficiencia).
+        """
+        self._check_kind(kind)
+        if kind == "mean" or self._buffer is not None:
+            var, n = self._m2 / (self._n - 1).clip(min=1), self._n
+        else:
+            var, n = self._clip_m2 / (self._clip_n - 1).clip(min=1), self._clip_n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            noise = np.sqrt(np.maximum(var, 0) / n)
+        noise = np.where(n >= 2, noise, np.nan).astype(np.float32)
+        return noise * np.float32(_MEDIAN_GAIN) if kind == "median" else noise
+
+    def snr(self, kind="sigma_clip"):
+        """SNR del fondo del apilado actual (misma métrica que la tabla P14)."""
+        return stack_stats(self.image(kind))["snr_result"]
+
+    def stats(self, kind="sigma_clip"):
+        return {"n_subs": self.count, **stack_stats(self.image(kind))}
+
+
+def stack_online(subs, kind="sigma_clip", sigma=3.0, warmup=5, callback=None):
+    """
+    Apila `subs` uno a uno con `OnlineStacker`; `callback(stacker)` se
+    llama tras cada sub (p. ej. para refrescar una vista previa).
+    """
+    sources = as_sources(subs)
+    if not sources:
+        raise ValueError("stack_online necesita al menos un sub")
+    stacker = OnlineStacker(sources[0].shape, sigma=sigma, warmup=min(warmup, max(MIN_KEEP, len(sources))))
+    for source in sources:
+        stacker.add(source)
+        if callback is not None:
+            callback(stacker)
+    return stacker.image(kind)
+
+
+# ----------------------------------------------------------
+# MÉTRICAS P14
+# ----------------------------------------------------------
+def background_noise(image, step=1):
+    """
+    σ del ruido de fondo a partir de diferencias entre píxeles vecinos:
+    1.4826 · MAD(Δ) / √2. No la afectan gradientes ni viñeteo, y las
+    estrellas pesan poco en la mediana.
+    """
+    img = np.asarray(image[::step], dtype=np.float32)
+    diff = (img[:, 1:] - img[:, :-1]).ravel()
+    diff = diff[np.isfinite(diff)]
+    if diff.size == 0:
+        return float("nan")
+    mad = np.median(np.abs(diff - np.median(diff)))
+    return float(1.4826 * mad / math.sqrt(2))
+
+
+def stack_stats(image):
+    """Métricas de la tabla P14: SNR del fondo (mediana / σ) y ruido de fondo en ADU."""
+    noise = background_noise(image)
+    level = float(np.nanmedian(image[::2, ::2]))
+    return {
+        "snr_result": round(level / noise, 1) if noise > 0 else float("nan"),
+        "background_noise_adu": round(noise, 2),
+    }
+
+
+def compare_algorithms(subs, algos=ALGORITHMS, n_subs=P14_SUBS, **stack_kwargs):
+    """
+    Apila los primeros `n` subs con cada algoritmo y devuelve filas P14.
+    Se omiten los `n` mayores que la cantidad de subs disponibles.
+    """
+    sources = as_sources(subs)
+    counts = [n for n in n_subs if n <= len(sources)] or [len(sources)]
+    rows = []
+    for algo in algos:
+        for n in counts:
+            image = stack(sources[:n], algo=algo, **stack_kwargs)
+            rows.append({"algo": algo, "n_subs": n, **stack_stats(image)})
+            print(f"  ✅ {algo:<16} {n:>4} subs  SNR {rows[-1]['snr_result']:7.1f}  "
+                  f"ruido {rows[-1]['background_noise_adu']:7.2f} ADU")
+    return rows
+
+
+def write_p14_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P14_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, TABLE_FIELDS, csv_path, categorical=["algo"])
+    print(f"✅ Tabla P14: {csv_path}")
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apilado por tiles multihilo (P14).")
+    parser.add_argument("subs", nargs="*", type=Path, help="Subs calibrados y registrados.")
+    parser.add_argument("--algo", choices=ALGORITHMS, default="sigma_clip")
+    parser.add_argument("--sigma", type=float, default=3.0)
+    parser.add_argument("--threads", type=int, help="Hilos (por defecto, núcleos).")
+    parser.add_argument("--max-memory-mb", type=float, default=256)
+    parser.add_argument("--out", type=Path, help="Guarda el apilado (.npy/.fits).")
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Compara todos los algoritmos y escribe la tabla P14 "
+                             f"(por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--online", action="store_true",
+                        help="Apila en línea (mean/median/sigma_clip) mostrando el SNR tras cada sub.")
+    parser.add_argument("--demo", type=int, metavar="N",
+                        help="Usa N subs sintéticos alineados con trazas y rayos cósmicos.")
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        import tempfile
+
+        from orionlab_frames import synthetic_session
+
+        session = synthetic_session(tempfile.mkdtemp(prefix="orionlab_p14_demo_"),
+                                    n_lights=args.demo, n_bias=0, n_darks=0, n_flats=0,
+                                    max_shift=0, n_trails=max(1, args.demo // 10),
+                                    cosmic_rate=2e-4)
+        args.subs = session["lights"]
+    elif not args.subs:
+        parser.error("indique los subs o use --demo")
+
+    kwargs = {"sigma": args.sigma, "threads": args.threads, "max_memory_mb": args.max_memory_mb}
+    if args.online:
+        if args.algo not in ONLINE_KINDS:
+            parser.error(f"--online admite {list(ONLINE_KINDS)}")
+
+        def _progress(stacker):
+            stats = stacker.stats(args.algo)
+            print(f"  ↷ {stats['n_subs']:>4} subs  SNR {stats['snr_result']:7.1f}  "
+                  f"ruido {stats['background_noise_adu']:7.2f} ADU")
+
+        image = stack_online(args.subs, kind=args.algo, sigma=args.sigma, callback=_progress)
+        print(f"✅ {args.algo} en línea: {len(args.subs)} subs")
+        if args.out:
+            save_frame(args.out, image)
+            print(f"✅ Apilado: {args.out}")
+    elif args.table is not None:
+        rows = compare_algorithms(args.subs, **kwargs)
+        write_p14_table(rows, args.table or None)
+    else:
+        image = stack(args.subs, algo=args.algo, **kwargs)
+        stats = stack_stats(image)
+        print(f"✅ {args.algo}: {len(args.subs)} subs, SNR {stats['snr_result']}, "
+              f"ruido {stats['background_noise_adu']} ADU")
+        if args.out:
+            save_frame(args.out, image)
+            print(f"✅ Apilado: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""
+orionlab_trails.py
+
+Detección y enmascarado de trazas satelitales (Starlink) para el estudio P16.
+
+Por sub:
+
+1. Se reduce la imagen por bloques de `DOWNSAMPLE`×`DOWNSAMPLE` (media): el
+   ruido baja ~4x y una traza de pocos píxeles de ancho sigue visible.
+2. Se resta el fondo (`orionlab_register.background_map`, malla de
+   `BACKGROUND_CELLS` celdas por lado) y se umbraliza el
+   residuo a `TRAIL_SIGMA`·σ.
+3. Transformada de Hough vectorizada sobre los píxeles umbralizados
+   (acumulador con `np.bincount`). Cada pico se valida como segmento: se
+   toman los píxeles cercanos a la recta, se busca el tramo continuo más
+   largo y se exige largo y densidad mínimos (las estrellas alineadas por
+   azar no pasan). Los píxeles de una traza aceptada se restan del
+   acumulador antes de buscar la siguiente.
+
+Cada traza es `(y0, x0, y1, x1, semiancho)` en píxeles del sub completo y
+`TrailMask` la rasteriza por tiles, así `orionlab_stack.stack(..., masks=...)`
+puede rechazar esos píxeles sin guardar máscaras del tamaño del frame.
+
+Las noches se procesan en un pool de procesos y la tabla P16
+(`night_index, trails_detected, total_exposure_min, filter`) se llena con las
+detecciones reales. Exposición y filtro se leen de las tarjetas FITS
+`EXPTIME`/`FILTER` (o de `--exposure`/`--filter` para `.npy`).
+
+Uso:
+    python orionlab_trails.py noches/2025-03-*/ --table        # una carpeta por noche
+    python orionlab_trails.py sub_0001.fits --mask-out mascara.npy
+    python orionlab_trails.py --demo 6 --table /tmp/p16.csv
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource, read_header
+from orionlab_register import background_map
+from orionlab_stack import background_noise
+
+TABLE_FIELDS = ["night_index", "trails_detected", "total_exposure_min", "filter"]
+
+# Estudio P16 (nombre actual y nombre del generador batch)
+P16_DIRS = ["p16_trazas_starlink", "p16_starlink_trail_stats"]
+TABLE_NAME = "starlink_trails_stats.csv"
+
+SUB_SUFFIXES = (".fits", ".fit", ".fts", ".npy")
+
+# Detección (en píxeles de la imagen reducida)
+DOWNSAMPLE = 4
+TRAIL_SIGMA = 4.0
+THETA_STEP_DEG = 0.5
+MIN_LENGTH_FRACTION = 0.15   # largo mínimo respecto del lado menor
+MIN_LENGTH_PX = 32           # ... y nunca menos que esto (estrellas brillantes vecinas)
+MIN_FILL = 0.6               # fracción del tramo cubierta por píxeles sobre el umbral
+MAX_GAP = 6
+LINE_DISTANCE = 1.5
+MAX_TRAILS = 20
+MAX_POINTS = 200_000
+
+# Celdas de la malla de fondo por lado (sigue el viñeteo de subs sin calibrar)
+BACKGROUND_CELLS = 16
+
+# Ancho extra de la máscara (px del sub completo) a cada lado de la traza
+MASK_MARGIN_PX = 3
+
+
+# ----------------------------------------------------------
+# DETECCIÓN
+# ----------------------------------------------------------
+def _downsample(image, factor):
+    img = np.asarray(image, dtype=np.float32)
+    h, w = (n // factor * factor for n in img.shape)
+    blocks = img[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    if not np.isnan(blocks).any():
+        return blocks.mean(axis=(1, 3))
+    with warnings.catch_warnings():
+        # Bloques del todo en NaN (bordes de un sub registrado) quedan en NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+def _hough_indices(ys, xs, cos, sin, diag):
+    """Celda (θ, ρ) de cada punto en cada ángulo, como índice plano del acumulador."""
+    rho = np.rint(xs[:, None] * cos[None, :] + ys[:, None] * sin[None, :]).astype(np.int64) + diag
+    return (np.arange(len(cos))[None, :] * (2 * diag + 1) + rho).ravel()
+
+
+def _segment(ys, xs, theta, rho):
+    """
+    Tramo continuo más largo de los puntos a menos de LINE_DISTANCE de la
+    recta: (índices de esos puntos, t0, t1) con t la coordenada a lo largo.
+    """
+    c, s = math.cos(theta), math.sin(theta)
+    near = np.nonzero(np.abs(xs * c + ys * s - rho) <= LINE_DISTANCE)[0]
+    if near.size < 2:
+        return near, 0.0, 0.0
+    t = -xs[near] * s + ys[near] * c
+    order = np.argsort(t)
+    t, near = t[order], near[order]
+    breaks = np.nonzero(np.diff(t) > MAX_GAP)[0]
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(t) - 1]])
+    k = np.argmax(t[ends] - t[starts])
+    return near[starts[k]:ends[k] + 1], float(t[starts[k]]), float(t[ends[k]])
+
+
+def detect_trails(image, downsample=DOWNSAMPLE, sigma=TRAIL_SIGMA, max_trails=MAX_TRAILS):
+    """
+    Trazas rectas de `image` como lista de `(y0, x0, y1, x1, semiancho)` en
+    píxeles del frame completo.
+    """
+    small = _downsample(image, downsample)
+    box = max(8, min(small.shape) // BACKGROUND_CELLS)
+    residual = np.nan_to_num(small - background_map(small, box))
+    noise = background_noise(residual)
+    if not noise > 0:
+        return []
+    level = sigma * noise
+    mask = residual > level
+    while mask.sum() > MAX_POINTS:   # nebulosas extensas: se sube el umbral
+        level *= 1.5
+        mask = residual > level
+    ys, xs = (v.astype(np.float64) for v in np.nonzero(mask))
+    if ys.size < 2:
+        return []
+
+    h, w = small.shape
+    diag = int(math.ceil(math.hypot(h, w)))
+    thetas = np.deg2rad(np.arange(0, 180, THETA_STEP_DEG))
+    cos, sin = np.cos(thetas), np.sin(thetas)
+    n_rho = 2 * diag + 1
+    acc = np.bincount(_hough_indices(ys, xs, cos, sin, diag), minlength=len(thetas) * n_rho)
+    min_length = max(MIN_LENGTH_PX, MIN_LENGTH_FRACTION * min(h, w))
+    alive = np.ones(ys.size, dtype=bool)
+
+    trails = []
+    for _ in range(4 * max_trails):
+        if len(trails) >= max_trails:
+            break
+        peak = int(acc.argmax())
+        if acc[peak] < min_length * MIN_FILL:
+            break
+        k_theta, k_rho = divmod(peak, n_rho)
+        theta, rho = thetas[k_theta], k_rho - diag
+        idx = np.nonzero(alive)[0]
+        run, t0, t1 = _segment(ys[idx], xs[idx], theta, rho)
+        run = idx[run]
+        # Cobertura: posiciones a lo largo de la recta con algún píxel (no cantidad
+        # de píxeles, que en una estrella brillante es grande en un tramo corto)
+        c, s = math.cos(theta), math.sin(theta)
+        covered = np.unique(np.floor(-xs[run] * s + ys[run] * c)).size
+        if t1 - t0 < min_length or covered < MIN_FILL * (t1 - t0 + 1):
+            # Pico sin traza (estrellas alineadas, ruido): se apaga su vecindad
+            grid = acc.reshape(len(thetas), n_rho)
+            grid[max(0, k_theta - 2):k_theta + 3, max(0, k_rho - 3):k_rho + 4] = 0
+            continue
+
+        # Traza aceptada: sus píxeles dejan de votar
+        acc -= np.bincount(_hough_indices(ys[run], xs[run], cos, sin, diag), minlength=acc.size)
+        alive[run] = False
+        spread = np.abs(xs[run] * c + ys[run] * s - rho)
+        half_width = downsample * (float(np.percentile(spread, 95)) + 1) + MASK_MARGIN_PX
+        center = (downsample - 1) / 2
+        y0, x0 = rho * s + t0 * c, rho * c - t0 * s
+        y1, x1 = rho * s + t1 * c, rho * c - t1 * s
+        trails.append((y0 * downsample + center, x0 * downsample + center,
+                       y1 * downsample + center, x1 * downsample + center, half_width))
+    return trails
+
+
+# ----------------------------------------------------------
+# MÁSCARAS
+# ----------------------------------------------------------
+class TrailMask:
+    """
+    Máscara de trazas de un sub, rasterizada bajo demanda por tile
+    (True = píxel de traza, a rechazar al apilar).
+    """
+
+    def __init__(self, shape, trails):
+        self.shape = tuple(shape)
+        self.trails = list(trails)
+
+    def tile(self, rows=slice(None), cols=slice(None)):
+        r0, r1, _ = rows.indices(self.shape[0])
+        c0, c1, _ = cols.indices(self.shape[1])
+        out = np.zeros((r1 - r0, c1 - c0), dtype=bool)
+        if not self.trails:
+            return out
+        yy = np.arange(r0, r1, dtype=np.float32)[:, None]
+        xx = np.arange(c0, c1, dtype=np.float32)[None, :]
+        for y0, x0, y1, x1, half_width in self.trails:
+            # Distancia al segmento: proyección acotada a [0, 1]
+            dy, dx = y1 - y0, x1 - x0
+            length2 = max(dy * dy + dx * dx, 1e-9)
+            t = np.clip(((yy - y0) * dy + (xx - x0) * dx) / length2, 0, 1)
+            dist2 = (yy - y0 - t * dy) ** 2 + (xx - x0 - t * dx) ** 2
+            out |= dist2 <= half_width * half_width
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.tile()
+        return out if dtype is None else out.astype(dtype)
+
+
+def sub_trails(path, downsample=DOWNSAMPLE, sigma=TRAIL_SIGMA):
+    """Trazas de un sub en disco (`.npy`/`.fits`)."""
+    return detect_trails(FrameSource.open(path).read(), downsample, sigma)
+
+
+# ----------------------------------------------------------
+# NOCHES Y TABLA P16
+# ----------------------------------------------------------
+def night_subs(night):
+    """Subs de una noche: carpeta (todos los `.fits`/`.npy`) o lista de rutas."""
+    if isinstance(night, (str, Path)) and Path(night).is_dir():
+        return sorted(p for p in Path(night).iterdir() if p.suffix.lower() in SUB_SUFFIXES)
+    return [Path(p) for p in ([night] if isinstance(night, (str, Path)) else night)]
+
+
+def scan_night(subs, exposure_s=None, filter_name=None, downsample=DOWNSAMPLE, sigma=TRAIL_SIGMA):
+    """
+    Cuenta las trazas de los subs de una noche. Devuelve
+    `{trails_detected, total_exposure_min, filter, per_sub}`.
+    """
+    per_sub, exposure, filters = [], 0.0, Counter()
+    for path in subs:
+        per_sub.append(sub_trails(path, downsample, sigma))
+        header = read_header(path)
+        exposure += float(header.get("EXPTIME", header.get("EXPOSURE", exposure_s or 0)))
+        filters[header.get("FILTER", filter_name or "L")] += 1
+    return {
+        "trails_detected": sum(len(t) for t in per_sub),
+        "total_exposure_min": round(exposure / 60),
+        "filter": filters.most_common(1)[0][0] if filters else (filter_name or "L"),
+        "per_sub": per_sub,
+    }
+
+
+def scan_nights(nights, jobs=None, **kwargs):
+    """Procesa cada noche en un proceso del pool; devuelve filas P16 en orden."""
+    nights = [night_subs(n) for n in nights]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(nights) == 1:
+        results = [scan_night(n, **kwargs) for n in nights]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(nights))) as pool:
+            results = list(pool.map(_scan_night_kwargs, nights, [kwargs] * len(nights)))
+    rows = []
+    for i, result in enumerate(results, 1):
+        rows.append({"night_index": i, **{k: result[k] for k in TABLE_FIELDS[1:]}})
+        print(f"  ✅ noche {i:>3}: {result['trails_detected']:>3} trazas en {len(nights[i - 1])} subs  "
+              f"({result['total_exposure_min']} min, {result['filter']})")
+    return rows
+
+
+def _scan_night_kwargs(subs, kwargs):
+    return scan_night(subs, **kwargs)
+
+
+def write_p16_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P16_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, TABLE_FIELDS, csv_path, categorical=["filter"])
+    print(f"✅ Tabla P16: {csv_path}")
+    return csv_path
+
+
+def _demo_nights(n_nights, n_subs=8, seed=42):
+    from orionlab_frames import synthetic_session
+
+    rng = np.random.default_rng(seed)
+    root = Path(tempfile.mkdtemp(prefix="orionlab_p16_demo_"))
+    nights, truth = [], []
+    for i in range(n_nights):
+        n_trails = int(rng.integers(0, n_subs))
+        session = synthetic_session(root / f"night_{i + 1:02d}", n_lights=n_subs, n_bias=0, n_darks=0,
+                                    n_flats=0, n_trails=n_trails, seed=seed + i)
+        nights.append(root / f"night_{i + 1:02d}")
+        truth.append(len(session["trails"]))
+    return nights, truth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detección de trazas satelitales y tabla P16.")
+    parser.add_argument("nights", nargs="*", type=Path,
+                        help="Carpetas de noche (o subs sueltos, cada uno una noche).")
+    parser.add_argument("-j", "--jobs", type=int, help="Procesos (por defecto, núcleos).")
+    parser.add_argument("--sigma", type=float, default=TRAIL_SIGMA)
+    parser.add_argument("--downsample", type=int, default=DOWNSAMPLE)
+    parser.add_argument("--exposure", type=float, help="Exposición por sub (s) si el sub no trae EXPTIME.")
+    parser.add_argument("--filter", help="Filtro si el sub no trae FILTER.")
+    parser.add_argument("--mask-out", type=Path, help="Con un solo sub: guarda su máscara (.npy).")
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Escribe la tabla P16 (por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--demo", type=int, metavar="N", help="N noches sintéticas con trazas.")
+    args = parser.parse_args(argv)
+
+    truth = None
+    if args.demo:
+        args.nights, truth = _demo_nights(args.demo)
+        args.exposure = args.exposure or 180
+    elif not args.nights:
+        parser.error("indique las noches o use --demo")
+
+    if args.mask_out:
+        if len(args.nights) != 1 or args.nights[0].is_dir():
+            parser.error("--mask-out requiere un solo sub")
+        source = FrameSource.open(args.nights[0])
+        trails = detect_trails(source.read(), args.downsample, args.sigma)
+        np.save(args.mask_out, np.asarray(TrailMask(source.shape, trails)))
+        print(f"✅ {len(trails)} trazas, máscara: {args.mask_out}")
+        return 0
+
+    rows = scan_nights(args.nights, jobs=args.jobs, exposure_s=args.exposure, filter_name=args.filter,
+                       downsample=args.downsample, sigma=args.sigma)
+    if truth is not None:
+        found = sum(r["trails_detected"] for r in rows)
+        print(f"  Trazas sintéticas: {sum(truth)}, detectadas: {found}")
+    if args.table is not None:
+        write_p16_table(rows, args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+"""
+orionlab_visibility.py
+
+Cubo de visibilidad anual precalculado (sitio × objeto × noche × bin de
+hora local) para responder al instante preguntas de planificación:
+
+- ¿qué objetos están sobre 40° esta noche desde Elqui?
+- ¿cuáles son las mejores noches del año para M42?
+- ¿cuántas horas pasa NGC3372 sobre X° cada noche desde la región II?
+
+El cubo se calcula una vez con `orionlab_ephem` (altitud de todos los
+objetos en todos los bins de la grilla de cada sitio) y se guarda en
+`$ORIONLAB_VISIBILITY_DIR` (o `~/.orionlab/visibility`):
+
+- `chunks.bin`  altitudes en grados enteros (int8), en bloques de
+                `OBJ_CHUNK` objetos × `NIGHT_CHUNK` noches × todos los bins.
+                Cada bloque se guarda como diferencias a lo largo de la noche
+                (la altitud cambia ~2° por bin) comprimidas con zlib; el
+                archivo se abre como memmap y sólo se descomprimen los
+                bloques que toca la consulta (con un LRU en memoria).
+- `offsets.npy` inicio y largo de cada bloque (sitio, bloque de objetos,
+                bloque de noches).
+- `dark.npy`    máscara de noche astronómica (sitio, noche, bin): depende
+                sólo del sitio, así que no se repite por objeto.
+- `index.json`  sitios con su región P12, objetos (lista P18 + Messier +
+                catálogo opcional), año, paso y horas de cada bin.
+
+Los sitios se pueden pedir por nombre (`Elqui`) o por región P12 (`IV`).
+Las consultas sólo cortan el cubo: no se recalculan efemérides.
+
+Uso:
+    python orionlab_visibility.py build --year 2026
+    python orionlab_visibility.py tonight --site IV --min-alt 40
+    python orionlab_visibility.py tonight --date 2027-03-14   # abre (o construye) el cubo de 2027
+    python orionlab_visibility.py nights --object M42 --min-alt 40 --top 10
+    python orionlab_visibility.py hours --object NGC3372 --site Atacama --min-alt 30
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_ephem import (OBJECTS, P18_OBJECTS, SITES, SUN_ALT_DARK, NightGrid, altitude_grid, load_objects,
+                            normalize_name)
+
+INDEX_NAME = "index.json"
+CHUNKS_NAME = "chunks.bin"
+
+CUBE_STEP_MIN = 10
+OBJ_CHUNK = 64
+NIGHT_CHUNK = 32
+COMPRESS_LEVEL = 6
+CACHE_CHUNKS = 512      # bloques descomprimidos en memoria (~170 KB c/u)
+
+MIN_ALT = 30.0
+TOP = 15
+
+
+def default_cube_dir():
+    return Path(os.environ.get("ORIONLAB_VISIBILITY_DIR", Path.home() / ".orionlab" / "visibility"))
+
+
+# ----------------------------------------------------------
+# CODIFICACIÓN DE BLOQUES
+# ----------------------------------------------------------
+def _encode(block):
+    """int8 (objetos, noches, bins) → diferencias por bin comprimidas con zlib."""
+    # En int8 la resta da la vuelta (módulo 256); el cumsum int8 la deshace
+    delta = np.diff(block, axis=2, prepend=np.int8(0))
+    return zlib.compress(delta.tobytes(), COMPRESS_LEVEL)
+
+
+def _decode(buffer, shape):
+    delta = np.frombuffer(zlib.decompress(buffer), dtype=np.int8).reshape(shape)
+    return np.cumsum(delta, axis=2, dtype=np.int8)
+
+
+def _cube_key(objects, sites, year, step_min, sun_alt):
+    text = json.dumps([sorted(objects.items()), list(sites), year, step_min, sun_alt])
+    return f"visibility-{year}-{step_min}min-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}"
+
+
+# ----------------------------------------------------------
+# CUBO
+# ----------------------------------------------------------
+class VisibilityCube:
+    """Cubo de altitudes en disco (sólo lectura) con consultas por sitio, objeto y noche."""
+
+    def __init__(self, directory):
+        self.root = Path(directory)
+        meta = json.loads((self.root / INDEX_NAME).read_text(encoding="utf-8"))
+        self.meta = meta
+        self.year, self.step_min, self.sun_alt = meta["year"], meta["step_min"], meta["sun_alt"]
+        self.sites = [s["name"] for s in meta["sites"]]
+        self.regions = {s["region"]: s["name"] for s in meta["sites"]}
+        self.objects = [o["name"] for o in meta["objects"]]
+        self.p18_objects = meta["p18_objects"]
+        self._object_index = {name: i for i, name in enumerate(self.objects)}
+        self.first_night = np.datetime64(meta["first_night"], "D")
+        self.n_nights = meta["n_nights"]
+        self.hours = np.array(meta["hours"])
+        self.dark = np.load(self.root / "dark.npy", mmap_mode="r")
+        self.offsets = np.load(self.root / "offsets.npy", mmap_mode="r")
+        self._data = np.memmap(self.root / CHUNKS_NAME, dtype=np.uint8, mode="r")
+        self._cache = OrderedDict()
+
+    @property
+    def nights(self):
+        return self.first_night + np.arange(self.n_nights)
+
+    # ------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------
+    @classmethod
+    def build(cls, directory, objects, sites=tuple(SITES), year=None, step_min=CUBE_STEP_MIN,
+              sun_alt=SUN_ALT_DARK, threads=None):
+        """Calcula y guarda el cubo de `objects` (nombre → (ra, dec)) en `directory`."""
+        year = year or date.today().year
+        directory = Path(directory)
+        tmp = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        names = list(objects)
+        ra, dec = np.array([objects[n] for n in names], dtype=np.float64).reshape(-1, 2).T
+        obj_blocks = [slice(i, min(i + OBJ_CHUNK, len(names))) for i in range(0, len(names), OBJ_CHUNK)]
+
+        grids = [NightGrid(site, year, step_min, sun_alt) for site in sites]
+        n_nights, n_bins = grids[0].shape
+        night_blocks = [slice(i, min(i + NIGHT_CHUNK, n_nights)) for i in range(0, n_nights, NIGHT_CHUNK)]
+        offsets = np.zeros((len(sites), len(obj_blocks), len(night_blocks), 2), dtype=np.int64)
+        position = raw = 0
+        with open(tmp / CHUNKS_NAME, "wb") as f, \
+                ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as pool:
+            for s, grid in enumerate(grids):
+                for o, ob in enumerate(obj_blocks):
+                    alt = np.rint(altitude_grid(ra[ob], dec[ob], grid, threads=1)).astype(np.int8)
+                    raw += alt.nbytes
+                    for n, buffer in enumerate(pool.map(lambda nb: _encode(alt[:, nb]), night_blocks)):
+                        f.write(buffer)
+                        offsets[s, o, n] = position, len(buffer)
+                        position += len(buffer)
+
+        np.save(tmp / "offsets.npy", offsets)
+        np.save(tmp / "dark.npy", np.stack([g.dark for g in grids]))
+        meta = {
+            "version": 1,
+            "year": int(year),
+            "step_min": step_min,
+            "sun_alt": sun_alt,
+            "first_night": str(grids[0].nights[0]),
+            "n_nights": n_nights,
+            "hours": grids[0].hours.tolist(),
+            "sites": [dict(name=site, **SITES[site]) for site in sites],
+            "objects": [{"name": n, "ra": round(float(r), 5), "dec": round(float(d), 5)}
+                        for n, r, d in zip(names, ra, dec)],
+            "p18_objects": [n for n in P18_OBJECTS if n in objects],
+            "bytes_raw": raw,
+            "bytes_compressed": position,
+        }
+        (tmp / INDEX_NAME).write_text(json.dumps(meta, indent=1), encoding="utf-8")
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+        return cls(directory)
+
+    # ------------------------------------------------------
+    # Índices
+    # ------------------------------------------------------
+    def site_index(self, site):
+        """Índice de un sitio por nombre (sin distinguir mayúsculas) o región P12."""
+        name = self.regions.get(str(site).upper(), site)
+        for i, s in enumerate(self.sites):
+            if s.lower() == str(name).lower():
+                return i
+        raise KeyError(f"Sitio/región desconocido: {site} (sitios: {', '.join(self.sites)}; "
+                       f"regiones: {', '.join(self.regions)})")
+
+    def object_index(self, name):
+        try:
+            return self._object_index[normalize_name(name)]
+        except KeyError:
+            raise KeyError(f"{name} no está en el cubo ({len(self.objects)} objetos)") from None
+
+    def night_index(self, night):
+        """Índice de la noche que empieza la tarde de `night` (fecha ISO o `datetime64`)."""
+        i = int((np.datetime64(night, "D") - self.first_night).astype(np.int64))
+        if not 0 <= i < self.n_nights:
+            raise ValueError(f"La noche {night} está fuera del cubo ({self.year})")
+        return i
+
+    # ------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------
+    def _block(self, s, o, n):
+        key = (s, o, n)
+        block = self._cache.get(key)
+        if block is not None:
+            self._cache.move_to_end(key)
+            return block
+        start, length = self.offsets[s, o, n]
+        n_obj = min(OBJ_CHUNK, len(self.objects) - o * OBJ_CHUNK)
+        n_nights = min(NIGHT_CHUNK, self.n_nights - n * NIGHT_CHUNK)
+        block = _decode(self._data[start:start + length], (n_obj, n_nights, len(self.hours)))
+        self._cache[key] = block
+        if len(self._cache) > CACHE_CHUNKS:
+            self._cache.popitem(last=False)
+        return block
+
+    def altitudes(self, site, objects=None, nights=slice(None)):
+        """Altitudes int8 (grados) de forma (objetos, noches, bins) sin Sol enmascarado."""
+        s = self.site_index(site)
+        idx = (np.arange(len(self.objects)) if objects is None
+               else np.array([self.object_index(o) for o in objects], dtype=np.int64))
+        n0, n1, _ = nights.indices(self.n_nights)
+        out = np.empty((len(idx), max(n1 - n0, 0), len(self.hours)), dtype=np.int8)
+        chunk = idx // OBJ_CHUNK
+        for o in np.unique(chunk):
+            rows = np.flatnonzero(chunk == o)
+            local = idx[rows] - o * OBJ_CHUNK
+            for n in range(n0 // NIGHT_CHUNK, (n1 - 1) // NIGHT_CHUNK + 1):
+                a, b = max(n0, n * NIGHT_CHUNK), min(n1, (n + 1) * NIGHT_CHUNK)
+                out[rows, a - n0:b - n0] = self._block(s, o, n)[local, a - n * NIGHT_CHUNK:b - n * NIGHT_CHUNK]
+        return out
+
+    def _summary(self, alt, dark, min_alt):
+        """Horas oscuras sobre `min_alt`, altitud máxima oscura y hora local de ese máximo."""
+        up = (alt >= min_alt) & dark
+        hours = up.sum(axis=-1) * self.step_min / 60.0
+        masked = np.where(dark, alt, np.int8(-128))
+        best = masked.argmax(axis=-1)
+        max_alt = np.take_along_axis(masked, best[..., None], axis=-1)[..., 0]
+        return hours, max_alt, self.hours[best] % 24
+
+    # ------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------
+    def hours_above(self, obj, site, min_alt=MIN_ALT, nights=slice(None)):
+        """Horas de noche oscura con `obj` sobre `min_alt` en cada noche (arreglo float)."""
+        s = self.site_index(site)
+        alt = self.altitudes(site, [obj], nights)[0]
+        return self._summary(alt, np.asarray(self.dark[s, nights]), min_alt)[0]
+
+    def best_objects(self, site, night, min_alt=MIN_ALT, top=TOP):
+        """Objetos con más horas oscuras sobre `min_alt` en una noche (desempate por altitud)."""
+        s, n = self.site_index(site), self.night_index(night)
+        alt = self.altitudes(site, nights=slice(n, n + 1))[:, 0]
+        hours, max_alt, best_hour = self._summary(alt, np.asarray(self.dark[s, n]), min_alt)
+        order = np.lexsort((-max_alt.astype(np.int16), -hours))
+        order = order[hours[order] > 0][:top]
+        return [{"object": self.objects[i], "hours": float(hours[i]), "max_altitude_deg": int(max_alt[i]),
+                 "best_hour_local": float(best_hour[i])} for i in order]
+
+    def best_nights(self, obj, sites=None, min_alt=MIN_ALT, top=TOP):
+        """Noches (y sitios) con más horas oscuras de `obj` sobre `min_alt`."""
+        rows = []
+        for site in sites or self.sites:
+            s = self.site_index(site)
+            alt = self.altitudes(site, [obj])[0]
+            hours, max_alt, best_hour = self._summary(alt, np.asarray(self.dark[s]), min_alt)
+            for n in np.flatnonzero(hours > 0):
+                rows.append({"site": self.sites[s], "region": self.meta["sites"][s]["region"],
+                             "night": str(self.nights[n]), "hours": float(hours[n]),
+                             "max_altitude_deg": int(max_alt[n]), "best_hour_local": float(best_hour[n])})
+        rows.sort(key=lambda r: (-r["hours"], -r["max_altitude_deg"], r["night"]))
+        return rows[:top]
+
+
+def open_cube(year=None, step_min=CUBE_STEP_MIN, sun_alt=SUN_ALT_DARK, catalog=None, sites=tuple(SITES),
+              root=None, rebuild=False, threads=None):
+    """Cubo del año (Messier + P18 + `catalog` opcional): se abre del disco o se construye."""
+    year = year or date.today().year
+    objects = dict(OBJECTS)
+    if catalog:
+        objects.update(load_objects(catalog))
+    directory = Path(root or default_cube_dir()) / _cube_key(objects, sites, year, step_min, sun_alt)
+    if not rebuild and (directory / INDEX_NAME).exists():
+        return VisibilityCube(directory)
+    t0 = time.perf_counter()
+    print(f"🚀 Construyendo cubo {year}: {len(sites)} sitios × {len(objects)} objetos × noches del año, "
+          f"bins de {step_min} min")
+    cube = VisibilityCube.build(directory, objects, sites, year, step_min, sun_alt, threads)
+    meta = cube.meta
+    print(f"✅ Cubo en {directory} ({meta['bytes_compressed'] / 2 ** 20:.1f} MB, "
+          f"{meta['bytes_raw'] / max(meta['bytes_compressed'], 1):.1f}× comprimido) "
+          f"en {time.perf_counter() - t0:.1f} s")
+    return cube
+
+
+def _format(field, value, width):
+    if field == "best_hour_local":
+        minutes = int(round(value * 60))
+        return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+    if isinstance(value, float):
+        return f"{value:>{width}.1f}"
+    return f"{value:>{width}}"
+
+
+def _print_rows(rows, fields):
+    if not rows:
+        print("  (sin resultados)")
+    for row in rows:
+        print("  " + "  ".join(_format(f, row[f], w) for f, w in fields))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cubo de visibilidad anual y consultas de planificación.")
+    parser.add_argument("--cube-dir", type=Path, help="Directorio de cubos (por defecto $ORIONLAB_VISIBILITY_DIR).")
+    parser.add_argument("--year", type=int,
+                        help="Año del cubo (por defecto el de --date en tonight, si no el año en curso).")
+    parser.add_argument("--step", type=int, default=CUBE_STEP_MIN, help="Resolución del cubo en minutos.")
+    parser.add_argument("--sun-alt", type=float, default=SUN_ALT_DARK)
+    parser.add_argument("--catalog", type=Path, help="Catálogo NGC/IC adicional (CSV/Parquet).")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p_build = sub.add_parser("build", help="Calcula y guarda el cubo del año.")
+    p_build.add_argument("--rebuild", action="store_true")
+    p_build.add_argument("--threads", type=int)
+
+    p_tonight = sub.add_parser("tonight", help="Mejores objetos de una noche y sitio.")
+    p_tonight.add_argument("--site", default="Santiago", help="Sitio o región P12 (RM, IV, II, IX, X).")
+    p_tonight.add_argument("--date", default=str(date.today()), help="Fecha de la tarde (ISO).")
+
+    p_nights = sub.add_parser("nights", help="Mejores noches del año para un objeto.")
+    p_nights.add_argument("--object", required=True)
+    p_nights.add_argument("--site", nargs="+", help="Sitios o regiones (por defecto todos).")
+
+    p_hours = sub.add_parser("hours", help="Horas sobre una altitud por noche (resumen mensual).")
+    p_hours.add_argument("--object", required=True)
+    p_hours.add_argument("--site", default="Santiago")
+
+    for p in (p_tonight, p_nights, p_hours):
+        p.add_argument("--min-alt", type=float, default=MIN_ALT, help="Altitud mínima (grados).")
+    for p in (p_tonight, p_nights):
+        p.add_argument("--top", type=int, default=TOP)
+    args = parser.parse_args(argv)
+    if args.year is None:
+        # La consulta fija el año: `tonight --date` nunca cae fuera del cubo abierto
+        if args.action == "tonight":
+            try:
+                args.year = date.fromisoformat(args.date).year
+            except ValueError:
+                parser.error(f"--date inválida: {args.date!r} (formato AAAA-MM-DD)")
+        else:
+            args.year = date.today().year
+
+    cube = open_cube(args.year, args.step, args.sun_alt, args.catalog, root=args.cube_dir,
+                     rebuild=getattr(args, "rebuild", False), threads=getattr(args, "threads", None))
+    if args.action == "build":
+        return 0
+
+    t0 = time.perf_counter()
+    try:
+        if args.action == "tonight":
+            rows = cube.best_objects(args.site, args.date, args.min_alt, args.top)
+            site = cube.sites[cube.site_index(args.site)]
+        elif args.action == "nights":
+            rows = cube.best_nights(args.object, args.site, args.min_alt, args.top)
+        else:
+            hours = cube.hours_above(args.object, args.site, args.min_alt)
+            site = cube.sites[cube.site_index(args.site)]
+    except (KeyError, ValueError) as e:
+        # Sitio, región u objeto desconocido, o fecha fuera del año del cubo
+        parser.error(e.args[0] if e.args else str(e))
+
+    if args.action == "tonight":
+        print(f"Noche del {args.date} desde {site}: objetos sobre {args.min_alt:g}° ({len(rows)})")
+        _print_rows(rows, [("object", 8), ("hours", 5), ("max_altitude_deg", 3), ("best_hour_local", 5)])
+    elif args.action == "nights":
+        print(f"Mejores noches de {cube.year} para {normalize_name(args.object)} sobre {args.min_alt:g}°")
+        _print_rows(rows, [("night", 10), ("site", 10), ("region", 3), ("hours", 5),
+                           ("max_altitude_deg", 3), ("best_hour_local", 5)])
+    else:
+        months = cube.nights.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        print(f"{normalize_name(args.object)} sobre {args.min_alt:g}° desde {site} en {cube.year} "
+              f"(horas por noche: media / máx. del mes)")
+        for month in range(1, 13):
+            h = hours[months == month]
+            print(f"  mes {month:>2}: {h.mean():4.1f} / {h.max():4.1f} h  "
+                  f"({int((h > 0).sum())} noches)")
+    print(f"↷ Consulta en {(time.perf_counter() - t0) * 1e3:.1f} ms (sin recalcular efemérides)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
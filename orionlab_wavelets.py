@@ -0,0 +1,324 @@
+"""
+orionlab_wavelets.py
+
+Wavelets à-trous (starlet) para realzar detalle en nebulosas (estudio P19).
+
+Descomposición: c_0 = imagen, c_{j+1} = B3 * c_j con el kernel B3-spline
+[1, 4, 6, 4, 1]/16 separable (filas y luego columnas) y "agujeros" de 2^j
+píxeles; la capa j es w_j = c_{j-1} - c_j y la reconstrucción es la suma
+c_J + Σ w_j.
+
+Cada capa se procesa con:
+
+- umbral de ruido (soft thresholding) a k_j·σ_j, donde σ_j es el ruido de la
+  capa (σ de la imagen por el factor de la starlet, `STARLET_NOISE`)
+- ganancia g_j sobre lo que queda
+
+El motor trabaja en bandas de filas con un margen igual al soporte del
+filtro más grueso (2·(2^J - 1) px), así cada banda es exacta y se procesa
+en un hilo propio. Dentro de la banda todo se hace sobre unos pocos buffers
+float32 preasignados: las convoluciones escriben en un buffer de salida y
+las capas se procesan y acumulan en su lugar, sin guardar la pirámide.
+
+Las métricas de P19 se miden sobre un recorte central de la imagen real:
+
+- detail_gain_pct          aumento RMS de los coeficientes significativos
+                           (|w_j| > 3σ_j) de la capa
+- noise_amplification_pct  aumento de σ del detalle total (Σ w_j) en los
+                           píxeles de fondo (sin coeficientes significativos)
+                           al procesar sólo esa capa
+
+Uso:
+    python orionlab_wavelets.py stacked.fits --gains 1 1.6 1.8 1.4 1.2 --denoise 3 1.5 --out realce.fits
+    python orionlab_wavelets.py stacked.fits --table            # tabla P19 desde la imagen
+    python orionlab_wavelets.py --demo --layers 6 --table /tmp/p19.csv
+"""
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import FrameSource, save_frame
+from orionlab_stack import background_noise
+
+TABLE_FIELDS = ["wavelet_layer", "detail_gain_pct", "noise_amplification_pct"]
+
+# Estudio P19 (nombre actual y nombre del generador batch)
+P19_DIRS = ["p19_wavelets_nebulosas", "p19_wavelets_nebulae_detail"]
+TABLE_NAME = "wavelets_nebulae_detail.csv"
+
+N_LAYERS = 5
+
+# Procesado por defecto: realce de las escalas de nebulosa (2-4) y
+# supresión del ruido en las finas. Las capas sin valor usan 1 y 0.
+LAYER_GAINS = (1.0, 1.6, 1.8, 1.5, 1.2, 1.0)
+DENOISE_SIGMA = (3.0, 1.5, 0.5, 0.0, 0.0, 0.0)
+
+# σ de cada capa de la starlet B3 para ruido blanco de σ = 1
+STARLET_NOISE = (0.8908, 0.2007, 0.0856, 0.0413, 0.0205, 0.0103, 0.0052, 0.0026, 0.0013)
+
+SUPPORT_SIGMA = 3.0
+TILE_ROWS = 1024
+MEASURE_CROP = 2048
+
+_B3 = (1 / 16, 4 / 16, 6 / 16, 4 / 16, 1 / 16)
+
+
+# ----------------------------------------------------------
+# CONVOLUCIÓN B3 À-TROUS
+# ----------------------------------------------------------
+def _index(axis, sl):
+    return (slice(None),) * axis + (sl,)
+
+
+def _reflect(idx, n):
+    """Índices reflejados sin repetir el borde (…, 2, 1, 0, 1, 2, …)."""
+    if n == 1:
+        return np.zeros_like(idx)
+    period = 2 * (n - 1)
+    idx = np.abs(idx) % period
+    return np.where(idx >= n, period - idx, idx)
+
+
+def _b3_pass(src, dst, scratch, hole, axis):
+    """
+    dst = B3 à-trous de `src` a lo largo de `axis` con paso `hole` (bordes
+    reflejados). `scratch` es un buffer del tamaño de `src`.
+    """
+    n = src.shape[axis]
+    np.multiply(src, np.float32(_B3[2]), out=dst)
+    for d, k in ((hole, _B3[1]), (2 * hole, _B3[0])):
+        k = np.float32(k)
+        if d < n:
+            # Interior: src[i - d] + src[i + d]
+            inner = _index(axis, slice(d, n - d))
+            if n - d > d:
+                out = scratch[inner]
+                np.add(src[_index(axis, slice(0, n - 2 * d))], src[_index(axis, slice(2 * d, n))], out=out)
+                out *= k
+                dst[inner] += out
+            edge = np.r_[0:min(d, n), max(d, n - d):n]
+        else:
+            edge = np.arange(n)
+        # Bordes (y filtros más anchos que el eje): índices reflejados
+        pair = np.take(src, _reflect(edge - d, n), axis=axis) + np.take(src, _reflect(edge + d, n), axis=axis)
+        dst[_index(axis, edge)] += k * pair
+
+
+def _smooth(src, dst, tmp, scratch, hole):
+    """dst = B3 separable de `src` (filas y luego columnas)."""
+    _b3_pass(src, tmp, scratch, hole, axis=1)
+    _b3_pass(tmp, dst, scratch, hole, axis=0)
+
+
+def support_px(n_layers):
+    """Radio del soporte de c_J: píxeles de margen para que una banda sea exacta."""
+    return 2 * (2 ** n_layers - 1)
+
+
+def decompose(image, n_layers=N_LAYERS):
+    """Capas de detalle `[w_1, …, w_J]` y residuo c_J (float32), para análisis."""
+    c = np.array(image, dtype=np.float32)
+    nxt, tmp, scratch = np.empty_like(c), np.empty_like(c), np.empty_like(c)
+    layers = []
+    for j in range(n_layers):
+        _smooth(c, nxt, tmp, scratch, 2 ** j)
+        layers.append(c - nxt)
+        c, nxt = nxt, c
+    return layers, c
+
+
+def reconstruct(layers, residual, gains=None):
+    """c_J + Σ g_j·w_j."""
+    out = np.array(residual, dtype=np.float32)
+    for j, w in enumerate(layers):
+        g = _layer_value(gains, j, 1.0)
+        out += w if g == 1 else np.float32(g) * w
+    return out
+
+
+# ----------------------------------------------------------
+# PROCESADO POR CAPA
+# ----------------------------------------------------------
+def _layer_value(values, j, default):
+    return float(values[j]) if values is not None and j < len(values) else default
+
+
+def _process_layer(w, j, gains, denoise, noise):
+    """Umbral suave a k_j·σ_j y ganancia g_j, en su lugar sobre `w`."""
+    k = _layer_value(denoise, j, 0.0)
+    if k > 0:
+        t = np.float32(k * noise * STARLET_NOISE[min(j, len(STARLET_NOISE) - 1)])
+        shrunk = np.abs(w)
+        shrunk -= t
+        np.maximum(shrunk, 0, out=shrunk)
+        np.copysign(shrunk, w, out=w)
+    g = _layer_value(gains, j, 1.0)
+    if g != 1:
+        w *= np.float32(g)
+    return w
+
+
+def _read_rows(image, rows):
+    if hasattr(image, "read"):
+        return image.read(rows=rows)
+    return np.array(image[rows], dtype=np.float32)
+
+
+def _enhance_band(image, out, rows, n_layers, gains, denoise, noise, margin):
+    h = image.shape[0]
+    r0, r1 = max(0, rows.start - margin), min(h, rows.stop + margin)
+    c = _read_rows(image, slice(r0, r1))
+    nxt, tmp, scratch = np.empty_like(c), np.empty_like(c), np.empty_like(c)
+    acc = np.zeros_like(c)
+    for j in range(n_layers):
+        _smooth(c, nxt, tmp, scratch, 2 ** j)
+        np.subtract(c, nxt, out=c)            # c pasa a ser w_j
+        acc += _process_layer(c, j, gains, denoise, noise)
+        c, nxt = nxt, c
+    acc += c
+    out[rows] = acc[rows.start - r0:rows.stop - r0]
+
+
+def enhance(image, gains=LAYER_GAINS, denoise=DENOISE_SIGMA, n_layers=N_LAYERS, threads=None,
+            tile_rows=TILE_ROWS, out=None, noise=None):
+    """
+    Descompone, procesa (umbral de ruido + ganancia por capa) y reconstruye
+    `image` (arreglo 2D, memmap o `FrameSource`) por bandas en paralelo.
+    `out` (float32, no puede ser `image`) recibe el resultado; `noise` es
+    el σ de la imagen (por defecto se estima con `background_noise`).
+    """
+    h, w = image.shape
+    out = np.empty((h, w), dtype=np.float32) if out is None else out
+    if noise is None and any(_layer_value(denoise, j, 0.0) > 0 for j in range(n_layers)):
+        noise = background_noise(_read_rows(image, slice(0, h, max(1, h // 1024))))
+    threads = threads or os.cpu_count() or 1
+    margin = support_px(n_layers)
+    bands = [slice(r0, min(h, r0 + tile_rows)) for r0 in range(0, h, tile_rows)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda rows: _enhance_band(image, out, rows, n_layers, gains, denoise,
+                                                 noise or 0.0, margin), bands))
+    return out
+
+
+# ----------------------------------------------------------
+# MÉTRICAS P19
+# ----------------------------------------------------------
+def _center_crop(image, size):
+    h, w = image.shape
+    r0, c0 = max(0, (h - size) // 2), max(0, (w - size) // 2)
+    return _read_rows(image, slice(r0, r0 + min(h, size)))[:, c0:c0 + min(w, size)]
+
+
+def layer_metrics(image, gains=LAYER_GAINS, denoise=DENOISE_SIGMA, n_layers=N_LAYERS, crop=MEASURE_CROP):
+    """
+    Filas P19 (una por capa) midiendo el efecto de procesar cada capa por
+    separado sobre un recorte central de `crop` px de `image`.
+    """
+    img = _center_crop(image, crop)
+    noise = background_noise(img)
+    layers, residual = decompose(img, n_layers)
+    sigmas = [noise * STARLET_NOISE[min(j, len(STARLET_NOISE) - 1)] for j in range(n_layers)]
+    supports = [np.abs(w) > SUPPORT_SIGMA * s for w, s in zip(layers, sigmas)]
+    background = ~np.logical_or.reduce(supports)
+    detail = img - residual
+    noise_ref = float(detail[background].std())
+
+    rows = []
+    for j, (w, significant) in enumerate(zip(layers, supports)):
+        processed = _process_layer(w.copy(), j, gains, denoise, noise)
+        if significant.any():
+            gain = math.sqrt(float(np.mean(processed[significant] ** 2)) / float(np.mean(w[significant] ** 2)))
+        else:
+            gain = float("nan")
+        amplified = float((detail + processed - w)[background].std())
+        rows.append({
+            "wavelet_layer": j + 1,
+            "detail_gain_pct": round(100 * (gain - 1)) if math.isfinite(gain) else "",
+            "noise_amplification_pct": round(100 * (amplified / noise_ref - 1)) if noise_ref else "",
+        })
+    return rows
+
+
+def write_p19_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P19_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, TABLE_FIELDS, csv_path)
+    print(f"✅ Tabla P19: {csv_path}")
+    return csv_path
+
+
+def synthetic_nebula(shape=(3008, 3008), noise=20.0, seed=42):
+    """Nebulosa sintética: nubes gaussianas de varias escalas, filamentos, estrellas y ruido."""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    yy, xx = np.ogrid[0:h, 0:w]
+    img = np.full(shape, 1000.0, dtype=np.float32)
+    for scale in (200, 60, 15, 4):
+        for _ in range(int(40 * 60 / scale)):
+            y0, x0 = rng.uniform(0, h), rng.uniform(0, w)
+            r0, r1 = int(max(0, y0 - 4 * scale)), int(min(h, y0 + 4 * scale + 1))
+            c0, c1 = int(max(0, x0 - 4 * scale)), int(min(w, x0 + 4 * scale + 1))
+            amp = rng.uniform(20, 150)
+            img[r0:r1, c0:c1] += amp * np.exp(-((yy[r0:r1] - y0) ** 2 + (xx[:, c0:c1] - x0) ** 2)
+                                              / (2 * scale ** 2))
+    for y0, x0, flux in zip(rng.uniform(0, h, 400), rng.uniform(0, w, 400), rng.lognormal(8, 1, 400)):
+        r0, r1, c0, c1 = int(max(0, y0 - 6)), int(min(h, y0 + 7)), int(max(0, x0 - 6)), int(min(w, x0 + 7))
+        img[r0:r1, c0:c1] += flux / (2 * np.pi * 1.5 ** 2) * np.exp(
+            -((yy[r0:r1] - y0) ** 2 + (xx[:, c0:c1] - x0) ** 2) / (2 * 1.5 ** 2))
+    img += rng.standard_normal(shape, dtype=np.float32) * np.float32(noise)
+    return img
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Realce de detalle con wavelets à-trous (P19).")
+    parser.add_argument("image", nargs="?", type=Path, help="Imagen apilada (.npy/.fits).")
+    parser.add_argument("--layers", type=int, default=N_LAYERS)
+    parser.add_argument("--gains", nargs="+", type=float, default=list(LAYER_GAINS),
+                        help="Ganancia por capa (de fina a gruesa).")
+    parser.add_argument("--denoise", nargs="+", type=float, default=list(DENOISE_SIGMA),
+                        help="Umbral de ruido por capa, en σ de la capa (0 = sin umbral).")
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--tile-rows", type=int, default=TILE_ROWS)
+    parser.add_argument("--out", type=Path, help="Guarda la imagen procesada (.npy/.fits).")
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help=f"Escribe la tabla P19 (por defecto {TABLE_NAME} del estudio).")
+    parser.add_argument("--demo", action="store_true", help="Nebulosa sintética de 3008×3008.")
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        image = synthetic_nebula()
+    elif args.image:
+        image = FrameSource.open(args.image)
+    else:
+        parser.error("indique una imagen o use --demo")
+
+    if args.out or args.demo:
+        import time
+
+        t0 = time.perf_counter()
+        result = enhance(image, args.gains, args.denoise, args.layers, args.threads, args.tile_rows)
+        print(f"✅ {args.layers} capas en {time.perf_counter() - t0:.2f} s "
+              f"({image.shape[0]}×{image.shape[1]})")
+        if args.out:
+            save_frame(args.out, result)
+            print(f"✅ Imagen procesada: {args.out}")
+
+    rows = layer_metrics(image, args.gains, args.denoise, args.layers)
+    for row in rows:
+        print(f"  capa {row['wavelet_layer']}: detalle {row['detail_gain_pct']!s:>4} %  "
+              f"ruido {row['noise_amplification_pct']!s:>4} %")
+    if args.table is not None:
+        write_p19_table(rows, args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
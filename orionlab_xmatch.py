@@ -0,0 +1,576 @@
+"""
+orionlab_xmatch.py
+
+Cruce de detecciones con un catálogo de referencia local (APASS, Gaia
+sintético, Tycho-2…) para el estudio de color estelar P13.
+
+1. El catálogo (CSV o Parquet con RA, Dec y magnitudes B, V, g, r; los
+   nombres de columna se reconocen por alias) se pasa a vectores unitarios
+   y se indexa con una grilla hash 3D sobre la esfera: cada estrella cae en
+   un cubo de lado `cell` y las estrellas se ordenan por cubo (estilo CSR:
+   claves únicas + offsets).
+2. Cada estrella se inscribe también en los cubos vecinos cuya cara está a
+   menos de `MARGIN`·cell, de modo que con `radio ≤ MARGIN·cell` basta mirar
+   el cubo de cada detección: un `searchsorted` de N claves ordenadas y una
+   reducción vectorizada sobre los candidatos (decenas de miles de
+   estrellas en milisegundos).
+3. El índice se guarda en `$ORIONLAB_CATALOG_DIR` (o
+   `~/.orionlab/catalogs`) como `.npy` + `meta.json`, con clave por ruta,
+   tamaño, fecha del catálogo y tamaño de celda, y se abre con memmap en
+   las noches siguientes.
+
+Las detecciones traen RA/Dec o y/x (píxeles, convertidos con la WCS TAN de
+la cabecera FITS) y una columna de magnitud instrumental por banda
+(`mag_B`, `mag_V`, `mag_g`, `mag_r`…; una sola columna `mag`, como la de
+un catálogo de `orionlab_psf` por filtro, no dice la banda y hay que
+renombrarla o juntar los catálogos de cada filtro). Por color (B−V, g−r) se
+ajusta `color_catálogo = a + k·color_instrumental` con rechazo σ-clip y el
+residuo por estrella (calibrado − catálogo) va a la tabla P13.
+
+Uso:
+    python orionlab_xmatch.py detecciones.csv --catalog apass_carina.parquet --table
+    python orionlab_xmatch.py psf_ngc3532_BVgr.csv --wcs ngc3532_V.fits --catalog apass.csv --radius 3
+    python orionlab_xmatch.py --catalog apass.csv --build-only --cell 20
+    python orionlab_xmatch.py --demo
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from orionlab_frames import read_header
+
+P13_DIRS = ["p13_color_estelar", "p13_star_colour_variation"]
+TABLE_NAME = "star_colour_variation.csv"
+P13_FIELDS = ["star_id", "b_minus_v", "g_minus_r", "snr"]
+
+BANDS = ("B", "V", "g", "r")
+COLOURS = {"b_minus_v": ("B", "V"), "g_minus_r": ("g", "r")}
+
+MATCH_RADIUS_ARCSEC = 2.0
+CELL_ARCSEC = 10.0
+MARGIN = 0.25           # radio máximo de cruce, en celdas
+CLIP_SIGMA = 3.0
+CLIP_ITERS = 5
+MIN_CALIB = 5           # estrellas mínimas para ajustar el término de color
+
+ARCSEC = math.pi / (180 * 3600)
+
+RA_ALIASES = ("ra", "raj2000", "radeg", "rajdeg", "alpha", "ra_icrs")
+DEC_ALIASES = ("dec", "dej2000", "decj2000", "decdeg", "dedeg", "decl", "delta", "de_icrs")
+
+
+def default_catalog_dir():
+    return Path(os.environ.get("ORIONLAB_CATALOG_DIR", Path.home() / ".orionlab" / "catalogs"))
+
+
+# ----------------------------------------------------------
+# COLUMNAS Y LECTURA
+# ----------------------------------------------------------
+def _norm(name):
+    return re.sub(r"[^0-9a-z]", "", str(name).lower())
+
+
+def _band_of(name):
+    """
+    Banda de una columna de magnitud (`Bmag`, `mag_V`, `g'mag`, `r_mag`…).
+
+    B y V no distinguen mayúsculas; g y r deben ir en minúscula para no
+    confundirlas con G de Gaia o R de Johnson–Cousins.
+    """
+    core = re.sub(r"(?i)mag|sdss|apass|inst|_|'|-|\s", "", str(name))
+    if core.upper() in ("B", "V"):
+        return core.upper()
+    if core in ("g", "r"):
+        return core
+    return None
+
+
+def _find(columns, aliases):
+    lookup = {_norm(c): c for c in columns}
+    for alias in aliases:
+        if alias in lookup:
+            return lookup[alias]
+    return None
+
+
+def read_any(path):
+    """DataFrame desde CSV o Parquet (según la extensión)."""
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix.lower() in (".parquet", ".pq"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def _columns(df):
+    """(ra, dec, mags (N, 4) con NaN en bandas ausentes, bandas encontradas)."""
+    mags = np.full((len(df), len(BANDS)), np.nan, dtype=np.float32)
+    found = []
+    for col in df.columns:
+        band = _band_of(col)
+        if band and band not in found:
+            mags[:, BANDS.index(band)] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)
+            found.append(band)
+    ra_col, dec_col = _find(df.columns, RA_ALIASES), _find(df.columns, DEC_ALIASES)
+    if ra_col is None or dec_col is None:
+        return None, None, mags, found
+    ra = df[ra_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    dec = df[dec_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return ra, dec, mags, found
+
+
+def load_catalog(path):
+    """Catálogo de referencia: dict con `ra`, `dec` (grados), `mags` y `bands`."""
+    df = read_any(path)
+    ra, dec, mags, found = _columns(df)
+    if ra is None:
+        raise ValueError(f"{path}: no se encontraron columnas RA/Dec ({', '.join(map(str, df.columns))})")
+    ok = np.isfinite(ra) & np.isfinite(dec)
+    return {"ra": ra[ok], "dec": dec[ok], "mags": mags[ok], "rows": np.flatnonzero(ok), "bands": found}
+
+
+# ----------------------------------------------------------
+# WCS TAN (GNÓMICA)
+# ----------------------------------------------------------
+def _card(header, key, default=None):
+    value = header.get(key)
+    return default if value in (None, "") else float(value)
+
+
+def wcs_matrix(header):
+    """(crval (ra, dec), crpix (x, y), CD 2×2 en grados/px) de una cabecera FITS."""
+    if "CRVAL1" not in header or "CRPIX1" not in header:
+        raise ValueError("la cabecera no tiene WCS (CRVAL/CRPIX); resuelva el campo antes del cruce")
+    ctype = str(header.get("CTYPE1", "RA---TAN"))
+    if not ctype.endswith("TAN"):
+        raise ValueError(f"proyección no soportada: {ctype} (sólo TAN)")
+    crval = np.array([_card(header, "CRVAL1"), _card(header, "CRVAL2")])
+    crpix = np.array([_card(header, "CRPIX1"), _card(header, "CRPIX2")])
+    if "CD1_1" in header:
+        cd = np.array([[_card(header, "CD1_1"), _card(header, "CD1_2", 0.0)],
+                       [_card(header, "CD2_1", 0.0), _card(header, "CD2_2")]])
+    else:
+        cdelt = np.array([_card(header, "CDELT1"), _card(header, "CDELT2")])
+        rot = math.radians(_card(header, "CROTA2", 0.0))
+        c, s = math.cos(rot), math.sin(rot)
+        cd = np.array([[cdelt[0] * c, -cdelt[1] * s], [cdelt[0] * s, cdelt[1] * c]])
+    return crval, crpix, cd
+
+
+def pixel_to_sky(header, y, x):
+    """RA/Dec (grados) de posiciones en píxeles (0-based, fila/columna)."""
+    crval, crpix, cd = wcs_matrix(header)
+    dx = np.asarray(x, dtype=np.float64) + 1 - crpix[0]
+    dy = np.asarray(y, dtype=np.float64) + 1 - crpix[1]
+    xi = np.radians(cd[0, 0] * dx + cd[0, 1] * dy)
+    eta = np.radians(cd[1, 0] * dx + cd[1, 1] * dy)
+    ra0, dec0 = np.radians(crval)
+    den = math.cos(dec0) - eta * math.sin(dec0)
+    ra = ra0 + np.arctan2(xi, den)
+    dec = np.arctan2(math.sin(dec0) + eta * math.cos(dec0), np.hypot(xi, den))
+    return np.degrees(ra) % 360.0, np.degrees(dec)
+
+
+def sky_to_pixel(header, ra, dec):
+    """Inversa de `pixel_to_sky`: (y, x) 0-based."""
+    crval, crpix, cd = wcs_matrix(header)
+    ra0, dec0 = np.radians(crval)
+    ra, dec = np.radians(ra), np.radians(dec)
+    cos_c = math.sin(dec0) * np.sin(dec) + math.cos(dec0) * np.cos(dec) * np.cos(ra - ra0)
+    xi = np.degrees(np.cos(dec) * np.sin(ra - ra0) / cos_c)
+    eta = np.degrees((math.cos(dec0) * np.sin(dec) - math.sin(dec0) * np.cos(dec) * np.cos(ra - ra0)) / cos_c)
+    dx, dy = np.linalg.solve(cd, np.vstack([xi, eta]))
+    return dy + crpix[1] - 1, dx + crpix[0] - 1
+
+
+# ----------------------------------------------------------
+# ÍNDICE ESPACIAL
+# ----------------------------------------------------------
+def unit_vectors(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def _chord(arcsec):
+    return 2.0 * math.sin(arcsec * ARCSEC / 2)
+
+
+class SkyIndex:
+    """
+    Catálogo indexado por cubo de una grilla 3D sobre la esfera unidad.
+
+    Cada estrella se inscribe en su cubo y en los vecinos a menos de
+    `MARGIN`·celda de sus caras (≈3,4 entradas por estrella), así que una
+    consulta de radio ≤ `MARGIN`·celda sólo mira el cubo de la detección.
+    `cells` son las claves únicas ordenadas, `offsets` (len + 1) el rango de
+    cada una en `members`, y `members` apunta a `xyz`/`mags`/`rows`
+    (ordenados por cubo para que las lecturas del memmap sean locales).
+    """
+
+    FILES = ("cells", "offsets", "members", "xyz", "mags", "rows")
+
+    def __init__(self, cells, offsets, members, xyz, mags, rows, cell_arcsec, bands):
+        self.cells, self.offsets, self.members = cells, offsets, members
+        self.xyz, self.mags, self.rows = xyz, mags, rows
+        self.cell_arcsec = float(cell_arcsec)
+        self.max_radius = MARGIN * self.cell_arcsec
+        self.bands = list(bands)
+        self.cell = _chord(self.cell_arcsec)
+        self.side = int(math.ceil(2.0 / self.cell)) + 3
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def _cube(self, xyz):
+        u = (xyz + 1.0) / self.cell
+        i = np.floor(u).astype(np.int64)
+        return i + 1, u - i
+
+    def _keys(self, i):
+        return (i[..., 0] * self.side + i[..., 1]) * self.side + i[..., 2]
+
+    @classmethod
+    def build(cls, ra, dec, mags=None, rows=None, cell_arcsec=CELL_ARCSEC, bands=BANDS):
+        index = cls(None, None, None, None, None, None, cell_arcsec, bands)
+        xyz = unit_vectors(ra, dec)
+        i, frac = index._cube(xyz)
+        base = index._keys(i)
+        order = np.argsort(base, kind="stable")
+        i, frac, base = i[order], frac[order], base[order]
+        n = len(order)
+
+        # Vecinos a menos del margen de cada cara: -1 / 0 / +1 por eje
+        margin = _chord(index.max_radius) / index.cell
+        near = {-1: frac < margin, 0: np.ones_like(frac, dtype=bool), 1: frac > 1 - margin}
+        keys, members = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    ok = near[dx][:, 0] & near[dy][:, 1] & near[dz][:, 2]
+                    keys.append(base[ok] + (dx * index.side + dy) * index.side + dz)
+                    members.append(np.flatnonzero(ok))
+        keys, members = np.concatenate(keys), np.concatenate(members)
+        by_key = np.argsort(keys, kind="stable")
+        keys = keys[by_key]
+        cells, starts = np.unique(keys, return_index=True)
+        index.cells = cells
+        index.offsets = np.append(starts, len(keys)).astype(np.int64)
+        index.members = members[by_key].astype(np.int32 if n < 2 ** 31 else np.int64)
+        index.xyz = xyz[order]
+        index.mags = (np.full((n, len(BANDS)), np.nan, np.float32) if mags is None
+                      else np.asarray(mags, dtype=np.float32)[order])
+        index.rows = order if rows is None else np.asarray(rows, dtype=np.int64)[order]
+        return index
+
+    def save(self, directory, **meta):
+        """Escritura atómica de los arreglos + `meta.json` en `directory`."""
+        directory = Path(directory)
+        tmp = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in self.FILES:
+            np.save(tmp / f"{name}.npy", getattr(self, name))
+        meta = dict(meta, cell_arcsec=self.cell_arcsec, bands=self.bands, n_stars=len(self))
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        arrays = [np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None) for name in cls.FILES]
+        return cls(*arrays, meta["cell_arcsec"], meta["bands"])
+
+    def query(self, ra, dec, radius_arcsec=MATCH_RADIUS_ARCSEC, unique=True):
+        """
+        Vecino más cercano del catálogo para cada posición dentro de `radius_arcsec`.
+
+        Devuelve `(det, cat, sep_arcsec)`: índices de detección, posiciones en
+        el índice (usar `rows`/`mags`) y separación. Con `unique`, cada estrella
+        del catálogo queda asignada sólo a su detección más cercana.
+        """
+        if radius_arcsec > self.max_radius:
+            raise ValueError(f"radio {radius_arcsec}\" > {MARGIN:g}·celda ({self.max_radius:g}\"): "
+                             f"reconstruya el índice con --cell ≥ {radius_arcsec / MARGIN:g}")
+        q = unit_vectors(np.asarray(ra, dtype=np.float64), np.asarray(dec, dtype=np.float64))
+        keys = self._keys(self._cube(q)[0])
+        # Detecciones en orden de clave: todas las lecturas del índice avanzan
+        # casi secuencialmente (importa con memmaps de millones de estrellas)
+        order = np.argsort(keys)
+        keys = keys[order]
+        pos = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+        lo = np.asarray(self.offsets[pos])
+        counts = np.where(np.asarray(self.cells[pos]) == keys, np.asarray(self.offsets[pos + 1]) - lo, 0)
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+
+        # Candidatos contiguos por detección: mínimo por segmento con reduceat
+        seg = counts > 0
+        starts = (np.cumsum(counts) - counts)[seg]
+        owner = order[seg]
+        cand = np.asarray(self.members[np.repeat(lo[seg] - starts, counts[seg]) + np.arange(total)],
+                          dtype=np.int64)
+        d2 = ((np.asarray(self.xyz)[cand] - np.repeat(q[owner], counts[seg], axis=0)) ** 2).sum(axis=1)
+        best_d2 = np.minimum.reduceat(d2, starts)
+        hit = np.flatnonzero(d2 == np.repeat(best_d2, counts[seg]))
+        segment = np.searchsorted(starts, hit, side="right") - 1
+        first = np.r_[True, segment[1:] != segment[:-1]]
+        hit, segment = hit[first], segment[first]
+        near = best_d2[segment] <= _chord(radius_arcsec) ** 2
+        det, cat, d2 = owner[segment[near]], cand[hit[near]], best_d2[segment[near]]
+
+        sorted_cat = np.sort(cat)
+        if unique and (sorted_cat[1:] == sorted_cat[:-1]).any():
+            by_cat = np.lexsort((d2, cat))
+            keep = np.sort(by_cat[np.r_[True, cat[by_cat][1:] != cat[by_cat][:-1]]])
+            det, cat, d2 = det[keep], cat[keep], d2[keep]
+        sep = 2 * np.arcsin(np.sqrt(d2) / 2) / ARCSEC
+        return det, cat, sep
+
+
+class CatalogCache:
+    """Índices persistidos por catálogo (`<raíz>/<nombre>-<clave>/`)."""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else default_catalog_dir()
+
+    def _path(self, catalog_path, cell_arcsec):
+        catalog_path = Path(catalog_path).resolve()
+        st = catalog_path.stat()
+        text = json.dumps([str(catalog_path), st.st_size, st.st_mtime_ns, float(cell_arcsec)])
+        return self.root / f"{catalog_path.stem}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+    def index(self, catalog_path, cell_arcsec=CELL_ARCSEC, rebuild=False):
+        """Índice del catálogo: se abre del caché o se construye y se guarda."""
+        path = self._path(catalog_path, cell_arcsec)
+        if not rebuild and (path / "meta.json").exists():
+            index = SkyIndex.load(path)
+            print(f"↷ Índice en caché: {path.name} ({len(index)} estrellas)")
+            return index
+        t0 = time.perf_counter()
+        cat = load_catalog(catalog_path)
+        index = SkyIndex.build(cat["ra"], cat["dec"], cat["mags"], cat["rows"], cell_arcsec, cat["bands"])
+        index.save(path, source=str(Path(catalog_path).resolve()))
+        print(f"✅ Índice construido: {path.name} ({len(index)} estrellas, bandas "
+              f"{','.join(cat['bands']) or '—'}) en {time.perf_counter() - t0:.2f} s")
+        return SkyIndex.load(path)
+
+
+# ----------------------------------------------------------
+# DETECCIONES Y RESIDUOS DE COLOR
+# ----------------------------------------------------------
+def load_detections(path, header=None):
+    """
+    Detecciones por estrella: dict con `star_id`, `ra`, `dec`, `mags` y `snr`.
+
+    Si la tabla no trae RA/Dec se usan `y`/`x` con la WCS de `header`.
+    """
+    df = read_any(path)
+    ra, dec, mags, found = _columns(df)
+    if not found:
+        raise ValueError(f"{path}: sin columnas de magnitud por banda (mag_B, mag_V, mag_g, mag_r…)")
+    if ra is None:
+        if header is None or "y" not in df.columns or "x" not in df.columns:
+            raise ValueError(f"{path}: sin RA/Dec; indique --wcs con un FITS resuelto y columnas y/x")
+        ra, dec = pixel_to_sky(header, df["y"].to_numpy(float), df["x"].to_numpy(float))
+    star_id = df["star_id"].to_numpy() if "star_id" in df.columns else np.arange(1, len(df) + 1)
+    snr = df["snr"].to_numpy(float) if "snr" in df.columns else np.full(len(df), np.nan)
+    return {"star_id": star_id, "ra": ra, "dec": dec, "mags": mags, "snr": snr, "bands": found}
+
+
+def fit_colour_term(inst, ref, sigma=CLIP_SIGMA, iters=CLIP_ITERS):
+    """
+    Ajuste robusto `ref = a + k·inst` (σ-clip con MAD).
+
+    Con menos de `MIN_CALIB` estrellas sólo se ajusta el punto cero (k = 1).
+    Devuelve `(a, k, usadas)`.
+    """
+    ok = np.isfinite(inst) & np.isfinite(ref)
+    if ok.sum() < MIN_CALIB:
+        a = float(np.median(ref[ok] - inst[ok])) if ok.any() else 0.0
+        return a, 1.0, ok
+    a, k = float(np.median(ref[ok] - inst[ok])), 1.0
+    for _ in range(iters):
+        k, a = np.polyfit(inst[ok], ref[ok], 1)
+        resid = ref - (a + k * inst)
+        mad = 1.4826 * np.median(np.abs(resid[ok] - np.median(resid[ok])))
+        keep = np.isfinite(resid) & (np.abs(resid) <= sigma * max(mad, 1e-6))
+        if keep.sum() < MIN_CALIB or np.array_equal(keep, ok):
+            break
+        ok = keep
+    return float(a), float(k), ok
+
+
+def colour_residuals(det, index, radius_arcsec=MATCH_RADIUS_ARCSEC):
+    """
+    Cruce + residuos de color por estrella (color calibrado − color del catálogo).
+
+    Devuelve `(filas P13, resumen)`; las filas van ordenadas por SNR.
+    """
+    t0 = time.perf_counter()
+    d, c, sep = index.query(det["ra"], det["dec"], radius_arcsec)
+    dt = time.perf_counter() - t0
+    ref = np.asarray(index.mags[c], dtype=np.float64)
+    inst = det["mags"][d].astype(np.float64)
+
+    residuals, summary = {}, {"n_det": len(det["ra"]), "n_match": len(d), "match_ms": dt * 1e3,
+                              "sep_median": float(np.median(sep)) if len(sep) else float("nan")}
+    for name, (b1, b2) in COLOURS.items():
+        j1, j2 = BANDS.index(b1), BANDS.index(b2)
+        c_inst, c_ref = inst[:, j1] - inst[:, j2], ref[:, j1] - ref[:, j2]
+        a, k, used = fit_colour_term(c_inst, c_ref)
+        residuals[name] = a + k * c_inst - c_ref
+        r = residuals[name][used]
+        summary[name] = {"zero_point": a, "colour_term": k, "n": int(used.sum()),
+                         "sigma": float(1.4826 * np.median(np.abs(r - np.median(r)))) if len(r) else float("nan")}
+
+    rows = []
+    for n in np.argsort(-np.nan_to_num(det["snr"][d], nan=-1.0), kind="stable"):
+        bv, gr = residuals["b_minus_v"][n], residuals["g_minus_r"][n]
+        if not (np.isfinite(bv) or np.isfinite(gr)):
+            continue
+        s = det["snr"][d[n]]
+        rows.append({
+            "star_id": int(det["star_id"][d[n]]),
+            "b_minus_v": round(float(bv), 3) if np.isfinite(bv) else None,
+            "g_minus_r": round(float(gr), 3) if np.isfinite(gr) else None,
+            "snr": round(float(s), 1) if np.isfinite(s) else None,
+        })
+    return rows, summary
+
+
+def write_p13_table(rows, csv_path=None):
+    from orionlab_io import study_dir, write_rows
+
+    csv_path = Path(csv_path) if csv_path else study_dir(*P13_DIRS) / "data" / TABLE_NAME
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    write_rows(rows, P13_FIELDS, csv_path)
+    print(f"✅ Tabla P13: {csv_path} ({len(rows)} estrellas)")
+    return csv_path
+
+
+# ----------------------------------------------------------
+# DEMO
+# ----------------------------------------------------------
+def synthetic_catalog(n_stars=1_000_000, center=(166.4, -58.7), radius_deg=8.0, seed=0):
+    """Catálogo B, V, g, r uniforme en un casquete (por defecto, Carina / NGC 3532)."""
+    rng = np.random.default_rng(seed)
+    u = rng.uniform(math.cos(math.radians(radius_deg)), 1.0, n_stars)
+    phi = rng.uniform(0, 2 * math.pi, n_stars)
+    theta = np.arccos(u)
+    local = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), u], axis=1)
+    ra0, dec0 = np.radians(center)
+    # Rotación del polo al centro del campo
+    z = np.array([math.cos(dec0) * math.cos(ra0), math.cos(dec0) * math.sin(ra0), math.sin(dec0)])
+    e = np.array([-math.sin(ra0), math.cos(ra0), 0.0])
+    n = np.cross(z, e)
+    xyz = local[:, :1] * e + local[:, 1:2] * n + local[:, 2:] * z
+    ra = np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0])) % 360
+    dec = np.degrees(np.arcsin(np.clip(xyz[:, 2], -1, 1)))
+    v = 9 + 7 * rng.power(3.0, n_stars)
+    bv = rng.normal(0.7, 0.35, n_stars).clip(-0.3, 2.0)
+    g = v + 0.60 * bv - 0.12
+    r = v - 0.42 * bv + 0.11
+    mags = np.stack([v + bv, v, g, r], axis=1).astype(np.float32)
+    return ra, dec, mags
+
+
+def synthetic_detections(ra, dec, mags, n_stars=50_000, n_spurious=2_000, seed=1):
+    """Detecciones de un subconjunto del catálogo con ruido de posición y colores instrumentales."""
+    rng = np.random.default_rng(seed)
+    pick = rng.choice(len(ra), n_stars, replace=False)
+    jitter = 0.4 / 3600
+    d_ra = rng.normal(0, jitter, n_stars) / np.cos(np.radians(dec[pick]))
+    d_dec = rng.normal(0, jitter, n_stars)
+    true = mags[pick].astype(np.float64)
+    snr = 200 * 10 ** (-0.2 * (true[:, 1] - 11))
+    noise = rng.normal(0, 1, true.shape) * (1.0857 / snr)[:, None]
+    # Sistema instrumental: punto cero y término de color por banda
+    bv = true[:, 0] - true[:, 1]
+    inst = true + noise + np.array([2.1, 1.9, 1.7, 1.6]) + np.outer(bv, [0.05, -0.03, 0.02, -0.04])
+    fake = rng.choice(len(ra), n_spurious, replace=False)
+    det_ra = np.concatenate([ra[pick] + d_ra, ra[fake] + rng.uniform(0.01, 0.05, n_spurious)])
+    det_dec = np.concatenate([dec[pick] + d_dec, dec[fake]])
+    inst = np.concatenate([inst, inst[:n_spurious]])
+    return {"star_id": np.arange(1, len(det_ra) + 1), "ra": det_ra, "dec": det_dec,
+            "mags": inst.astype(np.float32), "snr": np.concatenate([snr, snr[:n_spurious]]),
+            "bands": list(BANDS)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cruce de detecciones con un catálogo de referencia (P13).")
+    parser.add_argument("detections", nargs="?", type=Path,
+                        help="CSV/Parquet por estrella (ra/dec o y/x + magnitudes instrumentales).")
+    parser.add_argument("--catalog", type=Path, help="Catálogo de referencia (CSV/Parquet).")
+    parser.add_argument("--wcs", type=Path, help="FITS con WCS TAN para convertir y/x a RA/Dec.")
+    parser.add_argument("--radius", type=float, default=MATCH_RADIUS_ARCSEC, help="Radio de cruce (\").")
+    parser.add_argument("--cell", type=float, default=CELL_ARCSEC, help="Lado de celda del índice (\"); se agranda a radio/MARGIN si hace falta.")
+    parser.add_argument("--cache-dir", type=Path, help="Carpeta de índices (por defecto $ORIONLAB_CATALOG_DIR).")
+    parser.add_argument("--rebuild", action="store_true", help="Reconstruye el índice aunque esté en caché.")
+    parser.add_argument("--build-only", action="store_true", help="Sólo construye/persiste el índice.")
+    parser.add_argument("--table", nargs="?", const="", type=str,
+                        help="Escribe star_colour_variation.csv de P13 (ruta opcional).")
+    parser.add_argument("--demo", action="store_true",
+                        help="Catálogo sintético de 1 M estrellas y 52 000 detecciones.")
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        import tempfile
+
+        t0 = time.perf_counter()
+        ra, dec, mags = synthetic_catalog()
+        index = SkyIndex.build(ra, dec, mags, cell_arcsec=max(args.cell, args.radius / MARGIN))
+        print(f"✅ Índice sintético: {len(index)} estrellas en {time.perf_counter() - t0:.2f} s")
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(Path(tmp) / "demo")
+            t0 = time.perf_counter()
+            index = SkyIndex.load(Path(tmp) / "demo")
+            print(f"↷ Índice reabierto (memmap) en {(time.perf_counter() - t0) * 1e3:.1f} ms")
+            det = synthetic_detections(ra, dec, mags)
+            index.query(det["ra"][:100], det["dec"][:100], args.radius)   # calienta el memmap
+            rows, summary = colour_residuals(det, index, args.radius)
+    else:
+        if not args.catalog:
+            parser.error("indique --catalog (o use --demo)")
+        cell = max(args.cell, args.radius / MARGIN)
+        index = CatalogCache(args.cache_dir).index(args.catalog, cell, args.rebuild)
+        if args.build_only:
+            return 0
+        if not args.detections:
+            parser.error("indique la tabla de detecciones")
+        header = read_header(args.wcs) if args.wcs else None
+        try:
+            det = load_detections(args.detections, header)
+        except ValueError as e:
+            parser.error(str(e))
+        rows, summary = colour_residuals(det, index, args.radius)
+
+    print(f"✅ {summary['n_match']}/{summary['n_det']} detecciones cruzadas en {summary['match_ms']:.1f} ms "
+          f"(separación mediana {summary['sep_median']:.2f}\")")
+    for name in COLOURS:
+        s = summary[name]
+        print(f"  {name}: punto cero {s['zero_point']:+.3f}, término de color {s['colour_term']:.3f}, "
+              f"σ residuo {s['sigma']:.3f} mag ({s['n']} estrellas)")
+    if args.table is not None:
+        write_p13_table(rows, args.table or None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
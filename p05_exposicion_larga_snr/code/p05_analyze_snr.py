@@ -1,51 +1,67 @@
 
-import pandas as pd
-import matplotlib.pyplot as plt
+import sys
 from pathlib import Path
 
-BASE_DIR = Path(__file__).resolve().parents[1] / "p05_long_exposure_snr"
+# Módulos compartidos (orionlab_*) en la raíz del repo
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from orionlab_cache import cached_call
+from orionlab_plot import render_many
+from orionlab_query import SNRQuery
+
+BASE_DIR = Path(__file__).resolve().parents[1]
 DATA_DIR = BASE_DIR / "data"
 IMG_DIR = BASE_DIR / "img"
+CSV_PATH = DATA_DIR / "p05_snr_simulation_data.csv"
+
+
+def draw_snr_vs_exposure(fig, ax, subset):
+    ax.plot(subset["exposure_s"], subset["snr_single_sub"], marker="o")
+    ax.set_xlabel("Tiempo de exposición (s)")
+    ax.set_ylabel("SNR por sub")
+    ax.set_title("P05 – SNR vs Exposición (Nikon D7500, Bortle 5, Optolong L-Quad)")
+    ax.grid(True)
+
+
+def draw_dslr_vs_asi533(fig, ax, subset):
+    ax.bar(subset["camera"], subset["snr_single_sub"])
+    ax.set_ylabel("SNR por sub")
+    ax.set_title("P05 – Comparación DSLR vs ASI533MC Pro (180s, Bortle 5, Optolong L-Quad)")
+    ax.tick_params(axis="x", labelrotation=15)
+    ax.grid(axis="y")
+
+
+def render_plots():
+    # El índice se construye una vez; cada gráfico es una consulta, no un escaneo
+    query = SNRQuery.from_table(CSV_PATH, columns=["snr_single_sub"])
+
+    # Ejemplo 1: curva SNR vs tiempo de exposición para Nikon D7500, Bortle 5
+    # (las filas vuelven ordenadas por exposure_s)
+    subset_dslr = query.get(
+        camera="Nikon D7500",
+        bortle_class=5,
+        filter="Optolong L-Quad Enhance",
+        iso_gain=1600,
+    )
+
+    # Ejemplo 2: comparación DSLR vs ASI533MC Pro a 180 s, Bortle 5
+    subset_180 = query.get(
+        exposure_s=180,
+        bortle_class=5,
+        filter="Optolong L-Quad Enhance",
+        iso_gain=1600,
+    )
+
+    # Backend Agg y figura reutilizada (orionlab_plot)
+    paths = render_many([
+        (draw_snr_vs_exposure, IMG_DIR / "p05_snr_vs_exposure_dslr.png", (subset_dslr,),
+         {"bbox_inches": "tight"}),
+        (draw_dslr_vs_asi533, IMG_DIR / "p05_snr_dslr_vs_asi533.png", (subset_180,),
+         {"bbox_inches": "tight"}),
+    ])
+    for path in paths:
+        print(f"✅ Gráfico guardado en: {path}")
+    return paths
+
 
-df = pd.read_csv(DATA_DIR / "p05_snr_simulation_data.csv")
-
-# Ejemplo 1: curva SNR vs tiempo de exposición para Nikon D7500, Bortle 5
-subset_dslr = df[
-    (df["camera"] == "Nikon D7500") &
-    (df["bortle_class"] == 5) &
-    (df["filter"] == "Optolong L-Quad Enhance") &
-    (df["iso_gain"] == 1600)
-]
-
-subset_dslr = subset_dslr.sort_values("exposure_s")
-
-plt.figure()
-plt.plot(subset_dslr["exposure_s"], subset_dslr["snr_single_sub"], marker="o")
-plt.xlabel("Tiempo de exposición (s)")
-plt.ylabel("SNR por sub")
-plt.title("P05 – SNR vs Exposición (Nikon D7500, Bortle 5, Optolong L-Quad)")
-plt.grid(True)
-IMG_DIR.mkdir(parents=True, exist_ok=True)
-out_path = IMG_DIR / "p05_snr_vs_exposure_dslr.png"
-plt.savefig(out_path, bbox_inches="tight")
-plt.close()
-print(f"✅ Gráfico guardado en: {out_path}")
-
-# Ejemplo 2: comparación DSLR vs ASI533MC Pro a 180 s, Bortle 5
-subset_180 = df[
-    (df["exposure_s"] == 180) &
-    (df["bortle_class"] == 5) &
-    (df["filter"] == "Optolong L-Quad Enhance") &
-    (df["iso_gain"] == 1600)
-]
-
-plt.figure()
-plt.bar(subset_180["camera"], subset_180["snr_single_sub"])
-plt.ylabel("SNR por sub")
-plt.title("P05 – Comparación DSLR vs ASI533MC Pro (180s, Bortle 5, Optolong L-Quad)")
-plt.xticks(rotation=15)
-plt.grid(axis="y")
-out_path2 = IMG_DIR / "p05_snr_dslr_vs_asi533.png"
-plt.savefig(out_path2, bbox_inches="tight")
-plt.close()
-print(f"✅ Gráfico guardado en: {out_path2}")
+# Los gráficos sólo se regeneran si cambian los datos o este código
+cached_call(BASE_DIR, "plots", render_plots, inputs=[CSV_PATH])
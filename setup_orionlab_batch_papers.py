@@ -12,10 +12,12 @@ Debe ejecutarse desde la raíz del repo OrionLab_Research.
 
 from pathlib import Path
 import textwrap
-import csv
 import random
 from datetime import date
 
+from orionlab_cache import cached_call
+from orionlab_io import write_rows
+
 ROOT = Path(__file__).resolve().parent
 
 PROJECTS = [
@@ -245,10 +247,9 @@ def write_csv(project_id: str, project_root: Path):
         rows = [{"x": i, "y": random.random()} for i in range(50)]
         fieldnames = ["x", "y"]
 
-    with path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    # CSV + Parquet con columnas de texto como diccionario (orionlab_io)
+    parquet = write_rows(rows, fieldnames, path)
+    return [path, parquet]
 
 
 def write_readme(project_id: str, title: str, project_root: Path):
@@ -284,6 +285,7 @@ def write_readme(project_id: str, title: str, project_root: Path):
     """)
 
     readme.write_text(content, encoding="utf-8")
+    return readme
 
 
 def write_paper_md(project_id: str, title: str, project_root: Path):
@@ -392,16 +394,31 @@ def write_paper_md(project_id: str, title: str, project_root: Path):
     """)
 
     paper_md.write_text(content, encoding="utf-8")
+    return paper_md
+
+
+def build_project(project_id: str, title: str):
+    """
+    Genera README, CSV y paper de un proyecto (unidad del build paralelo).
+
+    Cada paso pasa por el caché de build (`orionlab_cache`): si su código y
+    parámetros no cambiaron, no se reescribe. `TODAY` no invalida el caché.
+    """
+    project_root = ROOT / project_id
+    ensure_dirs(project_root)
+    params = (project_id, title)  # la ruta absoluta no forma parte de la huella
+    cached_call(project_root, "write_csv", write_csv, project_id, project_root,
+                params=params)
+    cached_call(project_root, "write_readme", write_readme, project_id, title, project_root,
+                params=params, volatile=("TODAY",))
+    cached_call(project_root, "write_paper_md", write_paper_md, project_id, title, project_root,
+                params=params, volatile=("TODAY",))
+    print(f"[OK] Scaffolded {project_id} – {title}")
 
 
 def main():
     for project_id, title in PROJECTS:
-        project_root = ROOT / project_id
-        ensure_dirs(project_root)
-        write_csv(project_id, project_root)
-        write_readme(project_id, title, project_root)
-        write_paper_md(project_id, title, project_root)
-        print(f"[OK] Scaffolded {project_id} – {title}")
+        build_project(project_id, title)
 
     print("\nDone. P08–P20 now have README, CSV and paper skeletons.")
 
@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 import textwrap
 
+from orionlab_io import write_table
+
 BASE = Path(__file__).resolve().parent
 
 # -------------------------------------------------------------
@@ -18,11 +20,10 @@ def write(p, content):
 # -------------------------------------------------------------
 # Generate synthetic EEG dataset
 # -------------------------------------------------------------
-def make_eeg_dataset(label_name, label_values, seed=42):
+def make_eeg_dataset(label_name, label_values, seed=42, n=300, n_subjects=20):
     np.random.seed(seed)
-    n = 300
 
-    subjects = np.random.choice([f"S{str(i).zfill(2)}" for i in range(1, 21)], size=n)
+    subjects = np.random.choice([f"S{str(i).zfill(2)}" for i in range(1, n_subjects + 1)], size=n)
     sessions = np.random.randint(1, 4, size=n)
 
     df = pd.DataFrame({
@@ -49,7 +50,7 @@ def build_p02():
     ensure(path / "paper")
 
     df = make_eeg_dataset("stress_level", ["low", "medium", "high"])
-    df.to_csv(path / "data" / "p02_eeg_stress.csv", index=False)
+    write_table(df, path / "data" / "p02_eeg_stress.csv", categorical=["subject", "stress_level"])
 
     readme = f"""
     # P02 – EEG Stress State Classification (OrionLab Research)
@@ -116,7 +117,7 @@ def build_p03():
     ensure(path / "paper")
 
     df = make_eeg_dataset("pain_level", ["mild", "moderate", "intense"])
-    df.to_csv(path / "data" / "p03_eeg_pain.csv", index=False)
+    write_table(df, path / "data" / "p03_eeg_pain.csv", categorical=["subject", "pain_level"])
 
     readme = f"""
     # P03 – EEG Pain Pattern Analysis (OrionLab Research)
@@ -171,7 +172,7 @@ def build_p04():
     ensure(path / "paper")
 
     df = make_eeg_dataset("motor_task", ["rest", "left_imagery", "right_imagery"])
-    df.to_csv(path / "data" / "p04_bci_motor.csv", index=False)
+    write_table(df, path / "data" / "p04_bci_motor.csv", categorical=["subject", "motor_task"])
 
     readme = f"""
     # P04 – BCI Motor Activation (OrionLab Research)
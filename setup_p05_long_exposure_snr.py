@@ -1,9 +1,11 @@
 from pathlib import Path
-import pandas as pd
-import numpy as np
 import textwrap
 import datetime as dt
 
+from orionlab_cache import cached_call
+from orionlab_io import parquet_path, write_table
+from orionlab_snr import CATEGORICAL, EXPOSURES, snr_grid, write_snr_table
+
 # Ajusta esto si tu carpeta tiene otro nombre:
 BASE_DIR = Path(__file__).resolve().parent
 P05_DIR = BASE_DIR / "p05_long_exposure_snr"
@@ -16,150 +18,111 @@ def ensure_dirs():
     for d in [P05_DIR, DATA_DIR, IMG_DIR, PAPER_DIR, CODE_DIR]:
         d.mkdir(parents=True, exist_ok=True)
 
-def generate_snr_dataset():
+def generate_snr_dataset(stream=False, chunk_rows=1_000_000, seed=42, csv_path=None,
+                         exposures=EXPOSURES):
     """
     Simula datos de SNR para:
     - DSLR (Nikon D7500)
     - Cámara refrigerada (ZWO ASI533MC Pro)
     Variando: exposición, ISO, Bortle, filtro, temperatura, etc.
-    """
-    cameras = [
-        {"name": "Nikon D7500", "type": "DSLR", "read_noise": 5.0, "dark_current": 0.02},
-        {"name": "ZWO ASI533MC Pro", "type": "Cooled", "read_noise": 1.5, "dark_current": 0.003},
-    ]
 
-    exposures = [30, 60, 120, 180, 240, 300]  # segundos
-    isos = [800, 1600, 3200]
-    bortle_classes = [3, 4, 5, 6]  # 3 = bueno, 6 = ciudad mejorada
-    filters = ["None", "Optolong L-Enhance", "Optolong L-Quad Enhance"]
-    sky_temps = [0, 5, 10, 15]  # °C
-    sensor_temps = [-10, 0, 5, 10]  # °C para la ASI; DSLR ~ambiente
+    La grilla se calcula en bloque con `orionlab_snr.snr_grid` (mismos valores
+    que el loop anidado original para la semilla 42).
 
-    rows = []
+    Se escribe CSV y, si hay pyarrow, un Parquet hermano (`orionlab_io`).
 
-    rng = np.random.default_rng(42)
-    now = dt.datetime.now()
+    Con `stream=True` la grilla se escribe por chunks de `chunk_rows` filas
+    (`orionlab_snr.write_snr_table`), pensado para grillas que no caben en RAM.
 
-    for cam in cameras:
-        for exp in exposures:
-            for iso in isos:
-                for bortle in bortle_classes:
-                    for filt in filters:
-                        for sky_t in sky_temps:
-                            for sensor_t in sensor_temps:
-                                # Ajuste simple: DSLR más caliente, ASI se mantiene más fría
-                                if cam["type"] == "DSLR":
-                                    sensor_temp_eff = sky_t + rng.normal(3, 1)
-                                else:
-                                    sensor_temp_eff = sensor_t
-
-                                # Señal simulada (electrones) según exposición, filtro y Bortle
-                                base_signal = 500 * (exp / 60)
-                                if filt != "None":
-                                    base_signal *= 1.2  # mejora contraste nebulosa
-                                base_signal *= max(0.4, 1.0 - 0.08 * (bortle - 3))  # cielo peor, menos señal útil
-
-                                signal_e = base_signal * rng.uniform(0.9, 1.1)
-
-                                # Ruido: lectura, dark current, sky background
-                                read_noise = cam["read_noise"]
-                                dark_current = cam["dark_current"] * (1 + 0.07 * (sensor_temp_eff + 10))
-                                dark_noise = np.sqrt(dark_current * exp)
-
-                                # Ruido de cielo: peor Bortle -> más ruido
-                                sky_noise = np.sqrt(100 * (bortle - 2) * (exp / 60))
-
-                                total_noise = np.sqrt(read_noise**2 + dark_noise**2 + sky_noise**2)
-                                snr = signal_e / (total_noise + 1e-6)
-
-                                # Número recomendado de subs para llegar a SNR objetivo (ej. 100)
-                                target_snr = 100
-                                if snr > 0:
-                                    required_subs = max(1, int((target_snr / snr) ** 2))
-                                else:
-                                    required_subs = 999
-
-                                rows.append({
-                                    "camera": cam["name"],
-                                    "camera_type": cam["type"],
-                                    "exposure_s": exp,
-                                    "iso_gain": iso,
-                                    "bortle_class": bortle,
-                                    "filter": filt,
-                                    "sky_temp_c": sky_t,
-                                    "sensor_temp_c": round(sensor_temp_eff, 1),
-                                    "read_noise_e": round(read_noise, 2),
-                                    "dark_current_e_s": round(dark_current, 4),
-                                    "signal_e": round(signal_e, 1),
-                                    "total_noise_e": round(total_noise, 2),
-                                    "snr_single_sub": round(snr, 1),
-                                    "target_snr": target_snr,
-                                    "recommended_subs": required_subs,
-                                    "scenario_date": now.date().isoformat()
-                                })
-
-    df = pd.DataFrame(rows)
-    csv_path = DATA_DIR / "p05_snr_simulation_data.csv"
-    df.to_csv(csv_path, index=False)
-    print(f"✅ Dataset generado: {csv_path} ({len(df)} filas)")
+    `csv_path` y `exposures` permiten generarla fuera del estudio con otro
+    eje de exposición (lo usa `orionlab_bench`).
+    """
+    now = dt.datetime.now()
+    csv_path = Path(csv_path) if csv_path else DATA_DIR / "p05_snr_simulation_data.csv"
+    if stream:
+        n_rows = write_snr_table(csv_path, chunk_rows=chunk_rows, seed=seed, exposures=exposures,
+                                 scenario_date=now.date().isoformat())
+    else:
+        df = snr_grid(exposures=exposures, seed=seed, scenario_date=now.date().isoformat())
+        write_table(df, csv_path, categorical=CATEGORICAL)
+        n_rows = len(df)
+    print(f"✅ Dataset generado: {csv_path} ({n_rows} filas)")
+    return [csv_path, parquet_path(csv_path)]
 
 def generate_analysis_script():
     script = textwrap.dedent(f"""
-    import pandas as pd
-    import matplotlib.pyplot as plt
+    import sys
     from pathlib import Path
 
-    BASE_DIR = Path(__file__).resolve().parents[1] / "p05_long_exposure_snr"
+    # Módulos compartidos (orionlab_*) en la raíz del repo
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+    from orionlab_cache import cached_call
+    from orionlab_plot import render_many
+    from orionlab_query import SNRQuery
+
+    BASE_DIR = Path(__file__).resolve().parents[1]
     DATA_DIR = BASE_DIR / "data"
     IMG_DIR = BASE_DIR / "img"
-
-    df = pd.read_csv(DATA_DIR / "p05_snr_simulation_data.csv")
-
-    # Ejemplo 1: curva SNR vs tiempo de exposición para Nikon D7500, Bortle 5
-    subset_dslr = df[
-        (df["camera"] == "Nikon D7500") &
-        (df["bortle_class"] == 5) &
-        (df["filter"] == "Optolong L-Quad Enhance") &
-        (df["iso_gain"] == 1600)
-    ]
-
-    subset_dslr = subset_dslr.sort_values("exposure_s")
-
-    plt.figure()
-    plt.plot(subset_dslr["exposure_s"], subset_dslr["snr_single_sub"], marker="o")
-    plt.xlabel("Tiempo de exposición (s)")
-    plt.ylabel("SNR por sub")
-    plt.title("P05 – SNR vs Exposición (Nikon D7500, Bortle 5, Optolong L-Quad)")
-    plt.grid(True)
-    IMG_DIR.mkdir(parents=True, exist_ok=True)
-    out_path = IMG_DIR / "p05_snr_vs_exposure_dslr.png"
-    plt.savefig(out_path, bbox_inches="tight")
-    plt.close()
-    print(f"✅ Gráfico guardado en: {{out_path}}")
-
-    # Ejemplo 2: comparación DSLR vs ASI533MC Pro a 180 s, Bortle 5
-    subset_180 = df[
-        (df["exposure_s"] == 180) &
-        (df["bortle_class"] == 5) &
-        (df["filter"] == "Optolong L-Quad Enhance") &
-        (df["iso_gain"] == 1600)
-    ]
-
-    plt.figure()
-    plt.bar(subset_180["camera"], subset_180["snr_single_sub"])
-    plt.ylabel("SNR por sub")
-    plt.title("P05 – Comparación DSLR vs ASI533MC Pro (180s, Bortle 5, Optolong L-Quad)")
-    plt.xticks(rotation=15)
-    plt.grid(axis="y")
-    out_path2 = IMG_DIR / "p05_snr_dslr_vs_asi533.png"
-    plt.savefig(out_path2, bbox_inches="tight")
-    plt.close()
-    print(f"✅ Gráfico guardado en: {{out_path2}}")
+    CSV_PATH = DATA_DIR / "p05_snr_simulation_data.csv"
+
+
+    def draw_snr_vs_exposure(fig, ax, subset):
+        ax.plot(subset["exposure_s"], subset["snr_single_sub"], marker="o")
+        ax.set_xlabel("Tiempo de exposición (s)")
+        ax.set_ylabel("SNR por sub")
+        ax.set_title("P05 – SNR vs Exposición (Nikon D7500, Bortle 5, Optolong L-Quad)")
+        ax.grid(True)
+
+
+    def draw_dslr_vs_asi533(fig, ax, subset):
+        ax.bar(subset["camera"], subset["snr_single_sub"])
+        ax.set_ylabel("SNR por sub")
+        ax.set_title("P05 – Comparación DSLR vs ASI533MC Pro (180s, Bortle 5, Optolong L-Quad)")
+        ax.tick_params(axis="x", labelrotation=15)
+        ax.grid(axis="y")
+
+
+    def render_plots():
+        # El índice se construye una vez; cada gráfico es una consulta, no un escaneo
+        query = SNRQuery.from_table(CSV_PATH, columns=["snr_single_sub"])
+
+        # Ejemplo 1: curva SNR vs tiempo de exposición para Nikon D7500, Bortle 5
+        # (las filas vuelven ordenadas por exposure_s)
+        subset_dslr = query.get(
+            camera="Nikon D7500",
+            bortle_class=5,
+            filter="Optolong L-Quad Enhance",
+            iso_gain=1600,
+        )
+
+        # Ejemplo 2: comparación DSLR vs ASI533MC Pro a 180 s, Bortle 5
+        subset_180 = query.get(
+            exposure_s=180,
+            bortle_class=5,
+            filter="Optolong L-Quad Enhance",
+            iso_gain=1600,
+        )
+
+        # Backend Agg y figura reutilizada (orionlab_plot)
+        paths = render_many([
+            (draw_snr_vs_exposure, IMG_DIR / "p05_snr_vs_exposure_dslr.png", (subset_dslr,),
+             {{"bbox_inches": "tight"}}),
+            (draw_dslr_vs_asi533, IMG_DIR / "p05_snr_dslr_vs_asi533.png", (subset_180,),
+             {{"bbox_inches": "tight"}}),
+        ])
+        for path in paths:
+            print(f"✅ Gráfico guardado en: {{path}}")
+        return paths
+
+
+    # Los gráficos sólo se regeneran si cambian los datos o este código
+    cached_call(BASE_DIR, "plots", render_plots, inputs=[CSV_PATH])
     """)
 
     out_file = CODE_DIR / "p05_analyze_snr.py"
     out_file.write_text(script, encoding="utf-8")
     print(f"✅ Script de análisis generado: {out_file}")
+    return out_file
 
 def generate_paper_md():
     today = dt.date.today().isoformat()
@@ -327,13 +290,15 @@ En OrionLab Research, Hugo explora la intersección entre datos, astrofotografí
     out_path = PAPER_DIR / "p05_long_exposure_snr.md"
     out_path.write_text(md, encoding="utf-8")
     print(f"✅ Paper inicial generado: {out_path}")
+    return out_path
 
 if __name__ == "__main__":
     print("🚀 Creando estructura P05 – Long Exposure SNR Model...")
     ensure_dirs()
-    generate_snr_dataset()
-    generate_analysis_script()
-    generate_paper_md()
+    # Cada paso se salta si su código, parámetros y dependencias no cambiaron
+    cached_call(P05_DIR, "generate_snr_dataset", generate_snr_dataset, seed=42)
+    cached_call(P05_DIR, "generate_analysis_script", generate_analysis_script)
+    cached_call(P05_DIR, "generate_paper_md", generate_paper_md)
     print("✅ P05 listo. Ahora puedes revisar:")
     print(f"  - Dataset: {DATA_DIR / 'p05_snr_simulation_data.csv'}")
     print(f"  - Script análisis: {CODE_DIR / 'p05_analyze_snr.py'}")
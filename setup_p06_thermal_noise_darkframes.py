@@ -1,7 +1,10 @@
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from orionlab_cache import cached_call
+from orionlab_io import write_table
+from orionlab_plot import render_many
 
 # ----------------------------------------------------------
 # CONFIG
@@ -56,37 +59,43 @@ df = pd.DataFrame({
 })
 
 DATA_DIR.mkdir(parents=True, exist_ok=True)
-df.to_csv(DATA_DIR / "p06_thermal_noise_experiments.csv", index=False)
+csv_path = DATA_DIR / "p06_thermal_noise_experiments.csv"
+write_table(df, csv_path, categorical=["cielo"])
 
 # ----------------------------------------------------------
 # PLOTS
 # ----------------------------------------------------------
-IMG_DIR.mkdir(parents=True, exist_ok=True)
-
-plt.figure(figsize=(8, 5))
-for sky in ["Atacama", "Elqui", "Santiago"]:
-    subset = df[df["cielo"] == sky]
-    plt.scatter(subset["frames"], subset["snr"], label=sky, alpha=0.7)
-
-plt.xlabel("Número de frames")
-plt.ylabel("SNR")
-plt.title("SNR vs Cantidad de Frames por Tipo de Cielo")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(IMG_DIR / "p06_snr_vs_frames.png")
-plt.close()
-
-plt.figure(figsize=(8, 5))
-sc = plt.scatter(df["sensor_temp_c"], df["snr"], c=df["bortle"], cmap="viridis")
-plt.xlabel("Temperatura del sensor (°C)")
-plt.ylabel("SNR")
-plt.title("Relación entre SNR y Temperatura del Sensor")
-plt.colorbar(sc, label="Índice Bortle")
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(IMG_DIR / "p06_snr_vs_sensor_temp.png")
-plt.close()
+def draw_snr_vs_frames(fig, ax, df):
+    for sky in ["Atacama", "Elqui", "Santiago"]:
+        subset = df[df["cielo"] == sky]
+        ax.scatter(subset["frames"], subset["snr"], label=sky, alpha=0.7)
+
+    ax.set_xlabel("Número de frames")
+    ax.set_ylabel("SNR")
+    ax.set_title("SNR vs Cantidad de Frames por Tipo de Cielo")
+    ax.legend()
+    ax.grid(True)
+
+
+def draw_snr_vs_sensor_temp(fig, ax, df):
+    sc = ax.scatter(df["sensor_temp_c"], df["snr"], c=df["bortle"], cmap="viridis")
+    ax.set_xlabel("Temperatura del sensor (°C)")
+    ax.set_ylabel("SNR")
+    ax.set_title("Relación entre SNR y Temperatura del Sensor")
+    fig.colorbar(sc, ax=ax, label="Índice Bortle")
+    ax.grid(True)
+
+
+def render_plots(df):
+    # Backend Agg y figura reutilizada (orionlab_plot)
+    return render_many([
+        (draw_snr_vs_frames, IMG_DIR / "p06_snr_vs_frames.png", (df,), {"figsize": (8, 5)}),
+        (draw_snr_vs_sensor_temp, IMG_DIR / "p06_snr_vs_sensor_temp.png", (df,), {"figsize": (8, 5)}),
+    ])
+
+
+# Los PNG sólo se regeneran si cambia el CSV o el código del gráfico
+cached_call(PAPER_DIR, "plots", render_plots, df, params=(), inputs=[csv_path])
 
 # ----------------------------------------------------------
 # MARKDOWN PAPER
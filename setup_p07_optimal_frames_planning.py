@@ -1,7 +1,10 @@
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from orionlab_cache import cached_call
+from orionlab_io import write_table
+from orionlab_plot import plot_figure
 
 # Base paths
 BASE_DIR = Path(__file__).resolve().parent
@@ -86,27 +89,32 @@ for name, obj_type, hemi, bortle, filt, temp in targets:
 
 df = pd.DataFrame(rows)
 csv_path = DATA_DIR / "p07_planificacion_lights_darks.csv"
-df.to_csv(csv_path, index=False)
+write_table(df, csv_path, categorical=["tipo_objeto", "hemisferio", "filtro"])
 
 # Simple plot: integración total vs bortle
-fig, ax = plt.subplots(figsize=(8, 5))
-for obj_type, sub in df.groupby("tipo_objeto"):
-    ax.scatter(
-        sub["bortle"],
-        sub["integracion_total_min"],
-        label=obj_type,
-    )
+def draw_integracion_vs_bortle(fig, ax, df):
+    for obj_type, sub in df.groupby("tipo_objeto"):
+        ax.scatter(
+            sub["bortle"],
+            sub["integracion_total_min"],
+            label=obj_type,
+        )
+
+    ax.set_xlabel("Clase de cielo (Bortle)")
+    ax.set_ylabel("Integración total recomendada (min)")
+    ax.set_title("P07 – Integración total vs calidad de cielo")
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+
+
+def render_plot(df):
+    # Backend Agg y figura reutilizada (orionlab_plot)
+    return plot_figure(draw_integracion_vs_bortle, img_path, df, figsize=(8, 5), dpi=150)
 
-ax.set_xlabel("Clase de cielo (Bortle)")
-ax.set_ylabel("Integración total recomendada (min)")
-ax.set_title("P07 – Integración total vs calidad de cielo")
-ax.grid(True, alpha=0.3)
-ax.legend()
 
 img_path = IMG_DIR / "p07_integracion_vs_bortle.png"
-fig.tight_layout()
-fig.savefig(img_path, dpi=150)
-plt.close(fig)
+# El PNG sólo se regenera si cambia el CSV o el código del gráfico
+cached_call(PROJECT_DIR, "plot", render_plot, df, params=(), inputs=[csv_path])
 
 # Minimal README skeleton
 readme_path = PROJECT_DIR / "README.md"
@@ -0,0 +1,8 @@
+"""Los módulos orionlab_* viven en la raíz del repo (sin paquete instalable)."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
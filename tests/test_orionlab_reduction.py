@@ -0,0 +1,12 @@
+import numpy as np
+import pytest
+
+from orionlab_reduction import _as_master
+
+
+def test_precomputed_flat_must_be_normalized():
+    raw = np.full((32, 32), 20000, dtype=np.float32)
+    with pytest.raises(ValueError, match="mediana"):
+        _as_master(raw, normalize=True)
+    flat = _as_master(raw / 20000, normalize=True)
+    assert np.median(flat) == pytest.approx(1.0)
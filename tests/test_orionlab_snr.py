@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from orionlab_snr import BORTLE_RANGE, expected_snr
+
+CAMERA = "ZWO ASI533MC Pro"
+
+
+def _both_paths(exposure_s=120, bortle=5, sensor_temp_c=0):
+    scalar = expected_snr(CAMERA, exposure_s, bortle, "None", sensor_temp_c)
+    array = expected_snr(CAMERA, np.array([exposure_s], dtype=float), bortle, "None", sensor_temp_c)[0]
+    return scalar, array
+
+
+def test_cold_sensor_same_on_both_paths():
+    # La recta de dark current cruza 0 bajo ~-24 °C
+    scalar, array = _both_paths(sensor_temp_c=-30)
+    assert np.isfinite(scalar)
+    assert scalar == pytest.approx(array, rel=1e-12)
+
+
+@pytest.mark.parametrize("exposure_s", [0, -60])
+def test_non_positive_exposure_rejected_on_both_paths(exposure_s):
+    with pytest.raises(ValueError, match="exposición"):
+        expected_snr(CAMERA, exposure_s, 5, "None", 0)
+    with pytest.raises(ValueError, match="exposición"):
+        expected_snr(CAMERA, np.array([exposure_s], dtype=float), 5, "None", 0)
+
+
+@pytest.mark.parametrize("bortle", BORTLE_RANGE)
+def test_bortle_bounds_same_on_both_paths(bortle):
+    scalar, array = _both_paths(bortle=bortle)
+    assert np.isfinite(scalar)
+    assert scalar == pytest.approx(array, rel=1e-12)
+
+
+@pytest.mark.parametrize("bortle", [BORTLE_RANGE[0] - 1, BORTLE_RANGE[1] + 1])
+def test_bortle_out_of_range_rejected_on_both_paths(bortle):
+    with pytest.raises(ValueError, match="Bortle"):
+        expected_snr(CAMERA, 120, bortle, "None", 0)
+    with pytest.raises(ValueError, match="Bortle"):
+        expected_snr(CAMERA, 120, np.array([bortle], dtype=float), "None", 0)